@@ -0,0 +1,78 @@
+from __future__ import annotations
+
+import json
+import os
+
+from starlette.datastructures import Headers
+from starlette.exceptions import HTTPException
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import Scope
+
+STATIC_DIR = "app/static"
+# Written by scripts.build_static: source name -> fingerprinted path under STATIC_DIR,
+# e.g. "app.js" -> "dist/app.3f9c0b1e2a7d.js". Without it assets are served unversioned.
+MANIFEST_PATH = os.path.join(STATIC_DIR, "dist", "manifest.json")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+_manifest: dict[str, str] | None = None
+
+
+def _get_manifest() -> dict[str, str]:
+    global _manifest
+    if _manifest is None:
+        try:
+            with open(MANIFEST_PATH, encoding="utf-8") as f:
+                _manifest = json.load(f)
+        except FileNotFoundError:
+            _manifest = {}
+    return _manifest
+
+
+def static_url(name: str) -> str:
+    return "/static/" + _get_manifest().get(name, name)
+
+
+def has_asset(name: str) -> bool:
+    return name in _get_manifest()
+
+
+def asset_version() -> str:
+    # Changes with every build that changes an asset; part of cached page keys, since
+    # cached pages embed the fingerprinted URLs
+    return ",".join(sorted(_get_manifest().values()))
+
+
+def _accepted_encodings(scope: Scope) -> set[str]:
+    header = Headers(scope=scope).get("accept-encoding", "")
+    return {part.split(";")[0].strip().lower() for part in header.split(",")}
+
+
+class AssetFiles(StaticFiles):
+    # Fingerprinted files under dist/ never change at a given URL: they are cached for a
+    # year and served from the precompressed .br/.gz sibling the client accepts. Anything
+    # else is revalidated on every use (ETag/Last-Modified from StaticFiles).
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        if not path.startswith("dist/") or path == "dist/manifest.json":
+            response = await super().get_response(path, scope)
+            response.headers.setdefault("cache-control", "no-cache")
+            return response
+
+        accepted = _accepted_encodings(scope)
+        response = None
+        for encoding, suffix in (("br", ".br"), ("gzip", ".gz")):
+            if encoding not in accepted:
+                continue
+            try:
+                # FileResponse takes the media type from the name without .br/.gz
+                response = await super().get_response(path + suffix, scope)
+            except HTTPException:
+                continue
+            response.headers["content-encoding"] = encoding
+            break
+        if response is None:
+            response = await super().get_response(path, scope)
+        response.headers["cache-control"] = IMMUTABLE
+        response.headers["vary"] = "Accept-Encoding"
+        return response
@@ -0,0 +1,92 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Awaitable, Callable, Hashable
+import time
+from typing import Generic, TypeVar
+
+T = TypeVar("T")
+
+
+class _Entry(Generic[T]):
+    __slots__ = ("value", "has_value", "fresh_until", "stale_until", "error", "retry_at", "failures", "task")
+
+    def __init__(self) -> None:
+        self.value: T | None = None
+        self.has_value = False
+        self.fresh_until = 0.0
+        self.stale_until = 0.0
+        self.error: BaseException | None = None
+        self.retry_at = 0.0
+        self.failures = 0
+        self.task: asyncio.Task[T] | None = None
+
+
+# Per-process cache for slow upstream fetches, shared by all callers:
+# - at most one fetch per key is in flight; concurrent misses await the same task
+# - for `stale_ttl` seconds after `ttl` the old value is served while one background
+#   task refreshes it
+# - a failure is cached for `error_ttl` seconds, doubling per consecutive failure up
+#   to `max_error_ttl`; meanwhile misses re-raise it and stale values keep being served
+class CachedFetch(Generic[T]):
+    def __init__(self, ttl: float, stale_ttl: float = 0.0, error_ttl: float = 5.0, max_error_ttl: float = 300.0) -> None:
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.error_ttl = error_ttl
+        self.max_error_ttl = max_error_ttl
+        self._entries: dict[Hashable, _Entry[T]] = {}
+
+    async def get(self, key: Hashable, fetch: Callable[[], Awaitable[T]]) -> T:
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+        now = time.monotonic()
+
+        if entry.has_value and now < entry.fresh_until:
+            return entry.value  # type: ignore[return-value]
+        if entry.has_value and now < entry.stale_until:
+            if now >= entry.retry_at:
+                self._refresh(entry, fetch)
+            return entry.value  # type: ignore[return-value]
+        if entry.error is not None and now < entry.retry_at:
+            raise entry.error
+        # shield: a cancelled caller must not cancel the fetch other callers are waiting on
+        return await asyncio.shield(self._refresh(entry, fetch))
+
+    def invalidate(self, key: Hashable | None = None) -> None:
+        if key is None:
+            self._entries.clear()
+        else:
+            self._entries.pop(key, None)
+
+    def _refresh(self, entry: _Entry[T], fetch: Callable[[], Awaitable[T]]) -> asyncio.Task[T]:
+        if entry.task is None:
+            entry.task = asyncio.create_task(self._load(entry, fetch))
+            entry.task.add_done_callback(lambda task: self._done(entry, task))
+        return entry.task
+
+    async def _load(self, entry: _Entry[T], fetch: Callable[[], Awaitable[T]]) -> T:
+        try:
+            value = await fetch()
+        except Exception as exc:
+            entry.failures += 1
+            entry.error = exc
+            backoff = min(self.error_ttl * 2 ** (entry.failures - 1), self.max_error_ttl)
+            entry.retry_at = time.monotonic() + backoff
+            raise
+        now = time.monotonic()
+        entry.value = value
+        entry.has_value = True
+        entry.fresh_until = now + self.ttl
+        entry.stale_until = now + self.ttl + self.stale_ttl
+        entry.error = None
+        entry.failures = 0
+        entry.retry_at = 0.0
+        return value
+
+    @staticmethod
+    def _done(entry: _Entry[T], task: asyncio.Task[T]) -> None:
+        entry.task = None
+        if not task.cancelled():
+            # Background refreshes have no awaiter; mark the exception as retrieved
+            task.exception()
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+from collections.abc import AsyncIterator
+from contextlib import aclosing
+import json
+from typing import Any
+
+from sqlmodel import select
+from starlette.concurrency import run_in_threadpool
+
+from app.db import get_db, stream_partitions
+from app.models import Note, User
+
+EXPORT_BATCH_SIZE = 1000
+
+
+def rows_statement(user: User) -> Any:
+    # Streams straight off ix_note_user_updated, no sort; user_id leads so the superuser
+    # export (all owners, grouped by owner) walks the same index
+    stmt = select(
+        Note.id,
+        Note.title,
+        Note.content,
+        Note.pinned,
+        Note.archived,
+        Note.created_at,
+        Note.updated_at,
+    ).order_by(Note.user_id, Note.updated_at.desc(), Note.id.desc())
+    if not user.is_superuser:
+        stmt = stmt.where(Note.user_id == user.id)
+    return stmt
+
+
+def encode_item(row: Any) -> bytes:
+    item = {
+        "id": row.id,
+        "title": row.title,
+        "content": row.content,
+        "pinned": bool(row.pinned),
+        "archived": bool(row.archived),
+        "created_at": row.created_at.isoformat() + "Z",
+        "updated_at": row.updated_at.isoformat() + "Z",
+    }
+    return json.dumps(item, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def encode_rows(rows: list[Any], ndjson: bool) -> bytes:
+    # Runs in the threadpool, a partition at a time, to keep encoding off the event loop.
+    if ndjson:
+        return b"".join(encode_item(row) + b"\n" for row in rows)
+    return b",".join(encode_item(row) for row in rows)
+
+
+async def export_chunks(user: User, ndjson: bool, replica: bool = False) -> AsyncIterator[bytes]:
+    # Owns its session: a request's session is closed before a streamed body is sent.
+    if not ndjson:
+        yield b'{"notes":['
+    first = True
+    async with aclosing(get_db(replica=replica)) as sessions:
+        async for session in sessions:
+            async for rows in stream_partitions(session, rows_statement(user), EXPORT_BATCH_SIZE):
+                chunk = await run_in_threadpool(encode_rows, rows, ndjson)
+                yield chunk if ndjson or first else b"," + chunk
+                first = False
+    if not ndjson:
+        yield b"]}"
@@ -0,0 +1,349 @@
+from __future__ import annotations
+
+import codecs
+from collections.abc import AsyncIterator, Awaitable, Callable
+from datetime import datetime, timezone
+import json
+import os
+import re
+from typing import Any
+
+from sqlalchemy import insert
+from starlette.concurrency import run_in_threadpool
+
+from app.db import DbSession
+from app.models import Note, normalize_newlines
+
+# Rows per INSERT ... VALUES statement and per transaction.
+IMPORT_BATCH_SIZE = int(os.getenv("IMPORT_BATCH_SIZE") or 1000)
+
+READ_CHUNK_SIZE = 64 * 1024
+# Upper bound on a single buffered JSON value (one note), not on the upload.
+MAX_VALUE_CHARS = 8 * 1024 * 1024
+MAX_REPORTED_ERRORS = 20
+
+Reader = Callable[[int], Awaitable[bytes]]
+
+_WS_RE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+
+class ImportFormatError(ValueError):
+    pass
+
+
+class InvalidItem:
+    # Yielded in place of an item that couldn't be parsed, so it still counts as read.
+
+    def __init__(self, message: str) -> None:
+        self.message = message
+
+
+class ImportStats:
+    def __init__(self) -> None:
+        self.read = 0
+        self.imported = 0
+        self.skipped = 0
+        self.failed = 0
+        self.batches = 0
+        self.errors: list[str] = []
+
+    def add_error(self, message: str) -> None:
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(message)
+
+    @classmethod
+    def from_dict(cls, data: dict[str, Any]) -> ImportStats:
+        stats = cls()
+        for key in ("read", "imported", "skipped", "failed", "batches"):
+            setattr(stats, key, int(data.get(key) or 0))
+        stats.errors = list(data.get("errors") or [])[:MAX_REPORTED_ERRORS]
+        return stats
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "read": self.read,
+            "imported": self.imported,
+            "skipped": self.skipped,
+            "failed": self.failed,
+            "batches": self.batches,
+            "errors": list(self.errors),
+        }
+
+
+class _TextStream:
+    # Incrementally decoded text with a cursor; consumed text is dropped on refill.
+
+    def __init__(self, read: Reader) -> None:
+        self._read = read
+        self._decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    async def fill(self) -> bool:
+        if self.eof:
+            return False
+        data = await self._read(READ_CHUNK_SIZE)
+        try:
+            text = self._decoder.decode(data, final=not data)
+        except UnicodeDecodeError:
+            raise ImportFormatError("File is not valid UTF-8") from None
+        if not data:
+            self.eof = True
+        self.buf = self.buf[self.pos :] + text
+        self.pos = 0
+        if len(self.buf) > MAX_VALUE_CHARS:
+            raise ImportFormatError("JSON value is too large")
+        return bool(data)
+
+    async def peek(self) -> str | None:
+        while True:
+            self.pos = _WS_RE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf):
+                return self.buf[self.pos]
+            if not await self.fill():
+                return None
+
+    async def expect(self, char: str) -> None:
+        if await self.peek() != char:
+            raise ImportFormatError(f"Expected {char!r}")
+        self.pos += 1
+
+    async def value(self) -> Any:
+        await self.peek()
+        while True:
+            try:
+                obj, end = _DECODER.raw_decode(self.buf, self.pos)
+                # A number at the very end of the buffer may continue in the next chunk
+                if end < len(self.buf) or self.eof:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise ImportFormatError("Invalid JSON") from None
+            await self.fill()
+
+
+def _scan_array(buf: str, pos: int, eof: bool, after_value: bool) -> tuple[list[Any], int, bool, bool]:
+    # Decodes array elements from buf[pos:] up to where more text is needed. Runs in the
+    # threadpool, a chunk at a time, to keep JSON decoding off the event loop.
+    # Returns (items, pos, after_value, closed).
+    items: list[Any] = []
+    while True:
+        pos = _WS_RE.match(buf, pos).end()
+        if pos >= len(buf):
+            return items, pos, after_value, False
+        if after_value:
+            char = buf[pos]
+            pos += 1
+            if char == "]":
+                return items, pos, after_value, True
+            if char != ",":
+                raise ImportFormatError("Expected ',' or ']'")
+            after_value = False
+            continue
+        try:
+            obj, end = _DECODER.raw_decode(buf, pos)
+        except json.JSONDecodeError:
+            if eof:
+                raise ImportFormatError("Invalid JSON") from None
+            return items, pos, after_value, False
+        # A number at the very end of the buffer may continue in the next chunk
+        if end >= len(buf) and not eof:
+            return items, pos, after_value, False
+        items.append(obj)
+        pos = end
+        after_value = True
+
+
+async def _iter_array(stream: _TextStream) -> AsyncIterator[Any]:
+    await stream.expect("[")
+    if await stream.peek() == "]":
+        stream.pos += 1
+        return
+    after_value = False
+    while True:
+        items, stream.pos, after_value, closed = await run_in_threadpool(
+            _scan_array, stream.buf, stream.pos, stream.eof, after_value
+        )
+        for item in items:
+            yield item
+        if closed:
+            return
+        if stream.eof:
+            raise ImportFormatError("Expected ',' or ']'" if after_value else "Invalid JSON")
+        await stream.fill()
+
+
+async def iter_json_items(read: Reader) -> AsyncIterator[Any]:
+    # Accepts the export format {"notes": [...]} (other keys are skipped) or a bare array.
+    stream = _TextStream(read)
+    first = await stream.peek()
+    if first == "[":
+        async for item in _iter_array(stream):
+            yield item
+        return
+    await stream.expect("{")
+
+    found = False
+    if await stream.peek() == "}":
+        stream.pos += 1
+    else:
+        while True:
+            key = await stream.value()
+            if not isinstance(key, str):
+                raise ImportFormatError("Expected an object key")
+            await stream.expect(":")
+            if key == "notes" and not found:
+                found = True
+                if await stream.peek() != "[":
+                    raise ImportFormatError('"notes" must be a list')
+                async for item in _iter_array(stream):
+                    yield item
+            else:
+                await stream.value()
+            nxt = await stream.peek()
+            stream.pos += 1
+            if nxt == "}":
+                break
+            if nxt != ",":
+                raise ImportFormatError("Expected ',' or '}'")
+
+    if not found:
+        raise ImportFormatError('Missing "notes" list')
+
+
+def _decode_lines(lines: list[str], line_no: int) -> list[Any]:
+    # Runs in the threadpool, a chunk of lines at a time.
+    items: list[Any] = []
+    for line in lines:
+        line_no += 1
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            items.append(json.loads(line))
+        except ValueError:
+            items.append(InvalidItem(f"line {line_no}: invalid JSON"))
+    return items
+
+
+async def iter_ndjson_items(read: Reader) -> AsyncIterator[Any]:
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    line_no = 0
+    while True:
+        data = await read(READ_CHUNK_SIZE)
+        try:
+            pending += decoder.decode(data, final=not data)
+        except UnicodeDecodeError:
+            raise ImportFormatError("File is not valid UTF-8") from None
+        lines = pending.split("\n")
+        pending = lines.pop() if data else ""
+        if len(pending) > MAX_VALUE_CHARS:
+            raise ImportFormatError("NDJSON line is too long")
+        for item in await run_in_threadpool(_decode_lines, lines, line_no):
+            yield item
+        line_no += len(lines)
+        if not data:
+            return
+
+
+def _parse_iso_datetime(value: object) -> datetime | None:
+    if not value:
+        return None
+    if not isinstance(value, str):
+        return None
+    raw = value.strip()
+    if not raw:
+        return None
+    # Export uses trailing 'Z'. datetime.fromisoformat doesn't accept it.
+    if raw.endswith("Z"):
+        raw = raw[:-1]
+    try:
+        dt = datetime.fromisoformat(raw)
+    except ValueError:
+        return None
+    # Normalize to naive UTC-ish datetime for DB
+    if dt.tzinfo is not None:
+        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
+    return dt
+
+
+def note_values(item: Any, user_id: int, now: datetime) -> dict[str, Any] | None:
+    if not isinstance(item, dict):
+        return None
+    title = str(item.get("title") or "").strip()
+    if not title:
+        return None
+    if len(title) > 200:
+        title = title[:200]
+    content = normalize_newlines(str(item.get("content") or ""))
+
+    created_at = _parse_iso_datetime(item.get("created_at")) or now
+    updated_at = _parse_iso_datetime(item.get("updated_at")) or created_at
+    return {
+        "user_id": user_id,
+        "title": title,
+        "content": content,
+        "pinned": bool(item.get("pinned")),
+        "archived": bool(item.get("archived")),
+        "created_at": created_at,
+        "updated_at": updated_at,
+    }
+
+
+async def import_notes(
+    session: DbSession,
+    user_id: int,
+    items: AsyncIterator[Any],
+    stats: ImportStats,
+    batch_size: int = IMPORT_BATCH_SIZE,
+    on_progress: Callable[[ImportStats], Awaitable[None]] | None = None,
+) -> ImportStats:
+    # Each batch is one multi-row INSERT in its own transaction: a failing batch is
+    # rolled back and reported without losing the batches before or after it.
+    # Items up to stats.read were handled by an interrupted run and are skipped;
+    # on_progress runs in each batch's transaction, so the saved count matches the rows.
+    now = datetime.utcnow()
+    batch: list[dict[str, Any]] = []
+    resume_at = stats.read
+    position = 0
+
+    async def flush() -> None:
+        stats.batches += 1
+        try:
+            await session.exec(insert(Note.__table__), params=batch)
+        except Exception as exc:  # noqa: BLE001
+            await session.rollback()
+            stats.failed += len(batch)
+            stats.add_error(f"batch {stats.batches}: {exc.__class__.__name__}")
+        else:
+            stats.imported += len(batch)
+        stats.read = position
+        batch.clear()
+        if on_progress is not None:
+            await on_progress(stats)
+        await session.commit()
+
+    async for item in items:
+        position += 1
+        if position <= resume_at:
+            continue
+        if isinstance(item, InvalidItem):
+            stats.skipped += 1
+            stats.add_error(item.message)
+            continue
+        values = note_values(item, user_id, now)
+        if values is None:
+            stats.skipped += 1
+            continue
+        batch.append(values)
+        if len(batch) >= batch_size:
+            await flush()
+
+    stats.read = max(position, resume_at)
+    if batch:
+        await flush()
+    return stats
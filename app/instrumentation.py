@@ -0,0 +1,200 @@
+from __future__ import annotations
+
+from bisect import bisect_left
+from contextvars import ContextVar
+import logging
+import os
+import threading
+import time
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+logger = logging.getLogger(__name__)
+
+# A request issuing more SQL statements than this is logged and counted as a likely N+1.
+N_PLUS_ONE_THRESHOLD = int(os.getenv("N_PLUS_ONE_THRESHOLD") or 20)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class RequestStats:
+    __slots__ = ("queries", "db_seconds", "render_seconds")
+
+    def __init__(self) -> None:
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.render_seconds = 0.0
+
+
+# Set by the middleware for the duration of a request. The threadpool copies the context
+# into worker threads, so sync DB calls made on behalf of the request add to the same object.
+_current: ContextVar[RequestStats | None] = ContextVar("request_stats", default=None)
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple[float, ...], labels: tuple[str, ...]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.labels = labels
+        # label values -> [bucket counts..., +Inf count, sum]
+        self._series: dict[tuple[str, ...], list[float]] = {}
+
+    def observe(self, label_values: tuple[str, ...], value: float) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [0.0] * (len(self.buckets) + 2)
+        series[bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self._series.items()):
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            sep = "," if base else ""
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{base}{sep}le="{bound:g}"}} {cumulative:g}')
+            cumulative += series[len(self.buckets)]
+            lines.append(f'{self.name}_bucket{{{base}{sep}le="+Inf"}} {cumulative:g}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-1]:.6f}")
+            lines.append(f"{self.name}_count{{{base}}} {cumulative:g}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str, labels: tuple[str, ...]) -> None:
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, label_values: tuple[str, ...], amount: float = 1) -> None:
+        self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self._values.items()):
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(self.labels, label_values))
+            lines.append(f"{self.name}{{{base}}} {value:g}")
+        return lines
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_lock = threading.Lock()
+REQUEST_SECONDS = Histogram(
+    "http_request_duration_seconds", "Request latency until the response is complete", LATENCY_BUCKETS, ("method", "route", "status")
+)
+DB_SECONDS = Histogram("http_request_db_seconds", "Time spent in SQL statements per request", LATENCY_BUCKETS, ("route",))
+DB_QUERIES = Histogram("http_request_db_queries", "SQL statements per request", QUERY_COUNT_BUCKETS, ("route",))
+RENDER_SECONDS = Histogram("http_request_render_seconds", "Jinja render time per request", LATENCY_BUCKETS, ("route",))
+N_PLUS_ONE = Counter("http_request_n_plus_one_total", f"Requests with more than {N_PLUS_ONE_THRESHOLD} SQL statements", ("route",))
+
+
+def render_metrics(extra: dict[str, float] | None = None) -> str:
+    with _lock:
+        lines: list[str] = []
+        for metric in (REQUEST_SECONDS, DB_SECONDS, DB_QUERIES, RENDER_SECONDS, N_PLUS_ONE):
+            lines.extend(metric.render())
+    for name, value in (extra or {}).items():
+        lines.append(f"# TYPE {name} {'counter' if name.endswith('_total') else 'gauge'}")
+        lines.append(f"{name} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def instrument_engine(engine: Engine) -> None:
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany) -> None:
+        started = conn.info["query_started"].pop()
+        stats = _current.get()
+        if stats is not None:
+            stats.queries += 1
+            stats.db_seconds += time.perf_counter() - started
+
+    @event.listens_for(engine, "handle_error")
+    def _error(exception_context) -> None:
+        conn = exception_context.connection
+        if conn is not None and conn.info.get("query_started"):
+            conn.info["query_started"].pop()
+
+
+def add_render_time(seconds: float) -> None:
+    stats = _current.get()
+    if stats is not None:
+        stats.render_seconds += seconds
+
+
+def _route_label(scope: Scope) -> str:
+    route = scope.get("route")
+    path = getattr(route, "path", None)
+    if path:
+        return path
+    # Mounts (static files) and 404s: keep label cardinality bounded
+    return "/static" if scope.get("path", "").startswith("/static/") else "unmatched"
+
+
+class TimingMiddleware:
+    # Pure ASGI so streaming responses pass through untouched.
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats()
+        token = _current.set(stats)
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                # Covers work done before the first byte; streamed bodies are in the histogram only
+                elapsed = time.perf_counter() - started
+                timing = (
+                    f"app;dur={elapsed * 1000:.1f}, "
+                    f'db;dur={stats.db_seconds * 1000:.1f};desc="{stats.queries} queries", '
+                    f"tpl;dur={stats.render_seconds * 1000:.1f}"
+                )
+                message["headers"] = [*message.get("headers", []), (b"server-timing", timing.encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _current.reset(token)
+            self._record(scope, status, time.perf_counter() - started, stats)
+
+    @staticmethod
+    def _record(scope: Scope, status: int, elapsed: float, stats: RequestStats) -> None:
+        route = _route_label(scope)
+        with _lock:
+            REQUEST_SECONDS.observe((scope["method"], route, str(status)), elapsed)
+            DB_SECONDS.observe((route,), stats.db_seconds)
+            DB_QUERIES.observe((route,), stats.queries)
+            RENDER_SECONDS.observe((route,), stats.render_seconds)
+            if stats.queries > N_PLUS_ONE_THRESHOLD:
+                N_PLUS_ONE.inc((route,))
+        if stats.queries > N_PLUS_ONE_THRESHOLD:
+            logger.warning(
+                "Possible N+1: %s %s ran %d SQL statements (threshold %d)",
+                scope["method"],
+                route,
+                stats.queries,
+                N_PLUS_ONE_THRESHOLD,
+            )
@@ -0,0 +1,409 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import aclosing
+from datetime import datetime, timedelta
+import logging
+import os
+import time
+from typing import Any
+
+from sqlalchemy import delete, func, text, update
+from sqlmodel import select
+
+from app import exporter, importer, live
+from app.db import DbSession, get_db
+from app.models import Job, JobFile, User
+from app.page_cache import page_cache
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+KIND_IMPORT = "import"
+KIND_EXPORT = "export"
+
+# Job workers in the web process itself. Off by default: jobs run in a separate process
+# (`python -m scripts.worker`, or the one `scripts.serve` starts), away from the event loop
+# that serves requests. JOBS_WORKERS=1 runs them in-process, e.g. under `uvicorn --reload`.
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS") or 0)
+# Running jobs per user across all workers, and queued+running jobs a user may have.
+JOBS_PER_USER = int(os.getenv("JOBS_PER_USER") or 1)
+JOBS_MAX_PENDING_PER_USER = int(os.getenv("JOBS_MAX_PENDING_PER_USER") or 5)
+JOBS_POLL_INTERVAL = float(os.getenv("JOBS_POLL_INTERVAL") or 1.0)
+# A running job whose heartbeat is older than this is considered lost.
+JOBS_STALE_SECONDS = int(os.getenv("JOBS_STALE_SECONDS") or 300)
+JOBS_RETENTION_HOURS = int(os.getenv("JOBS_RETENTION_HOURS") or 24)
+# On shutdown, running jobs get this long to reach a checkpoint and go back to the queue.
+JOBS_STOP_TIMEOUT = float(os.getenv("JOBS_STOP_TIMEOUT") or 10)
+MAINTENANCE_INTERVAL = 60.0
+
+FILE_CHUNK_SIZE = 1024 * 1024
+ROLE_INPUT = "input"
+ROLE_OUTPUT = "output"
+
+# Claims and submits take a per-user advisory lock (namespace, user id) before counting the
+# user's jobs: a count read in the same statement as the claim could miss another worker's
+# claim committed meanwhile.
+_LOCK_CLAIM = 1
+_LOCK_SUBMIT = 2
+_LOCK_SQL = text("SELECT pg_advisory_xact_lock(CAST(:namespace AS integer), CAST(:user_id AS integer))")
+
+_CANDIDATE_SQL = text(
+    """
+    SELECT j.id, j.user_id FROM job j
+    WHERE j.status = :queued
+      AND (
+        SELECT count(*) FROM job r WHERE r.user_id = j.user_id AND r.status = :running
+      ) < :per_user
+    ORDER BY j.created_at, j.id
+    LIMIT 1
+    FOR UPDATE SKIP LOCKED
+    """
+)
+
+_CLAIM_SQL = text(
+    """
+    UPDATE job SET status = :running, started_at = :now, heartbeat_at = :now
+    WHERE id = :job_id
+      AND (
+        SELECT count(*) FROM job r WHERE r.user_id = :user_id AND r.status = :running
+      ) < :per_user
+    RETURNING id
+    """
+)
+
+_wakeup = asyncio.Event()
+_stop = asyncio.Event()
+_tasks: list[asyncio.Task] = []
+
+
+class JobLimitError(Exception):
+    pass
+
+
+class _Interrupted(Exception):
+    pass
+
+
+class _JobFailed(Exception):
+    def __init__(self, message: str, result: dict[str, Any] | None = None) -> None:
+        super().__init__(message)
+        self.result = result
+
+
+def job_payload(job: Job) -> dict[str, Any]:
+    payload = {
+        "id": job.id,
+        "kind": job.kind,
+        "status": job.status,
+        "progress": job.progress or {},
+        "result": job.result,
+        "error": job.error,
+        "created_at": job.created_at.isoformat() + "Z",
+        "finished_at": job.finished_at.isoformat() + "Z" if job.finished_at else None,
+        "status_url": f"/jobs/{job.id}",
+    }
+    if job.kind == KIND_EXPORT and job.status == JOB_DONE:
+        payload["download_url"] = f"/jobs/{job.id}/download"
+    return payload
+
+
+async def submit(
+    session: DbSession,
+    user_id: int,
+    kind: str,
+    params: dict[str, Any],
+    upload: importer.Reader | None = None,
+) -> Job:
+    await session.exec(_LOCK_SQL, params={"namespace": _LOCK_SUBMIT, "user_id": user_id})
+    pending = (
+        await session.exec(
+            select(func.count())
+            .select_from(Job)
+            .where(Job.user_id == user_id, Job.status.in_((JOB_QUEUED, JOB_RUNNING)))
+        )
+    ).one()
+    if pending >= JOBS_MAX_PENDING_PER_USER:
+        raise JobLimitError
+
+    job = Job(user_id=user_id, kind=kind, status=JOB_QUEUED, params=params)
+    session.add(job)
+    await session.flush()
+
+    if upload is not None:
+        seq = 0
+        while True:
+            data = await upload(FILE_CHUNK_SIZE)
+            if not data:
+                break
+            session.add(JobFile(job_id=job.id, role=ROLE_INPUT, seq=seq, data=data))
+            seq += 1
+            # Flushed chunks are only weakly referenced, so the upload never sits in memory
+            await session.flush()
+
+    await session.commit()
+    _wakeup.set()
+    return job
+
+
+async def iter_file(job_id: int, role: str) -> AsyncIterator[bytes]:
+    # Streams stored chunks one query at a time; owns its session like export streams.
+    async with aclosing(get_db()) as sessions:
+        async for session in sessions:
+            seq = 0
+            while True:
+                data = (
+                    await session.exec(
+                        select(JobFile.data).where(JobFile.job_id == job_id, JobFile.role == role, JobFile.seq == seq)
+                    )
+                ).first()
+                if data is None:
+                    return
+                yield data
+                seq += 1
+
+
+def _input_reader(session: DbSession, job_id: int) -> importer.Reader:
+    seq = 0
+    buf = b""
+    offset = 0
+
+    async def read(size: int) -> bytes:
+        nonlocal seq, buf, offset
+        if offset >= len(buf):
+            data = (
+                await session.exec(
+                    select(JobFile.data).where(
+                        JobFile.job_id == job_id, JobFile.role == ROLE_INPUT, JobFile.seq == seq
+                    )
+                )
+            ).first()
+            if data is None:
+                return b""
+            buf, offset = data, 0
+            seq += 1
+        out = buf[offset : offset + size]
+        offset += len(out)
+        return out
+
+    return read
+
+
+async def _set_progress(session: DbSession, job_id: int, progress: dict[str, Any]) -> None:
+    # Part of the caller's transaction
+    await session.exec(
+        update(Job).where(Job.id == job_id).values(progress=progress, heartbeat_at=datetime.utcnow())
+    )
+
+
+async def _until_stopped(items: AsyncIterator[Any]) -> AsyncIterator[Any]:
+    # Shutdown interrupts an import between items; the unsaved batch is read again later
+    async for item in items:
+        if _stop.is_set():
+            raise _Interrupted
+        yield item
+
+
+async def _run_import(session: DbSession, job: Job) -> dict[str, Any]:
+    # A requeued import resumes after the items its saved progress covers
+    stats = importer.ImportStats.from_dict(job.progress or {})
+    read = _input_reader(session, job.id)
+    if job.params.get("format") == "ndjson":
+        items = importer.iter_ndjson_items(read)
+    else:
+        items = importer.iter_json_items(read)
+
+    async def on_progress(current: importer.ImportStats) -> None:
+        # Runs before the batch commits; _notify_imported invalidates once more at the end
+        await _set_progress(session, job.id, current.as_dict())
+        await page_cache.invalidate_user(job.user_id)
+
+    try:
+        await importer.import_notes(session, job.user_id, _until_stopped(items), stats, on_progress=on_progress)
+    except importer.ImportFormatError as exc:
+        # Batches before the error stay imported; report them with the failure
+        if stats.imported:
+            await _notify_imported(session, job.user_id)
+        raise _JobFailed(str(exc), stats.as_dict()) from None
+    await _notify_imported(session, job.user_id)
+    return stats.as_dict()
+
+
+async def _notify_imported(session: DbSession, user_id: int) -> None:
+    # One event for the whole import: open list pages reload rather than patch
+    await live.notify(session, user_id, live.OP_RELOAD)
+    await session.commit()
+    await page_cache.invalidate_user(user_id)
+
+
+async def _run_export(session: DbSession, job: Job) -> dict[str, Any]:
+    user = await session.get(User, job.user_id)
+    if user is None:
+        raise _JobFailed("User not found")
+    ndjson = job.params.get("format") == "ndjson"
+
+    # The export stream holds a server-side cursor on its own session; output is
+    # written here one FILE_CHUNK_SIZE row at a time and committed as it fills.
+    seq = 0
+    total = 0
+    pending = bytearray()
+    async with aclosing(exporter.export_chunks(user, ndjson)) as chunks:
+        async for chunk in chunks:
+            if _stop.is_set():
+                raise _Interrupted
+            pending += chunk
+            total += len(chunk)
+            while len(pending) >= FILE_CHUNK_SIZE:
+                session.add(JobFile(job_id=job.id, role=ROLE_OUTPUT, seq=seq, data=bytes(pending[:FILE_CHUNK_SIZE])))
+                del pending[:FILE_CHUNK_SIZE]
+                seq += 1
+                await _set_progress(session, job.id, {"bytes": total})
+                await session.commit()
+    if pending or seq == 0:
+        session.add(JobFile(job_id=job.id, role=ROLE_OUTPUT, seq=seq, data=bytes(pending)))
+    await session.commit()
+
+    extension = "ndjson" if ndjson else "json"
+    return {
+        "bytes": total,
+        "filename": f"notes.{extension}",
+        "media_type": "application/x-ndjson" if ndjson else "application/json",
+    }
+
+
+async def _finish(session: DbSession, job_id: int, status: str, result: Any = None, error: str | None = None) -> None:
+    now = datetime.utcnow()
+    await session.exec(delete(JobFile).where(JobFile.job_id == job_id, JobFile.role == ROLE_INPUT))
+    await session.exec(
+        update(Job)
+        .where(Job.id == job_id)
+        .values(status=status, result=result, error=error, finished_at=now, heartbeat_at=now)
+    )
+    await session.commit()
+
+
+async def _requeue(session: DbSession, job_id: int, kind: str) -> None:
+    # An import keeps its progress to resume from; an export starts over
+    values: dict[str, Any] = {"status": JOB_QUEUED, "started_at": None, "heartbeat_at": None}
+    if kind != KIND_IMPORT:
+        values["progress"] = {}
+    await session.exec(delete(JobFile).where(JobFile.job_id == job_id, JobFile.role == ROLE_OUTPUT))
+    await session.exec(update(Job).where(Job.id == job_id).values(**values))
+    await session.commit()
+
+
+async def run_job(job_id: int) -> None:
+    async with aclosing(get_db()) as sessions:
+        async for session in sessions:
+            job = await session.get(Job, job_id)
+            if job is None:
+                return
+            kind = job.kind
+            try:
+                if kind == KIND_IMPORT:
+                    result = await _run_import(session, job)
+                elif kind == KIND_EXPORT:
+                    result = await _run_export(session, job)
+                else:
+                    raise _JobFailed(f"Unknown job kind: {kind}")
+            except _Interrupted:
+                # Stopped by shutdown: back to the queue for the next worker
+                await session.rollback()
+                await _requeue(session, job_id, kind)
+            except asyncio.CancelledError:
+                await session.rollback()
+                await _requeue(session, job_id, kind)
+                raise
+            except _JobFailed as exc:
+                await session.rollback()
+                await _finish(session, job_id, JOB_FAILED, result=exc.result, error=str(exc))
+            except Exception as exc:  # noqa: BLE001
+                logger.exception("Job %s failed", job_id)
+                await session.rollback()
+                await _finish(session, job_id, JOB_FAILED, error=exc.__class__.__name__)
+            else:
+                await _finish(session, job_id, JOB_DONE, result=result)
+
+
+async def claim_next() -> int | None:
+    params = {"queued": JOB_QUEUED, "running": JOB_RUNNING, "per_user": JOBS_PER_USER}
+    async with aclosing(get_db()) as sessions:
+        async for session in sessions:
+            while True:
+                candidate = (await session.exec(_CANDIDATE_SQL, params=params)).first()
+                if candidate is None:
+                    await session.rollback()
+                    return None
+                job_id, user_id = candidate
+                await session.exec(_LOCK_SQL, params={"namespace": _LOCK_CLAIM, "user_id": user_id})
+                row = (
+                    await session.exec(
+                        _CLAIM_SQL,
+                        params={**params, "job_id": job_id, "user_id": user_id, "now": datetime.utcnow()},
+                    )
+                ).first()
+                await session.commit()
+                # Lost to another worker's claim for the same user: the next candidate skips them
+                if row is not None:
+                    return job_id
+    return None
+
+
+async def maintenance() -> None:
+    now = datetime.utcnow()
+    async with aclosing(get_db()) as sessions:
+        async for session in sessions:
+            await session.exec(
+                update(Job)
+                .where(Job.status == JOB_RUNNING, Job.heartbeat_at < now - timedelta(seconds=JOBS_STALE_SECONDS))
+                .values(status=JOB_FAILED, error="Worker stopped responding", finished_at=now)
+            )
+            await session.exec(delete(Job).where(Job.finished_at < now - timedelta(hours=JOBS_RETENTION_HOURS)))
+            await session.commit()
+
+
+async def worker_loop() -> None:
+    last_maintenance = 0.0
+    while not _stop.is_set():
+        try:
+            if time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                last_maintenance = time.monotonic()
+                await maintenance()
+            job_id = await claim_next()
+            if job_id is not None:
+                await run_job(job_id)
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # noqa: BLE001
+            logger.exception("Job worker iteration failed")
+
+        _wakeup.clear()
+        try:
+            await asyncio.wait_for(_wakeup.wait(), timeout=JOBS_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+
+
+def start_workers(count: int = JOBS_WORKERS) -> None:
+    _stop.clear()
+    for _ in range(count):
+        _tasks.append(asyncio.create_task(worker_loop()))
+
+
+async def stop_workers(timeout: float = JOBS_STOP_TIMEOUT) -> None:
+    # Running jobs stop at their next item or chunk and are requeued; a job still
+    # running after the timeout is cancelled and requeued from its last checkpoint.
+    _stop.set()
+    _wakeup.set()
+    if _tasks:
+        _, pending = await asyncio.wait(_tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*_tasks, return_exceptions=True)
+    _tasks.clear()
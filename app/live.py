@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+import asyncio
+from collections import deque
+from collections.abc import AsyncIterator, Callable, Sequence
+from datetime import datetime
+import json
+import logging
+import os
+import signal
+from typing import Any
+import uuid
+
+from sqlalchemy import func
+from sqlalchemy.engine import make_url
+from sqlmodel import select
+
+from app.db import DATABASE_URL, DbSession
+
+logger = logging.getLogger(__name__)
+
+# Note changes are published with NOTIFY in the writing transaction and fanned out to the
+# browser over Server-Sent Events. Each process keeps one LISTEN connection, opened when
+# the first stream starts, however many streams it serves.
+CHANNEL = "note_events"
+# LIVE_UPDATES=0 turns both off (e.g. on Windows, where psycopg async needs a selector loop)
+LIVE_UPDATES = (os.getenv("LIVE_UPDATES") or "1").strip().lower() in ("1", "true", "yes", "on")
+
+OP_CREATE = "create"
+OP_UPDATE = "update"
+OP_DELETE = "delete"
+# Many notes changed at once (an import): clients reload the list instead of patching it
+OP_RELOAD = "reload"
+
+# An idle stream gets a comment line this often, so proxies don't close it
+LIVE_HEARTBEAT_SECONDS = float(os.getenv("LIVE_HEARTBEAT_SECONDS") or 15)
+# Recent events kept per process; a client reconnecting with Last-Event-ID is sent what
+# it missed, or told to reload if that event is no longer here
+LIVE_REPLAY_EVENTS = int(os.getenv("LIVE_REPLAY_EVENTS") or 1000)
+# A stream that falls this many events behind is closed; the client reconnects and replays
+LIVE_MAX_QUEUED = int(os.getenv("LIVE_MAX_QUEUED") or 256)
+# Client reconnect delay announced in the stream (milliseconds)
+LIVE_RETRY_MS = 3000
+# NOTIFY payloads must stay under 8000 bytes, so bulk changes are split
+_NOTES_PER_NOTIFY = 200
+
+# user_id -> open streams; None holds superusers' streams, which get every event
+_streams: dict[int | None, set[asyncio.Queue[str | None]]] = {}
+# (event id, user_id, SSE message), in commit order
+_recent: deque[tuple[str, int, str]] = deque(maxlen=LIVE_REPLAY_EVENTS)
+_listener: asyncio.Task[None] | None = None
+_loop: asyncio.AbstractEventLoop | None = None
+
+
+async def notify(
+    session: DbSession,
+    user_id: int,
+    op: str,
+    notes: Sequence[tuple[int, int | None]] = (),
+    updated_at: datetime | None = None,
+) -> None:
+    # notes: (note id, version after the change; None for deletes). Part of the caller's
+    # transaction: listeners see it on commit and never on rollback.
+    if not LIVE_UPDATES:
+        return
+    stamp = (updated_at or datetime.utcnow()).isoformat() + "Z"
+    calls = []
+    for start in range(0, max(len(notes), 1), _NOTES_PER_NOTIFY):
+        payload = {
+            "id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "op": op,
+            "updated_at": stamp,
+            "notes": [list(note) for note in notes[start : start + _NOTES_PER_NOTIFY]],
+        }
+        calls.append(func.pg_notify(CHANNEL, json.dumps(payload, separators=(",", ":"))))
+    # All chunks in one round trip
+    await session.exec(select(*calls))
+
+
+def _message(event: str, data: dict[str, Any], event_id: str | None = None) -> str:
+    head = f"id: {event_id}\n" if event_id else ""
+    return f"{head}event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+
+def _send(queue: asyncio.Queue[str | None], message: str | None, key: int | None) -> None:
+    if message is not None and queue.qsize() >= LIVE_MAX_QUEUED:
+        # Too slow: close the stream rather than buffer without bound
+        _streams.get(key, set()).discard(queue)
+        message = None
+    queue.put_nowait(message)
+
+
+def _dispatch(payload: str) -> None:
+    try:
+        event = json.loads(payload)
+        event_id, user_id = str(event["id"]), int(event["user_id"])
+    except (ValueError, KeyError, TypeError):
+        logger.warning("Ignoring malformed %s payload: %.200s", CHANNEL, payload)
+        return
+    data = {"op": event.get("op"), "updated_at": event.get("updated_at"), "notes": event.get("notes") or []}
+    message = _message("notes", data, event_id)
+    _recent.append((event_id, user_id, message))
+    for key in (user_id, None):
+        for queue in list(_streams.get(key, ())):
+            _send(queue, message, key)
+
+
+def _reset_all() -> None:
+    # Events may have been missed (listener reconnected): every client resyncs
+    _recent.clear()
+    message = _message("reset", {})
+    for key, queues in list(_streams.items()):
+        for queue in list(queues):
+            _send(queue, message, key)
+
+
+def _conninfo() -> str:
+    # psycopg wants a plain libpq URL, without SQLAlchemy's "+psycopg" driver suffix
+    url = make_url(DATABASE_URL.strip())
+    return url.set(drivername="postgresql").render_as_string(hide_password=False)
+
+
+async def _listen() -> None:
+    import psycopg
+
+    delay = 1.0
+    connected_before = False
+    while True:
+        try:
+            async with await psycopg.AsyncConnection.connect(_conninfo(), autocommit=True) as conn:
+                await conn.execute(f"LISTEN {CHANNEL}")
+                if connected_before:
+                    _reset_all()
+                connected_before = True
+                delay = 1.0
+                async for notification in conn.notifies():
+                    _dispatch(notification.payload)
+        except asyncio.CancelledError:
+            raise
+        except Exception:  # noqa: BLE001
+            logger.exception("Live updates listener failed; reconnecting in %.0fs", delay)
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 30.0)
+
+
+def _replay(user_id: int | None, last_event_id: str) -> list[str] | None:
+    # Events after last_event_id visible to this user, or None if it is not in the buffer
+    for index, (event_id, _, _) in enumerate(_recent):
+        if event_id == last_event_id:
+            return [
+                message
+                for _, owner_id, message in list(_recent)[index + 1 :]
+                if user_id is None or owner_id == user_id
+            ]
+    return None
+
+
+def _end_streams() -> None:
+    for queues in list(_streams.values()):
+        for queue in list(queues):
+            queue.put_nowait(None)
+    _streams.clear()
+
+
+def _end_streams_on_exit() -> None:
+    # Servers (uvicorn) run shutdown hooks only once open connections finish, and an event
+    # stream never finishes by itself: end the streams as soon as the process is told to exit
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        previous = signal.getsignal(sig)
+        if not callable(previous):
+            continue
+
+        def handler(signum: int, frame: Any, previous: Callable[[int, Any], Any] = previous) -> None:
+            if _loop is not None:
+                _loop.call_soon_threadsafe(_end_streams)
+            previous(signum, frame)
+
+        try:
+            signal.signal(sig, handler)
+        except ValueError:
+            # Not the main thread: streams end with their connections
+            return
+
+
+async def stream(user_id: int | None, last_event_id: str | None = None) -> AsyncIterator[str]:
+    # SSE messages for one client; user_id None streams every user's events
+    global _listener, _loop
+    if _loop is None:
+        _loop = asyncio.get_running_loop()
+        _end_streams_on_exit()
+    if _listener is None or _listener.done():
+        _listener = asyncio.create_task(_listen())
+
+    queue: asyncio.Queue[str | None] = asyncio.Queue()
+    _streams.setdefault(user_id, set()).add(queue)
+    # Taken together with subscribing (no await in between): nothing is missed or repeated
+    missed = _replay(user_id, last_event_id) if last_event_id else []
+    try:
+        yield f"retry: {LIVE_RETRY_MS}\n\n"
+        if missed is None:
+            yield _message("reset", {})
+        else:
+            for message in missed:
+                yield message
+        while True:
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=LIVE_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                yield ": ping\n\n"
+                continue
+            if message is None:
+                return
+            yield message
+    finally:
+        queues = _streams.get(user_id)
+        if queues is not None:
+            queues.discard(queue)
+            if not queues:
+                del _streams[user_id]
+
+
+async def stop() -> None:
+    global _listener
+    _end_streams()
+    if _listener is not None:
+        _listener.cancel()
+        await asyncio.gather(_listener, return_exceptions=True)
+        _listener = None
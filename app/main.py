@@ -1,35 +1,103 @@
 from __future__ import annotations
 
-from collections.abc import Generator
-from datetime import datetime, timezone
+import asyncio
+import base64
+import hashlib
+import hmac
+from collections.abc import AsyncGenerator
+from contextlib import aclosing
+from datetime import datetime, timedelta
+import json
+import math
 import os
 import time
-from typing import Any
-from urllib.request import urlopen
+from typing import TYPE_CHECKING, Any
 from urllib.parse import parse_qsl, urlencode, urlparse
 
 from fastapi import Depends, FastAPI, File, Form, HTTPException, Request, UploadFile
-from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse
-from fastapi.staticfiles import StaticFiles
-from fastapi.templating import Jinja2Templates
+from fastapi.responses import HTMLResponse, RedirectResponse, JSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware.gzip import GZipMiddleware
 from starlette.middleware.sessions import SessionMiddleware
-from sqlalchemy import or_
-from sqlmodel import Session, select
-
-from app.db import get_session
-from app.models import Note, User
-from app.security import hash_password, verify_password
+from markupsafe import Markup
+from sqlalchemy import Integer, any_, bindparam, delete, false, func, not_, or_, tuple_, update
+from sqlalchemy.dialects.postgresql import ARRAY
+from sqlalchemy.orm import load_only
+from sqlalchemy.orm.exc import StaleDataError
+from sqlmodel import select
+
+from app import exporter, jobs, live, revisions, search
+from app.assets import STATIC_DIR, AssetFiles, asset_version
+from app.cached_fetch import CachedFetch
+from app.db import (
+    DATABASE_REPLICA_URLS,
+    DB_REPLICA_STICKY_SECONDS,
+    DbSession,
+    get_db,
+    on_replica,
+    on_serving_engine,
+    pool_metrics,
+)
+from app.instrumentation import TimingMiddleware, instrument_engine, render_metrics
+from app.models import (
+    Job,
+    Note,
+    NoteBulk,
+    NoteCreate,
+    NoteDelta,
+    NoteRevision,
+    NoteUpdate,
+    User,
+    normalize_newlines,
+)
+from app.page_cache import page_cache
+from app.security import PasswordHasherBusy, hash_password_async, shutdown_hasher, verify_and_update
+from app.user_cache import user_cache
+
+if TYPE_CHECKING:
+    from fastapi.templating import Jinja2Templates
 
 app = FastAPI(title="Notes", version="1.0.0")
 
 SECRET_KEY = os.getenv("SECRET_KEY") or "dev-secret-key-change-me"
+# Lets scrapers read /metrics/* with "Authorization: Bearer <token>" instead of an admin session
+METRICS_TOKEN = os.getenv("METRICS_TOKEN") or ""
+# /readyz gives up on the database after this many seconds
+READY_DB_TIMEOUT = float(os.getenv("READY_DB_TIMEOUT") or 2)
 app.add_middleware(SessionMiddleware, secret_key=SECRET_KEY, same_site="lax")
 
-app.mount("/static", StaticFiles(directory="app/static"), name="static")
-templates = Jinja2Templates(directory="app/templates")
 
+class _GZipMiddleware(GZipMiddleware):
+    # Event streams pass through: gzip would hold events back until its buffer fills
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] == "http" and scope["path"] == "/events":
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+# Pages and JSON; responses that already carry Content-Encoding (precompressed assets) pass through
+app.add_middleware(_GZipMiddleware, minimum_size=1000, compresslevel=6)
+
+# Outermost, so its timings include the session middleware
+app.add_middleware(TimingMiddleware)
+on_serving_engine(instrument_engine)
+
+app.mount("/static", AssetFiles(directory=STATIC_DIR), name="static")
+
+# Jinja is imported and set up on the first render rather than at startup
+_templates: Jinja2Templates | None = None
+
+
+def get_templates() -> Jinja2Templates:
+    global _templates
+    if _templates is None:
+        from app.templating import create_templates
 
-_WEATHER_CACHE: dict[str, Any] = {"ts": 0.0, "data": None}
+        templates = create_templates()
+        templates.env.filters["note_etag"] = _note_etag
+        _templates = templates
+    return _templates
 
 
 def _weather_code_label(code: int | None) -> str:
@@ -57,41 +125,49 @@ def _weather_code_label(code: int | None) -> str:
     return ""
 
 
-@app.get("/weather/tashkent")
-def tashkent_weather() -> JSONResponse:
-    # Cache for 5 minutes to avoid hammering the provider
-    now = time.time()
-    cached_ts = float(_WEATHER_CACHE.get("ts") or 0.0)
-    cached_data = _WEATHER_CACHE.get("data")
-    if cached_data and (now - cached_ts) < 300:
-        return JSONResponse(content=cached_data)
-
-    url = (
-        "https://api.open-meteo.com/v1/forecast"
-        "?latitude=41.3111&longitude=69.2797"
-        "&current_weather=true"
-        "&timezone=Asia%2FTashkent"
-    )
+WEATHER_URL = os.getenv("WEATHER_URL") or (
+    "https://api.open-meteo.com/v1/forecast"
+    "?latitude=41.3111&longitude=69.2797"
+    "&current_weather=true"
+    "&timezone=Asia%2FTashkent"
+)
+WEATHER_TIMEOUT = 7
 
-    try:
-        import json
+# Fresh for 5 minutes, then served stale for up to an hour while refreshing in the background
+_weather_cache: CachedFetch[dict[str, Any]] = CachedFetch(ttl=300, stale_ttl=3600, error_ttl=10, max_error_ttl=300)
 
-        with urlopen(url, timeout=7) as resp:
-            payload = json.loads(resp.read().decode("utf-8"))
-        current = payload.get("current_weather") or {}
 
-        temperature = current.get("temperature")
-        windspeed = current.get("windspeed")
-        weathercode = current.get("weathercode")
-        result = {
-            "city": "Ташкент",
-            "temperature_c": temperature,
-            "wind_kmh": windspeed,
-            "weather_code": weathercode,
-            "summary": _weather_code_label(int(weathercode)) if weathercode is not None else "",
-            "time": current.get("time"),
-            "source": "open-meteo",
-        }
+def _load_weather() -> dict[str, Any]:
+    from urllib.request import urlopen
+
+    with urlopen(WEATHER_URL, timeout=WEATHER_TIMEOUT) as resp:
+        payload = json.loads(resp.read().decode("utf-8"))
+    current = payload.get("current_weather") or {}
+
+    temperature = current.get("temperature")
+    windspeed = current.get("windspeed")
+    weathercode = current.get("weathercode")
+    return {
+        "ok": True,
+        "city": "Ташкент",
+        "temperature_c": temperature,
+        "wind_kmh": windspeed,
+        "weather_code": weathercode,
+        "summary": _weather_code_label(int(weathercode)) if weathercode is not None else "",
+        "time": current.get("time"),
+        "source": "open-meteo",
+    }
+
+
+async def _fetch_weather() -> dict[str, Any]:
+    # urllib blocks; only the single in-flight refresh occupies a threadpool thread
+    return await run_in_threadpool(_load_weather)
+
+
+@app.get("/weather/tashkent")
+async def tashkent_weather() -> JSONResponse:
+    try:
+        result = await _weather_cache.get("tashkent", _fetch_weather)
     except Exception:
         # Keep UI simple: return a stable shape with ok=false
         result = {
@@ -104,11 +180,6 @@ def tashkent_weather() -> JSONResponse:
             "time": None,
             "source": "open-meteo",
         }
-        return JSONResponse(content=result, status_code=200)
-
-    result["ok"] = True
-    _WEATHER_CACHE["ts"] = now
-    _WEATHER_CACHE["data"] = result
     return JSONResponse(content=result)
 
 
@@ -131,12 +202,34 @@ def _redirect_back_with_params(request: Request, default: str, **params: str) ->
     return RedirectResponse(url=url, status_code=303)
 
 
-def session_dep() -> Generator[Session, None, None]:
-    with get_session() as session:
-        yield session
+# Session key holding when this browser last sent a write (see read_session_dep)
+_WROTE_AT = "db_wrote_at"
+
 
+def _read_from_replica(request: Request) -> bool:
+    if not DATABASE_REPLICA_URLS:
+        return False
+    wrote_at = request.session.get(_WROTE_AT)
+    return not isinstance(wrote_at, (int, float)) or time.time() - wrote_at >= DB_REPLICA_STICKY_SECONDS
 
-def get_current_user(request: Request, session: Session) -> User | None:
+
+async def session_dep(request: Request) -> AsyncGenerator[DbSession, None]:
+    if DATABASE_REPLICA_URLS and request.method not in ("GET", "HEAD") and "user_id" in request.session:
+        request.session[_WROTE_AT] = round(time.time(), 3)
+    async with aclosing(get_db()) as sessions:
+        async for session in sessions:
+            yield session
+
+
+async def read_session_dep(request: Request) -> AsyncGenerator[DbSession, None]:
+    # Read-only pages: a replica when configured, unless this browser wrote something in
+    # the last DB_REPLICA_STICKY_SECONDS (it would not see its own change there yet)
+    async with aclosing(get_db(replica=_read_from_replica(request))) as sessions:
+        async for session in sessions:
+            yield session
+
+
+async def get_current_user(request: Request, session: DbSession) -> User | None:
     user_id = None
     try:
         user_id = request.session.get("user_id")
@@ -144,11 +237,16 @@ def get_current_user(request: Request, session: Session) -> User | None:
         user_id = None
     if not user_id:
         return None
-    return session.get(User, int(user_id))
+    user = user_cache.get(int(user_id))
+    if user is None:
+        user = await session.get(User, int(user_id))
+        if user is not None:
+            user = user_cache.put(user)
+    return user
 
 
-def _require_user(request: Request, session: Session) -> User:
-    user = get_current_user(request, session)
+async def _require_user(request: Request, session: DbSession) -> User:
+    user = await get_current_user(request, session)
     if not user:
         raise HTTPException(status_code=303, headers={"Location": "/login"})
     return user
@@ -160,262 +258,670 @@ def _can_access_note(user: User, note: Note) -> bool:
     return note.user_id == user.id
 
 
-@app.on_event("startup")
-def ensure_admin_user() -> None:
-    # Create default superuser if missing
-    with get_session() as session:
-        admin = session.exec(select(User).where(User.username == "admin")).first()
-        if admin:
+async def _require_metrics_access(request: Request) -> None:
+    if METRICS_TOKEN:
+        auth = request.headers.get("authorization") or ""
+        if hmac.compare_digest(auth.encode("utf-8"), f"Bearer {METRICS_TOKEN}".encode("utf-8")):
             return
-        admin = User(username="admin", password_hash=hash_password("admin"), is_superuser=True)
-        session.add(admin)
-        session.commit()
+    async with aclosing(get_db()) as sessions:
+        async for session in sessions:
+            user = await _require_user(request, session)
+            if not user.is_superuser:
+                raise HTTPException(status_code=403, detail="Forbidden")
+
+
+@app.get("/metrics/db", dependencies=[Depends(_require_metrics_access)])
+async def db_pool_metrics() -> JSONResponse:
+    return JSONResponse(content=pool_metrics.snapshot())
+
+
+@app.get("/metrics", dependencies=[Depends(_require_metrics_access)])
+async def prometheus_metrics() -> Response:
+    pool = pool_metrics.snapshot()
+    cache = page_cache.snapshot()
+    extra = {f"db_pool_{name}": value for name, value in pool["pool"].items()}
+    extra.update({f"db_pool_{name}_total": value for name, value in pool["events"].items()})
+    extra.update(
+        {
+            "page_cache_hits_total": cache["hits"],
+            "page_cache_misses_total": cache["misses"],
+            "page_cache_invalidations_total": cache["invalidations"],
+            "page_cache_errors_total": cache["errors"],
+        }
+    )
+    return Response(content=render_metrics(extra), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+@app.get("/metrics/cache", dependencies=[Depends(_require_metrics_access)])
+async def page_cache_metrics() -> JSONResponse:
+    return JSONResponse(content=page_cache.snapshot())
+
+
+# Per-process health checks (each scripts.serve worker answers for itself). /readyz fails
+# while the process drains before shutdown, so a load balancer stops sending traffic first.
+app.state.draining = False
+
+
+@app.get("/healthz")
+async def healthz() -> JSONResponse:
+    return JSONResponse(content={"status": "ok", "pid": os.getpid()})
+
+
+@app.get("/readyz")
+async def readyz() -> JSONResponse:
+    if app.state.draining:
+        return JSONResponse(content={"status": "draining", "pid": os.getpid()}, status_code=503)
+
+    async def ping() -> None:
+        async with aclosing(get_db()) as sessions:
+            async for session in sessions:
+                await session.exec(select(1))
+
+    try:
+        await asyncio.wait_for(ping(), timeout=READY_DB_TIMEOUT)
+    except Exception:  # noqa: BLE001
+        return JSONResponse(content={"status": "database unavailable", "pid": os.getpid()}, status_code=503)
+    return JSONResponse(content={"status": "ok", "pid": os.getpid()})
+
+
+@app.on_event("startup")
+async def start_job_workers() -> None:
+    jobs.start_workers()
+
+
+@app.on_event("shutdown")
+async def stop_job_workers() -> None:
+    await jobs.stop_workers()
+
+
+@app.on_event("shutdown")
+def stop_password_hasher() -> None:
+    shutdown_hasher()
+
+
+@app.on_event("shutdown")
+async def stop_live_updates() -> None:
+    await live.stop()
+
+
+NOTES_PAGE_SIZE = 50
+NOTES_PAGE_SIZE_MAX = 200
+# Cards show at most this many characters; the full body is fetched by app.js on demand.
+NOTE_PREVIEW_CHARS = 500
+
+# Everything the card needs except content, which can be arbitrarily large
+_LISTING_COLUMNS = load_only(
+    Note.id, Note.user_id, Note.title, Note.pinned, Note.archived, Note.created_at, Note.updated_at, Note.version
+)
+
+
+def _encode_cursor(values: list[Any]) -> str:
+    raw = json.dumps(values, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_cursor(cursor: str, size: int) -> list[Any]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+    except Exception:
+        values = None
+    if not isinstance(values, list) or len(values) != size:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return values
+
+
+def _listing_cursor(note: Note) -> str:
+    return _encode_cursor([int(bool(note.pinned)), note.updated_at.isoformat(), note.id])
+
+
+def _listing_after(cursor: str) -> tuple[bool, datetime, int]:
+    pinned, updated_at, note_id = _decode_cursor(cursor, 3)
+    try:
+        return bool(pinned), datetime.fromisoformat(updated_at), int(note_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor") from None
+
+
+def _search_after(cursor: str) -> tuple[float, int]:
+    rank, note_id = _decode_cursor(cursor, 2)
+    try:
+        return float(rank), int(note_id)
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="Invalid cursor") from None
+
+
+class _NotesPage:
+    def __init__(self) -> None:
+        self.notes: list[Note] = []
+        self.snippets: dict[int, Markup] = {}
+        self.excerpts: dict[int, str] = {}
+        self.truncated: set[int] = set()
+        self.next_cursor: str | None = None
+
+
+def _listing_statement(
+    user: User, q_clean: str, archived_view: bool, cursor: str | None, page_size: int
+) -> tuple[Any, bool]:
+    # Returns the page query (one extra row to detect a next page) and whether it is a search
+    raw_query = search.prefix_query(q_clean) if q_clean else None
+
+    if raw_query:
+        # Ranked full-text search: GIN lookup, ordered by relevance
+        tsq = search.tsquery(raw_query)
+        rank = search.rank(tsq)
+        stmt = select(Note, rank, search.headline(tsq)).where(search.matches(tsq)).options(_LISTING_COLUMNS)
+        if cursor:
+            stmt = stmt.where(tuple_(rank, Note.id) < tuple_(*_search_after(cursor)))
+        stmt = stmt.order_by(rank.desc(), Note.id.desc())
+    else:
+        # One extra character tells whether the excerpt was cut
+        excerpt = func.left(Note.content, NOTE_PREVIEW_CHARS + 1)
+        stmt = select(Note, excerpt).options(_LISTING_COLUMNS)
+        if q_clean:
+            # Nothing searchable in the query (punctuation only)
+            stmt = stmt.where(false())
+        if cursor:
+            pinned, updated_at, note_id = _listing_after(cursor)
+            if pinned:
+                # Row comparison keeps the seek on the (pinned, updated_at, id) DESC index
+                stmt = stmt.where(tuple_(Note.pinned, Note.updated_at, Note.id) < tuple_(pinned, updated_at, note_id))
+            else:
+                # Same seek with pinned as an equality. The planner estimates a row comparison
+                # from its first column alone, and "pinned < false" looks empty, which made it
+                # walk the all-owners index for one owner's page.
+                stmt = stmt.where(not_(Note.pinned), tuple_(Note.updated_at, Note.id) < tuple_(updated_at, note_id))
+        stmt = stmt.order_by(Note.pinned.desc(), Note.updated_at.desc(), Note.id.desc())
+
+    # A literal predicate, not a bind parameter, so the planner can use the partial
+    # index for the view even with a generic plan
+    stmt = stmt.where(Note.archived if archived_view else not_(Note.archived))
+    if not user.is_superuser:
+        stmt = stmt.where(Note.user_id == user.id)
+    return stmt.limit(page_size + 1), raw_query is not None
+
+
+async def _list_notes(
+    session: DbSession,
+    user: User,
+    q_clean: str,
+    archived_view: bool,
+    cursor: str | None,
+    page_size: int,
+) -> _NotesPage:
+    stmt, searching = _listing_statement(user, q_clean, archived_view, cursor, page_size)
+    rows = (await session.exec(stmt)).all()
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    page = _NotesPage()
+    if searching:
+        page.notes = [note for note, _, _ in rows]
+        page.snippets = {note.id: search.render_snippet(snippet) for note, _, snippet in rows}
+    else:
+        page.notes = [note for note, _ in rows]
+        for note, text in rows:
+            if text and len(text) > NOTE_PREVIEW_CHARS:
+                text = text[:NOTE_PREVIEW_CHARS].rstrip() + "…"
+                page.truncated.add(note.id)
+            page.excerpts[note.id] = text or ""
+
+    if has_more:
+        if searching:
+            last_note, last_rank, _ = rows[-1]
+            page.next_cursor = _encode_cursor([float(last_rank), last_note.id])
+        else:
+            page.next_cursor = _listing_cursor(page.notes[-1])
+    return page
 
 
 @app.get("/", response_class=HTMLResponse)
-def index(
+async def index(
     request: Request,
     q: str | None = None,
     archived: int = 0,
-    session: Session = Depends(session_dep),
+    cursor: str | None = None,
+    limit: int = NOTES_PAGE_SIZE,
+    partial: int = 0,
+    session: DbSession = Depends(read_session_dep),
 ):
-    user = _require_user(request, session)
+    user = await _require_user(request, session)
     archived_view = archived == 1
-    stmt = select(Note)
-    stmt = stmt.where(Note.archived == archived_view)
-
-    if not user.is_superuser:
-        stmt = stmt.where(Note.user_id == user.id)
-
+    page_size = max(1, min(limit, NOTES_PAGE_SIZE_MAX))
     q_clean = (q or "").strip()
-    if q_clean:
-        like = f"%{q_clean}%"
-        stmt = stmt.where(or_(Note.title.ilike(like), Note.content.ilike(like)))
-
-    stmt = stmt.order_by(Note.pinned.desc(), Note.updated_at.desc())
-    notes = session.exec(stmt).all()
-    return templates.TemplateResponse(
-        "index.html",
+    cache_key = await page_cache.key(
+        user.id, user.is_superuser, user.username, archived_view, q_clean, cursor, page_size, partial, asset_version()
+    )
+    cached = await page_cache.get(cache_key)
+    if cached is not None:
+        return HTMLResponse(cached)
+
+    page = await _list_notes(session, user, q_clean, archived_view, cursor, page_size)
+
+    next_url = None
+    if page.next_cursor:
+        params: dict[str, str] = {}
+        if archived_view:
+            params["archived"] = "1"
+        if q_clean:
+            params["q"] = q_clean
+        if page_size != NOTES_PAGE_SIZE:
+            params["limit"] = str(page_size)
+        params["cursor"] = page.next_cursor
+        next_url = f"/?{urlencode(params)}"
+
+    response = get_templates().TemplateResponse(
+        "_notes_page.html" if partial == 1 else "index.html",
         {
             "request": request,
-            "notes": notes,
+            "notes": page.notes,
+            "snippets": page.snippets,
+            "excerpts": page.excerpts,
+            "truncated": page.truncated,
+            "next_url": next_url,
             "q": q_clean,
             "archived_view": archived_view,
             "user": user,
         },
     )
+    if not on_replica(session):
+        # Keyed by the primary's write counters: a lagging replica's page could be
+        # stored under a version it doesn't show yet
+        await page_cache.set(cache_key, response.body)
+    return response
+
+
+@app.get("/events")
+async def note_events(request: Request):
+    # Server-Sent Events: the list page patches itself when notes change in another tab or
+    # device. The stream outlives any single request's work, so it holds no DB session.
+    async with aclosing(get_db()) as sessions:
+        async for session in sessions:
+            user = await _require_user(request, session)
+    if not live.LIVE_UPDATES:
+        return Response(status_code=204)
+    return StreamingResponse(
+        live.stream(None if user.is_superuser else user.id, request.headers.get("last-event-id")),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 
 @app.get("/export/json")
-def export_notes_json(request: Request, session: Session = Depends(session_dep)):
-    user = _require_user(request, session)
-    stmt = select(Note).order_by(Note.updated_at.desc())
-    if not user.is_superuser:
-        stmt = stmt.where(Note.user_id == user.id)
-    notes = session.exec(stmt).all()
-    payload = [
-        {
-            "id": n.id,
-            "title": n.title,
-            "content": n.content,
-            "pinned": bool(n.pinned),
-            "archived": bool(n.archived),
-            "created_at": n.created_at.isoformat() + "Z",
-            "updated_at": n.updated_at.isoformat() + "Z",
-        }
-        for n in notes
-    ]
-
-    return JSONResponse(
-        content={"notes": payload},
+async def export_notes_json(request: Request, session: DbSession = Depends(read_session_dep)):
+    user = await _require_user(request, session)
+    return StreamingResponse(
+        exporter.export_chunks(user, ndjson=False, replica=on_replica(session)),
+        media_type="application/json",
         headers={"Content-Disposition": "attachment; filename=notes.json"},
     )
 
 
-def _parse_iso_datetime(value: object) -> datetime | None:
-    if not value:
-        return None
-    if not isinstance(value, str):
-        return None
-    raw = value.strip()
-    if not raw:
-        return None
-    # Export uses trailing 'Z'. datetime.fromisoformat doesn't accept it.
-    if raw.endswith("Z"):
-        raw = raw[:-1]
-    try:
-        dt = datetime.fromisoformat(raw)
-    except ValueError:
-        return None
-    # Normalize to naive UTC-ish datetime for DB
-    if dt.tzinfo is not None:
-        dt = dt.astimezone(timezone.utc).replace(tzinfo=None)
-    return dt
+@app.get("/export/ndjson")
+async def export_notes_ndjson(request: Request, session: DbSession = Depends(read_session_dep)):
+    user = await _require_user(request, session)
+    return StreamingResponse(
+        exporter.export_chunks(user, ndjson=True, replica=on_replica(session)),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": "attachment; filename=notes.ndjson"},
+    )
+
+
+def _wants_json(request: Request) -> bool:
+    return "application/json" in (request.headers.get("accept") or "")
+
+
+def _can_access_job(user: User, job: Job) -> bool:
+    if user.is_superuser:
+        return True
+    return job.user_id == user.id
+
+
+def _job_submitted(request: Request, job: Job) -> Response:
+    if _wants_json(request):
+        return JSONResponse(content=jobs.job_payload(job), status_code=202)
+    return RedirectResponse(url=f"/?{job.kind}_job={job.id}", status_code=303)
+
+
+def _jobs_busy(request: Request) -> Response:
+    if _wants_json(request):
+        return JSONResponse(content={"detail": "Too many pending jobs"}, status_code=429)
+    return RedirectResponse(url="/?jobs_busy=1", status_code=303)
 
 
 @app.post("/import/json")
 async def import_notes_json(
     request: Request,
     file: UploadFile = File(...),
-    session: Session = Depends(session_dep),
+    session: DbSession = Depends(session_dep),
 ):
-    user = _require_user(request, session)
+    user = await _require_user(request, session)
 
-    if not file.filename or not file.filename.lower().endswith(".json"):
+    filename = (file.filename or "").lower()
+    if not filename.endswith((".json", ".ndjson", ".jsonl")):
+        if _wants_json(request):
+            return JSONResponse(content={"detail": "Expected a .json or .ndjson file"}, status_code=400)
         return RedirectResponse(url="/?import_error=1", status_code=303)
 
+    # The upload is stored with the job and parsed by a worker
+    fmt = "ndjson" if filename.endswith((".ndjson", ".jsonl")) else "json"
     try:
-        raw_bytes = await file.read()
-        text = raw_bytes.decode("utf-8")
-    except Exception:
-        return RedirectResponse(url="/?import_error=1", status_code=303)
+        job = await jobs.submit(session, user.id, jobs.KIND_IMPORT, {"format": fmt}, upload=file.read)
+    except jobs.JobLimitError:
+        return _jobs_busy(request)
+    return _job_submitted(request, job)
+
 
+@app.post("/export/json")
+async def submit_export_json(request: Request, session: DbSession = Depends(session_dep)):
+    user = await _require_user(request, session)
     try:
-        import json
+        job = await jobs.submit(session, user.id, jobs.KIND_EXPORT, {"format": "json"})
+    except jobs.JobLimitError:
+        return _jobs_busy(request)
+    return _job_submitted(request, job)
 
-        data = json.loads(text)
-    except Exception:
-        return RedirectResponse(url="/?import_error=1", status_code=303)
 
-    notes_list = None
-    if isinstance(data, dict):
-        notes_list = data.get("notes")
+@app.post("/export/ndjson")
+async def submit_export_ndjson(request: Request, session: DbSession = Depends(session_dep)):
+    user = await _require_user(request, session)
+    try:
+        job = await jobs.submit(session, user.id, jobs.KIND_EXPORT, {"format": "ndjson"})
+    except jobs.JobLimitError:
+        return _jobs_busy(request)
+    return _job_submitted(request, job)
+
+
+async def _get_job(request: Request, session: DbSession, job_id: int) -> Job:
+    user = await _require_user(request, session)
+    job = await session.get(Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if not _can_access_job(user, job):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return job
 
-    if not isinstance(notes_list, list):
-        return RedirectResponse(url="/?import_error=1", status_code=303)
 
-    # Basic safety limit
-    if len(notes_list) > 2000:
-        return RedirectResponse(url="/?import_error=1", status_code=303)
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: int, request: Request, session: DbSession = Depends(session_dep)):
+    job = await _get_job(request, session, job_id)
+    return JSONResponse(content=jobs.job_payload(job), headers={"Cache-Control": "no-store"})
+
+
+@app.get("/jobs/{job_id}/download")
+async def job_download(job_id: int, request: Request, session: DbSession = Depends(session_dep)):
+    job = await _get_job(request, session, job_id)
+    if job.kind != jobs.KIND_EXPORT or job.status != jobs.JOB_DONE or not job.result:
+        raise HTTPException(status_code=409, detail="Job has no downloadable result")
+    return StreamingResponse(
+        jobs.iter_file(job.id, jobs.ROLE_OUTPUT),
+        media_type=job.result.get("media_type") or "application/octet-stream",
+        headers={"Content-Disposition": f"attachment; filename={job.result.get('filename') or 'notes.json'}"},
+    )
 
-    now = datetime.utcnow()
-    imported = 0
-    for item in notes_list:
-        if not isinstance(item, dict):
-            continue
-        title = str(item.get("title") or "").strip()
-        if not title:
-            continue
-        if len(title) > 200:
-            title = title[:200]
-        content = str(item.get("content") or "")
-
-        created_at = _parse_iso_datetime(item.get("created_at")) or now
-        updated_at = _parse_iso_datetime(item.get("updated_at")) or created_at
-        pinned = bool(item.get("pinned"))
-        archived = bool(item.get("archived"))
-
-        note = Note(
-            user_id=user.id,
-            title=title,
-            content=content,
-            pinned=pinned,
-            archived=archived,
-            created_at=created_at,
-            updated_at=updated_at,
-        )
-        session.add(note)
-        imported += 1
 
-    session.commit()
-    return RedirectResponse(url=f"/?imported={imported}", status_code=303)
+async def _commit_note(session: DbSession, note: Note, op: str) -> None:
+    # Commits a single-note change, publishing it to live streams in the same transaction
+    if op != live.OP_DELETE:
+        # Assigns the id of a new note and the version of a changed one
+        await session.flush()
+    version = None if op == live.OP_DELETE else note.version
+    await live.notify(session, note.user_id, op, [(note.id, version)], note.updated_at)
+    await session.commit()
+    await page_cache.invalidate_user(note.user_id)
 
 
 @app.post("/notes")
-def create_note(
+async def create_note(
     request: Request,
     title: str = Form(...),
     content: str = Form(""),
-    session: Session = Depends(session_dep),
+    session: DbSession = Depends(session_dep),
 ):
-    user = _require_user(request, session)
+    user = await _require_user(request, session)
     now = datetime.utcnow()
     note = Note(
         user_id=user.id,
         title=title.strip(),
-        content=content,
+        content=normalize_newlines(content),
         pinned=False,
         archived=False,
         created_at=now,
         updated_at=now,
     )
     session.add(note)
-    session.commit()
+    await _commit_note(session, note, live.OP_CREATE)
     return RedirectResponse(url="/?created=1", status_code=303)
 
 
 @app.get("/notes/{note_id}", response_class=HTMLResponse)
-def edit_note_page(
+async def edit_note_page(
     request: Request,
     note_id: int,
-    session: Session = Depends(session_dep),
+    session: DbSession = Depends(read_session_dep),
 ):
-    user = _require_user(request, session)
-    note = session.get(Note, note_id)
+    user = await _require_user(request, session)
+    note = await session.get(Note, note_id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     if not _can_access_note(user, note):
         raise HTTPException(status_code=403, detail="Forbidden")
-    return templates.TemplateResponse(
+    return get_templates().TemplateResponse(
         "edit.html",
         {
             "request": request,
             "note": note,
             "user": user,
+            "revisions": await revisions.recent(session, note.id),
         },
     )
 
 
-@app.post("/notes/{note_id}")
-def update_note(
+async def _load_revision(session: DbSession, user: User, note_id: int, seq: int) -> tuple[Note, NoteRevision, str]:
+    note = await session.get(Note, note_id)
+    if not note:
+        raise HTTPException(status_code=404, detail="Note not found")
+    if not _can_access_note(user, note):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    loaded = await revisions.load(session, note, seq)
+    if loaded is None:
+        raise HTTPException(status_code=404, detail="Revision not found")
+    return note, *loaded
+
+
+@app.get("/notes/{note_id}/revisions/{seq}", response_class=HTMLResponse)
+async def note_revision_page(
+    request: Request,
+    note_id: int,
+    seq: int,
+    conflict: int = 0,
+    session: DbSession = Depends(session_dep),
+):
+    user = await _require_user(request, session)
+    note, revision, content = await _load_revision(session, user, note_id, seq)
+    return get_templates().TemplateResponse(
+        "revision.html",
+        {
+            "request": request,
+            "note": note,
+            "revision": revision,
+            "content": content,
+            "user": user,
+            # A restore lost the version check (the note changed after this page was opened)
+            "conflict": conflict == 1,
+        },
+    )
+
+
+@app.post("/notes/{note_id}/revisions/{seq}/restore")
+async def restore_note_revision(
+    request: Request,
     note_id: int,
+    seq: int,
+    version: int | None = Form(None),
+    session: DbSession = Depends(session_dep),
+):
+    # A regular save of the old title and content, so the state it replaces is kept too
+    user = await _require_user(request, session)
+    _, revision, content = await _load_revision(session, user, note_id, seq)
+    _, updated = await _update_note_versioned(
+        session, user, note_id, version, {"title": revision.title, "content": content}
+    )
+    if not updated:
+        return RedirectResponse(url=f"/notes/{note_id}/revisions/{seq}?conflict=1", status_code=303)
+    return RedirectResponse(url=f"/notes/{note_id}?restored=1", status_code=303)
+
+
+@app.get("/notes/{note_id}/card", response_class=HTMLResponse)
+async def note_card(
     request: Request,
-    title: str = Form(...),
-    content: str = Form(""),
-    session: Session = Depends(session_dep),
+    note_id: int,
+    session: DbSession = Depends(session_dep),
 ):
-    user = _require_user(request, session)
-    note = session.get(Note, note_id)
-    if not note:
+    # One list card, rendered as on the list page; fetched by live updates
+    user = await _require_user(request, session)
+    excerpt = func.left(Note.content, NOTE_PREVIEW_CHARS + 1)
+    row = (await session.exec(select(Note, excerpt).where(Note.id == note_id).options(_LISTING_COLUMNS))).first()
+    if row is None:
         raise HTTPException(status_code=404, detail="Note not found")
+    note, text = row
     if not _can_access_note(user, note):
         raise HTTPException(status_code=403, detail="Forbidden")
+    truncated = set()
+    if text and len(text) > NOTE_PREVIEW_CHARS:
+        text = text[:NOTE_PREVIEW_CHARS].rstrip() + "…"
+        truncated.add(note.id)
+    return get_templates().TemplateResponse(
+        "_note_card.html",
+        {
+            "request": request,
+            "n": note,
+            "excerpts": {note.id: text or ""},
+            "truncated": truncated,
+            "archived_view": note.archived,
+        },
+        headers={"Cache-Control": "no-store"},
+    )
+
+
+async def _update_note_versioned(
+    session: DbSession, user: User, note_id: int, version: int | None, values: dict[str, Any]
+) -> tuple[Note, bool]:
+    # Access check and compare-and-set on version in a single UPDATE ... RETURNING: no
+    # SELECT beforehand and no row lock held between reading and writing. Returns the
+    # updated note, or the current one (and False) when `version` is stale. A changed
+    # title or content also records the replaced state (one INSERT into note_revision).
+    stmt = update(Note).where(Note.id == note_id)
+    if not user.is_superuser:
+        stmt = stmt.where(Note.user_id == user.id)
+    if version is not None:
+        stmt = stmt.where(Note.version == version)
+    stmt = stmt.values(**values, updated_at=datetime.utcnow(), version=Note.version + 1)
+    tracked = "title" in values or "content" in values
+    if tracked:
+        content = values.get("content")
+        previous = revisions.previous(content)
+        stmt = stmt.where(Note.id == previous.c.previous_id)
+        stmt = stmt.values(revision_count=revisions.counted(values, content)).returning(Note, *previous.c)
+        params = revisions.previous_params(note_id, values, content)
+    else:
+        stmt, params = stmt.returning(Note), {}
+    row = (await session.exec(stmt, params=params)).first()
+    if row is not None:
+        note = row[0]
+        if tracked and note.revision_count != row.previous_revision_count:
+            await revisions.record(session, note.revision_count, row, values.get("content"))
+        await _commit_note(session, note, live.OP_UPDATE)
+        return note, True
+
+    # Nothing matched: find out why (only on this path)
+    current = await session.get(Note, note_id)
+    if not current:
+        raise HTTPException(status_code=404, detail="Note not found")
+    if not _can_access_note(user, current):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return current, False
 
-    note.title = title.strip()
-    note.content = content
-    note.updated_at = datetime.utcnow()
 
-    session.add(note)
-    session.commit()
+@app.post("/notes/{note_id}")
+async def update_note(
+    note_id: int,
+    request: Request,
+    title: str = Form(...),
+    content: str = Form(""),
+    version: int | None = Form(None),
+    session: DbSession = Depends(session_dep),
+):
+    user = await _require_user(request, session)
+    content = normalize_newlines(content)
+    note, updated = await _update_note_versioned(
+        session, user, note_id, version, {"title": title.strip(), "content": content}
+    )
+    if not updated:
+        if _wants_json(request):
+            return _note_conflict(note, 409)
+        # Show the saved version next to the user's draft; resubmitting overwrites it
+        return get_templates().TemplateResponse(
+            "edit.html",
+            {
+                "request": request,
+                "note": note,
+                "user": user,
+                "draft": {"title": title.strip(), "content": content},
+            },
+            status_code=409,
+        )
+    if _wants_json(request):
+        return _note_response(note)
     return RedirectResponse(url="/?updated=1", status_code=303)
 
 
 @app.post("/notes/{note_id}/delete")
-def delete_note(note_id: int, request: Request, session: Session = Depends(session_dep)):
-    user = _require_user(request, session)
-    note = session.get(Note, note_id)
+async def delete_note(note_id: int, request: Request, session: DbSession = Depends(session_dep)):
+    user = await _require_user(request, session)
+    note = await session.get(Note, note_id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     if not _can_access_note(user, note):
         raise HTTPException(status_code=403, detail="Forbidden")
-    session.delete(note)
-    session.commit()
+    await session.delete(note)
+    await _commit_note(session, note, live.OP_DELETE)
     return RedirectResponse(url="/?deleted=1", status_code=303)
 
 
+@app.exception_handler(StaleDataError)
+async def stale_note_handler(request: Request, exc: StaleDataError) -> Response:
+    # A versioned ORM flush matched no row: the note was written or deleted after it was loaded
+    if request.url.path.startswith("/api/"):
+        return JSONResponse(content={"detail": "Note was modified"}, status_code=409)
+    return _redirect_back_with_params(request, default="/", conflict="1")
+
+
+def _toggle_pinned(note: Note) -> None:
+    note.pinned = not bool(note.pinned)
+    note.updated_at = datetime.utcnow()
+
+
+def _toggle_archived(note: Note) -> None:
+    note.archived = not bool(note.archived)
+    # Keep archive list clean: archived notes are not pinned
+    if note.archived:
+        note.pinned = False
+    note.updated_at = datetime.utcnow()
+
+
 @app.post("/notes/{note_id}/pin")
-def toggle_pin(note_id: int, request: Request, session: Session = Depends(session_dep)):
-    user = _require_user(request, session)
-    note = session.get(Note, note_id)
+async def toggle_pin(note_id: int, request: Request, session: DbSession = Depends(session_dep)):
+    user = await _require_user(request, session)
+    note = await session.get(Note, note_id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     if not _can_access_note(user, note):
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    note.pinned = not bool(note.pinned)
-    note.updated_at = datetime.utcnow()
+    _toggle_pinned(note)
     session.add(note)
-    session.commit()
+    await _commit_note(session, note, live.OP_UPDATE)
 
     return _redirect_back_with_params(
         request,
@@ -426,21 +932,17 @@ def toggle_pin(note_id: int, request: Request, session: Session = Depends(sessio
 
 
 @app.post("/notes/{note_id}/archive")
-def toggle_archive(note_id: int, request: Request, session: Session = Depends(session_dep)):
-    user = _require_user(request, session)
-    note = session.get(Note, note_id)
+async def toggle_archive(note_id: int, request: Request, session: DbSession = Depends(session_dep)):
+    user = await _require_user(request, session)
+    note = await session.get(Note, note_id)
     if not note:
         raise HTTPException(status_code=404, detail="Note not found")
     if not _can_access_note(user, note):
         raise HTTPException(status_code=403, detail="Forbidden")
 
-    note.archived = not bool(note.archived)
-    # Keep archive list clean: archived notes are not pinned
-    if note.archived:
-        note.pinned = False
-    note.updated_at = datetime.utcnow()
+    _toggle_archived(note)
     session.add(note)
-    session.commit()
+    await _commit_note(session, note, live.OP_UPDATE)
 
     return _redirect_back_with_params(
         request,
@@ -450,73 +952,483 @@ def toggle_archive(note_id: int, request: Request, session: Session = Depends(se
     )
 
 
+# JSON API. Same access rules as the HTML routes; a note's ETag is its version, so
+# If-Match turns every write into a compare-and-set against the version the client saw.
+
+
+def _version_etag(note_id: int, version: int) -> str:
+    return f'"{note_id}-{version}"'
+
+
+def _note_etag(note: Note) -> str:
+    return _version_etag(note.id, note.version)
+
+
+def _etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or candidate.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+def _note_payload(note: Note) -> dict[str, Any]:
+    return {
+        "id": note.id,
+        "title": note.title,
+        "content": note.content,
+        "pinned": bool(note.pinned),
+        "archived": bool(note.archived),
+        "created_at": note.created_at.isoformat() + "Z",
+        "updated_at": note.updated_at.isoformat() + "Z",
+        "version": note.version,
+    }
+
+
+def _note_response(note: Note, status_code: int = 200, **headers: str) -> JSONResponse:
+    return JSONResponse(
+        content=_note_payload(note),
+        status_code=status_code,
+        headers={"ETag": _note_etag(note), "Cache-Control": "private, no-cache", **headers},
+    )
+
+
+def _note_conflict(note: Note, status_code: int) -> JSONResponse:
+    # Carries the current note so the client can offer a merge
+    return JSONResponse(
+        content={"detail": "Note was modified", "note": _note_payload(note)},
+        status_code=status_code,
+        headers={"ETag": _note_etag(note), "Cache-Control": "private, no-cache"},
+    )
+
+
+async def _require_api_user(request: Request, session: DbSession) -> User:
+    user = await get_current_user(request, session)
+    if not user:
+        raise HTTPException(status_code=401, detail="Not authenticated")
+    return user
+
+
+async def _get_api_note(request: Request, session: DbSession, note_id: int) -> tuple[User, Note]:
+    user = await _require_api_user(request, session)
+    note = await session.get(Note, note_id)
+    if not note:
+        raise HTTPException(status_code=404, detail="Note not found")
+    if not _can_access_note(user, note):
+        raise HTTPException(status_code=403, detail="Forbidden")
+    return user, note
+
+
+def _check_if_match(request: Request, note: Note) -> None:
+    header = request.headers.get("if-match")
+    if header is not None and not _etag_matches(header, _note_etag(note)):
+        raise HTTPException(status_code=412, detail="Note was modified")
+
+
+def _if_match_version(request: Request, note_id: int) -> int | None:
+    # The version named by If-Match; None when absent or "*"
+    header = request.headers.get("if-match")
+    if header is None:
+        return None
+    prefix = f'"{note_id}-'
+    for candidate in header.split(","):
+        candidate = candidate.strip().removeprefix("W/")
+        if candidate == "*":
+            return None
+        number = candidate.removeprefix(prefix).removesuffix('"')
+        if candidate.startswith(prefix) and number.isdigit():
+            return int(number)
+    # Not an ETag of this note: no version matches
+    return 0
+
+
+def _clean_title(title: str) -> str:
+    title_clean = title.strip()
+    if not title_clean:
+        raise HTTPException(status_code=422, detail="Title must not be empty")
+    return title_clean
+
+
+@app.get("/api/notes")
+async def api_list_notes(
+    request: Request,
+    q: str | None = None,
+    archived: int = 0,
+    cursor: str | None = None,
+    limit: int = NOTES_PAGE_SIZE,
+    session: DbSession = Depends(session_dep),
+):
+    user = await _require_api_user(request, session)
+    page_size = max(1, min(limit, NOTES_PAGE_SIZE_MAX))
+    page = await _list_notes(session, user, (q or "").strip(), archived == 1, cursor, page_size)
+
+    items = []
+    for note in page.notes:
+        item = {
+            "id": note.id,
+            "title": note.title,
+            "pinned": bool(note.pinned),
+            "archived": bool(note.archived),
+            "created_at": note.created_at.isoformat() + "Z",
+            "updated_at": note.updated_at.isoformat() + "Z",
+            "version": note.version,
+            "etag": _note_etag(note),
+        }
+        if note.id in page.snippets:
+            item["snippet"] = str(page.snippets[note.id])
+        else:
+            item["excerpt"] = page.excerpts.get(note.id, "")
+            item["truncated"] = note.id in page.truncated
+        items.append(item)
+
+    # The page is unchanged iff the same notes come back with the same versions
+    digest = hashlib.sha1(
+        json.dumps([[item["etag"] for item in items], page.next_cursor]).encode("utf-8")
+    ).hexdigest()
+    etag = f'W/"{digest}"'
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+    if _etag_matches(request.headers.get("if-none-match"), etag.removeprefix("W/")):
+        return Response(status_code=304, headers=headers)
+    return JSONResponse(content={"items": items, "next_cursor": page.next_cursor}, headers=headers)
+
+
+@app.post("/api/notes")
+async def api_create_note(
+    request: Request,
+    data: NoteCreate,
+    session: DbSession = Depends(session_dep),
+) -> JSONResponse:
+    user = await _require_api_user(request, session)
+    now = datetime.utcnow()
+    note = Note(
+        user_id=user.id,
+        title=_clean_title(data.title),
+        content=data.content,
+        pinned=data.pinned,
+        archived=False,
+        created_at=now,
+        updated_at=now,
+    )
+    session.add(note)
+    await _commit_note(session, note, live.OP_CREATE)
+    return _note_response(note, status_code=201, Location=f"/api/notes/{note.id}")
+
+
+@app.post("/api/notes/bulk")
+async def api_bulk_notes(request: Request, data: NoteBulk, session: DbSession = Depends(session_dep)) -> JSONResponse:
+    user = await _require_api_user(request, session)
+    ids = sorted(set(data.ids))
+    # One array parameter: "id = ANY(:ids)" is the same statement for any number of ids
+    id_match = Note.id == any_(bindparam("ids", ids, type_=ARRAY(Integer)))
+
+    # Access check for the whole batch in one query; rows stay locked until commit
+    owners = (await session.exec(select(Note.id, Note.user_id).where(id_match).with_for_update())).all()
+    found = {note_id for note_id, _ in owners}
+    missing = [note_id for note_id in ids if note_id not in found]
+    if missing:
+        await session.rollback()
+        raise HTTPException(status_code=404, detail={"message": "Notes not found", "ids": missing})
+    if not user.is_superuser and any(owner_id != user.id for _, owner_id in owners):
+        await session.rollback()
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    owner_of = dict(owners)
+    if data.action == "delete":
+        await session.exec(delete(Note).where(id_match))
+        changed: list[dict[str, Any]] = [{"id": note_id} for note_id in ids]
+        events = [(note_id, None) for note_id in ids]
+    else:
+        values: dict[str, Any] = {"updated_at": datetime.utcnow(), "version": Note.version + 1}
+        stmt = update(Note).where(id_match)
+        if data.action in ("pin", "unpin"):
+            values["pinned"] = data.action == "pin"
+            if data.action == "pin":
+                # Same rule as the single-note routes: archived notes stay unpinned
+                stmt = stmt.where(Note.archived == false())
+        else:
+            values["archived"] = data.action == "archive"
+            if data.action == "archive":
+                values["pinned"] = False
+        rows = (
+            await session.exec(
+                stmt.values(**values).returning(Note.id, Note.pinned, Note.archived, Note.updated_at, Note.version)
+            )
+        ).all()
+        changed = [
+            {
+                "id": note_id,
+                "pinned": bool(pinned),
+                "archived": bool(archived),
+                "updated_at": updated_at.isoformat() + "Z",
+                "version": version,
+                "etag": _version_etag(note_id, version),
+            }
+            for note_id, pinned, archived, updated_at, version in rows
+        ]
+        events = [(note_id, version) for note_id, _, _, _, version in rows]
+    by_owner: dict[int, list[tuple[int, int | None]]] = {}
+    for event in events:
+        by_owner.setdefault(owner_of[event[0]], []).append(event)
+    op = live.OP_DELETE if data.action == "delete" else live.OP_UPDATE
+    for owner_id, owner_events in by_owner.items():
+        await live.notify(session, owner_id, op, owner_events)
+    await session.commit()
+    await page_cache.invalidate_user(*{owner_id for _, owner_id in owners})
+    return JSONResponse(content={"action": data.action, "count": len(changed), "notes": changed})
+
+
+@app.get("/api/notes/{note_id}")
+async def api_get_note(note_id: int, request: Request, session: DbSession = Depends(session_dep)):
+    _, note = await _get_api_note(request, session, note_id)
+    etag = _note_etag(note)
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+    return _note_response(note)
+
+
+@app.patch("/api/notes/{note_id}")
+async def api_update_note(
+    note_id: int,
+    request: Request,
+    data: NoteUpdate,
+    session: DbSession = Depends(session_dep),
+) -> JSONResponse:
+    user = await _require_api_user(request, session)
+    values: dict[str, Any] = {}
+    if data.title is not None:
+        values["title"] = _clean_title(data.title)
+    if data.content is not None:
+        values["content"] = data.content
+    if data.archived is not None:
+        values["archived"] = data.archived
+        if data.archived:
+            values["pinned"] = False
+        elif data.pinned is not None:
+            values["pinned"] = data.pinned
+    elif data.pinned is not None:
+        # Archived notes stay unpinned
+        values["pinned"] = not_(Note.archived) if data.pinned else False
+
+    # If-Match wins over the body's version; a mismatch is 412 vs 409 respectively
+    version = _if_match_version(request, note_id)
+    conflict_status = 412
+    if version is None and data.version is not None:
+        version, conflict_status = data.version, 409
+    note, updated = await _update_note_versioned(session, user, note_id, version, values)
+    if not updated:
+        return _note_conflict(note, conflict_status)
+    return _note_response(note)
+
+
+# Autosave writes a note at most once per this many seconds. Enforced in the UPDATE itself
+# (the previous write must be at least this old), so it holds across processes; the
+# client keeps coalescing edits and retries after Retry-After.
+AUTOSAVE_MIN_INTERVAL = float(os.getenv("AUTOSAVE_MIN_INTERVAL") or 2)
+
+
+@app.post("/api/notes/{note_id}/autosave")
+async def api_autosave_note(
+    note_id: int,
+    request: Request,
+    data: NoteDelta,
+    session: DbSession = Depends(session_dep),
+) -> Response:
+    user = await _require_api_user(request, session)
+    values: dict[str, Any] = {}
+    if data.title is not None:
+        values["title"] = _clean_title(data.title)
+    if data.content is not None and data.patch is not None:
+        raise HTTPException(status_code=422, detail="Send either content or patch")
+    if data.content is not None:
+        values["content"] = data.content
+    elif data.patch is not None:
+        if data.patch.end < data.patch.start:
+            raise HTTPException(status_code=422, detail="Invalid patch range")
+        # Spliced in SQL: the unchanged part of a large note is never sent or loaded
+        values["content"] = func.concat(
+            func.left(Note.content, data.patch.start), data.patch.text, func.substr(Note.content, data.patch.end + 1)
+        )
+    if not values:
+        raise HTTPException(status_code=422, detail="Nothing to save")
+
+    now = datetime.utcnow()
+    stmt = update(Note).where(Note.id == note_id, Note.version == data.version)
+    if not user.is_superuser:
+        stmt = stmt.where(Note.user_id == user.id)
+    if AUTOSAVE_MIN_INTERVAL > 0:
+        # Only a save within the last interval holds the note back: updated_at can be in the
+        # future (imports keep the file's timestamps, clock skew)
+        stmt = stmt.where(
+            or_(Note.updated_at <= now - timedelta(seconds=AUTOSAVE_MIN_INTERVAL), Note.updated_at > now)
+        )
+    if data.patch is not None:
+        stmt = stmt.where(func.char_length(Note.content) >= data.patch.end)
+    content = data.content if data.content is not None else data.patch
+    previous = revisions.previous(content)
+    revision_count = revisions.counted(values, content)
+    stmt = (
+        stmt.where(Note.id == previous.c.previous_id)
+        .values(**values, updated_at=now, version=Note.version + 1, revision_count=revision_count)
+        .returning(Note.user_id, Note.version, Note.updated_at, Note.revision_count, *previous.c)
+        .execution_options(synchronize_session=False)
+    )
+    params = revisions.previous_params(note_id, values, content)
+    row = (await session.exec(stmt, params=params)).first()
+    if row is not None:
+        owner_id, version, updated_at, revision_count = row[:4]
+        if revision_count != row.previous_revision_count:
+            await revisions.record(session, revision_count, row, content)
+        await live.notify(session, owner_id, live.OP_UPDATE, [(note_id, version)], updated_at)
+        await session.commit()
+        await page_cache.invalidate_user(owner_id)
+        return Response(
+            status_code=204,
+            headers={"ETag": _version_etag(note_id, version), "X-Updated-At": updated_at.isoformat() + "Z"},
+        )
+
+    # Nothing matched: find out why without loading the content
+    state = (await session.exec(select(Note.user_id, Note.version, Note.updated_at).where(Note.id == note_id))).first()
+    if state is None:
+        raise HTTPException(status_code=404, detail="Note not found")
+    owner_id, version, updated_at = state
+    if not user.is_superuser and owner_id != user.id:
+        raise HTTPException(status_code=403, detail="Forbidden")
+    if version != data.version:
+        note = await session.get(Note, note_id)
+        return _note_conflict(note, 409)
+    wait = AUTOSAVE_MIN_INTERVAL - (now - updated_at).total_seconds()
+    if 0 < wait <= AUTOSAVE_MIN_INTERVAL:
+        return JSONResponse(
+            content={"detail": "Autosaving too often", "retry_after": round(wait, 3)},
+            status_code=429,
+            headers={"Retry-After": str(math.ceil(wait))},
+        )
+    raise HTTPException(status_code=422, detail="Patch does not fit the note")
+
+
+@app.delete("/api/notes/{note_id}")
+async def api_delete_note(note_id: int, request: Request, session: DbSession = Depends(session_dep)) -> Response:
+    _, note = await _get_api_note(request, session, note_id)
+    _check_if_match(request, note)
+    await session.delete(note)
+    await _commit_note(session, note, live.OP_DELETE)
+    return Response(status_code=204)
+
+
+@app.post("/api/notes/{note_id}/pin")
+async def api_toggle_pin(note_id: int, request: Request, session: DbSession = Depends(session_dep)) -> JSONResponse:
+    _, note = await _get_api_note(request, session, note_id)
+    _check_if_match(request, note)
+    _toggle_pinned(note)
+    session.add(note)
+    await _commit_note(session, note, live.OP_UPDATE)
+    return _note_response(note)
+
+
+@app.post("/api/notes/{note_id}/archive")
+async def api_toggle_archive(note_id: int, request: Request, session: DbSession = Depends(session_dep)) -> JSONResponse:
+    _, note = await _get_api_note(request, session, note_id)
+    _check_if_match(request, note)
+    _toggle_archived(note)
+    session.add(note)
+    await _commit_note(session, note, live.OP_UPDATE)
+    return _note_response(note)
+
+
+def _hasher_busy(request: Request, template: str, username: str) -> HTMLResponse:
+    return get_templates().TemplateResponse(
+        template,
+        {"request": request, "error": "Сервер перегружен, попробуйте ещё раз", "username": username},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.get("/login", response_class=HTMLResponse)
-def login_page(request: Request):
-    return templates.TemplateResponse("login.html", {"request": request})
+async def login_page(request: Request):
+    return get_templates().TemplateResponse("login.html", {"request": request})
 
 
 @app.post("/login")
-def login(
+async def login(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
-    session: Session = Depends(session_dep),
+    session: DbSession = Depends(session_dep),
 ):
     username_clean = username.strip()
-    user = session.exec(select(User).where(User.username == username_clean)).first()
-    if not user or not verify_password(password, user.password_hash):
-        return templates.TemplateResponse(
+    user = (await session.exec(select(User).where(User.username == username_clean))).first()
+    ok, new_hash = False, None
+    if user:
+        try:
+            ok, new_hash = await verify_and_update(password, user.password_hash)
+        except PasswordHasherBusy:
+            return _hasher_busy(request, "login.html", username_clean)
+    if not ok:
+        return get_templates().TemplateResponse(
             "login.html",
             {"request": request, "error": "Неверный логин или пароль", "username": username_clean},
             status_code=400,
         )
+    if new_hash:
+        # Stored hash uses fewer rounds than PASSWORD_HASH_ROUNDS
+        user.password_hash = new_hash
+        session.add(user)
+        await session.commit()
+        user_cache.invalidate(user.id)
     request.session["user_id"] = user.id
     return RedirectResponse(url="/", status_code=303)
 
 
 @app.get("/register", response_class=HTMLResponse)
-def register_page(request: Request):
-    return templates.TemplateResponse("register.html", {"request": request})
+async def register_page(request: Request):
+    return get_templates().TemplateResponse("register.html", {"request": request})
 
 
 @app.post("/register")
-def register(
+async def register(
     request: Request,
     username: str = Form(...),
     password: str = Form(...),
-    session: Session = Depends(session_dep),
+    session: DbSession = Depends(session_dep),
 ):
     username_clean = username.strip()
     if len(username_clean) < 3:
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "register.html",
             {"request": request, "error": "Логин должен быть минимум 3 символа", "username": username_clean},
             status_code=400,
         )
     if len(password) < 4:
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "register.html",
             {"request": request, "error": "Пароль должен быть минимум 4 символа", "username": username_clean},
             status_code=400,
         )
 
-    existing = session.exec(select(User).where(User.username == username_clean)).first()
+    existing = (await session.exec(select(User).where(User.username == username_clean))).first()
     if existing:
-        return templates.TemplateResponse(
+        return get_templates().TemplateResponse(
             "register.html",
             {"request": request, "error": "Такой логин уже занят", "username": username_clean},
             status_code=400,
         )
 
-    user = User(username=username_clean, password_hash=hash_password(password), is_superuser=False)
+    try:
+        password_hash = await hash_password_async(password)
+    except PasswordHasherBusy:
+        return _hasher_busy(request, "register.html", username_clean)
+    user = User(username=username_clean, password_hash=password_hash, is_superuser=False)
     session.add(user)
-    session.commit()
+    await session.commit()
     request.session["user_id"] = user.id
     return RedirectResponse(url="/", status_code=303)
 
 
 @app.get("/logout")
-def logout(request: Request):
+async def logout(request: Request):
     try:
         request.session.clear()
     except Exception:
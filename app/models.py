@@ -1,8 +1,11 @@
 from __future__ import annotations
 
 from datetime import datetime
+from typing import Annotated, Any, Literal
 
-from sqlalchemy import Boolean, Column, String
+from pydantic import AfterValidator
+from sqlalchemy import Boolean, Column, Computed, ForeignKey, Index, Integer, LargeBinary, String, text
+from sqlalchemy.dialects.postgresql import JSONB, TSVECTOR
 from sqlmodel import SQLModel, Field
 
 
@@ -16,12 +19,155 @@ class User(SQLModel, table=True):
     created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
 
 
+# Bumped on every write. Also the mapper's version_id_col, so ORM flushes of a loaded note
+# are compare-and-set (UPDATE ... WHERE version = :loaded) and raise StaleDataError when
+# someone else wrote the row in between.
+_note_version = Column("version", Integer, nullable=False, server_default="1")
+
+
 class Note(SQLModel, table=True):
+    __mapper_args__ = {"version_id_col": _note_version}
+
     id: int | None = Field(default=None, primary_key=True)
-    user_id: int | None = Field(default=None, foreign_key="users.id", index=True)
-    title: str = Field(index=True, max_length=200)
+    user_id: int | None = Field(default=None, foreign_key="users.id")
+    title: str = Field(max_length=200)
     content: str = Field(default="")
-    pinned: bool = Field(default=False, index=True)
-    archived: bool = Field(default=False, index=True)
-    created_at: datetime = Field(default_factory=datetime.utcnow, index=True)
-    updated_at: datetime = Field(default_factory=datetime.utcnow, index=True)
+    pinned: bool = Field(default=False)
+    archived: bool = Field(default=False)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    updated_at: datetime = Field(default_factory=datetime.utcnow)
+    version: int = Field(default=1, sa_column=_note_version)
+    # Saves that changed the title or content, i.e. the note's rows in note_revision
+    revision_count: int = Field(default=0, sa_column=Column(Integer, nullable=False, server_default="0"))
+
+
+# Only indexes that a query uses (scripts.check_query_plans verifies the plans). The note
+# lists match the ordering (pinned DESC, updated_at DESC, id DESC) so keyset pagination
+# is a single index range scan; they are partial per view, per owner and for the
+# superuser view, and queries filter with a literal "archived" / "NOT archived".
+_listing_order = (
+    Note.__table__.c.pinned.desc(),
+    Note.__table__.c.updated_at.desc(),
+    Note.__table__.c.id.desc(),
+)
+Index("ix_note_user_active", Note.__table__.c.user_id, *_listing_order, postgresql_where=text("NOT archived"))
+Index("ix_note_user_archived", Note.__table__.c.user_id, *_listing_order, postgresql_where=text("archived"))
+Index("ix_note_active_listing", *_listing_order, postgresql_where=text("NOT archived"))
+Index("ix_note_archived_listing", *_listing_order, postgresql_where=text("archived"))
+# Export order, and the users foreign key lookup
+Index(
+    "ix_note_user_updated",
+    Note.__table__.c.user_id,
+    Note.__table__.c.updated_at.desc(),
+    Note.__table__.c.id.desc(),
+)
+
+# Full-text search document, maintained by Postgres. It is deliberately left unmapped
+# so regular note queries never load it; app.search queries it through the table.
+# The 'simple' config skips stemming, which suits mixed Russian/English notes.
+Note.__table__.append_column(
+    Column(
+        "search_vector",
+        TSVECTOR,
+        Computed(
+            text(
+                "setweight(to_tsvector('simple', coalesce(title, '')), 'A') || "
+                "setweight(to_tsvector('simple', coalesce(content, '')), 'B')"
+            ),
+            persisted=True,
+        ),
+    )
+)
+Index("ix_note_search_vector", Note.__table__.c.search_vector, postgresql_using="gin")
+
+
+class Job(SQLModel, table=True):
+    id: int | None = Field(default=None, primary_key=True)
+    user_id: int = Field(foreign_key="users.id", index=True)
+    kind: str = Field(max_length=20)
+    status: str = Field(default="queued", max_length=20)
+    params: dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSONB, nullable=False, server_default="{}"))
+    progress: dict[str, Any] = Field(default_factory=dict, sa_column=Column(JSONB, nullable=False, server_default="{}"))
+    result: dict[str, Any] | None = Field(default=None, sa_column=Column(JSONB, nullable=True))
+    error: str | None = Field(default=None)
+    created_at: datetime = Field(default_factory=datetime.utcnow)
+    started_at: datetime | None = Field(default=None)
+    finished_at: datetime | None = Field(default=None)
+    heartbeat_at: datetime | None = Field(default=None)
+
+
+# Claim order for workers: oldest queued job first.
+Index("ix_job_status_created_at", Job.__table__.c.status, Job.__table__.c.created_at)
+
+
+class JobFile(SQLModel, table=True):
+    # Job input (uploads) and output (exports), stored as ordered chunks.
+    __tablename__ = "job_file"
+
+    job_id: int = Field(sa_column=Column(Integer, ForeignKey("job.id", ondelete="CASCADE"), primary_key=True))
+    role: str = Field(sa_column=Column(String(10), primary_key=True))
+    seq: int = Field(sa_column=Column(Integer, primary_key=True, autoincrement=False))
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+
+class NoteRevision(SQLModel, table=True):
+    # The note as it was before a save replaced its title or content (app.revisions).
+    # data is a full snapshot or a splice that turns the next revision's content (or the
+    # note's current one) back into this one.
+    __tablename__ = "note_revision"
+
+    note_id: int = Field(sa_column=Column(Integer, ForeignKey("note.id", ondelete="CASCADE"), primary_key=True))
+    seq: int = Field(sa_column=Column(Integer, primary_key=True, autoincrement=False))
+    version: int
+    title: str = Field(max_length=200)
+    saved_at: datetime
+    snapshot: bool
+    compressed: bool
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False))
+
+
+def normalize_newlines(text: str) -> str:
+    # Note text is stored with LF line endings only. Browsers edit textareas as LF text (and
+    # autosave patch offsets are counted in it) but submit forms with CRLF.
+    return text.replace("\r\n", "\n").replace("\r", "\n") if "\r" in text else text
+
+
+NoteText = Annotated[str, AfterValidator(normalize_newlines)]
+
+
+class NoteCreate(SQLModel):
+    title: str = Field(max_length=200)
+    content: NoteText = ""
+    pinned: bool = False
+
+
+class NoteUpdate(SQLModel):
+    title: str | None = Field(default=None, max_length=200)
+    content: NoteText | None = None
+    pinned: bool | None = None
+    archived: bool | None = None
+    # Version the client edited; the update fails with 409 if the note has moved on
+    version: int | None = None
+
+
+class NotePatch(SQLModel):
+    # content[start:end] = text, positions in characters (code points)
+    start: int = Field(ge=0)
+    end: int = Field(ge=0)
+    text: NoteText = ""
+
+
+class NoteDelta(SQLModel):
+    # Autosave: only the changed fields, content either whole or as a patch
+    version: int
+    title: str | None = Field(default=None, max_length=200)
+    content: NoteText | None = None
+    patch: NotePatch | None = None
+
+
+BULK_MAX_IDS = 1000
+
+
+class NoteBulk(SQLModel):
+    ids: list[int] = Field(min_length=1, max_length=BULK_MAX_IDS)
+    action: Literal["pin", "unpin", "archive", "unarchive", "delete"]
@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import hashlib
+import json
+import logging
+import os
+import time
+from typing import Any, Protocol
+
+logger = logging.getLogger(__name__)
+
+# Rendered note-list pages, keyed by the owner's version counter: every write that can
+# change what a user sees bumps their counter (and the global one that superuser views
+# depend on), so stale entries are never read again and simply age out of the LRU.
+#
+# PAGE_CACHE_URL selects the backend: empty for the per-process LRU, redis://... for a
+# shared Redis (needs the `redis` package), "off" to disable. Writes made by another
+# process (e.g. `python -m scripts.worker`) only reach a per-process cache through
+# PAGE_CACHE_TTL, so run a shared backend in that setup.
+PAGE_CACHE_URL = (os.getenv("PAGE_CACHE_URL") or "").strip()
+PAGE_CACHE_MAX_BYTES = int(os.getenv("PAGE_CACHE_MAX_BYTES") or 32 * 1024 * 1024)
+PAGE_CACHE_TTL = int(os.getenv("PAGE_CACHE_TTL") or 300)
+
+_ALL_USERS = "*"
+
+
+class CacheBackend(Protocol):
+    name: str
+
+    async def get(self, key: str) -> bytes | None: ...
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None: ...
+
+    async def versions(self, scopes: list[str]) -> list[int]: ...
+
+    async def bump(self, scopes: list[str]) -> None: ...
+
+    def stats(self) -> dict[str, int]: ...
+
+
+class LocalBackend:
+    # Per-process LRU bounded by the total size of stored pages.
+    name = "local"
+
+    def __init__(self, max_bytes: int = PAGE_CACHE_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._entries: OrderedDict[str, tuple[float, bytes]] = OrderedDict()
+        self._bytes = 0
+        self._versions: dict[str, int] = {}
+
+    async def get(self, key: str) -> bytes | None:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry[0] <= time.monotonic():
+            self._drop(key)
+            return None
+        self._entries.move_to_end(key)
+        return entry[1]
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        if len(value) > self.max_bytes:
+            return
+        self._drop(key)
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._bytes += len(value)
+        while self._bytes > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+
+    async def versions(self, scopes: list[str]) -> list[int]:
+        return [self._versions.get(scope, 0) for scope in scopes]
+
+    async def bump(self, scopes: list[str]) -> None:
+        for scope in scopes:
+            self._versions[scope] = self._versions.get(scope, 0) + 1
+
+    def stats(self) -> dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self._bytes, "max_bytes": self.max_bytes}
+
+    def _drop(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[1])
+
+
+class RedisBackend:
+    # Shared between processes; eviction is left to Redis (set maxmemory-policy allkeys-lru).
+    name = "redis"
+
+    def __init__(self, url: str) -> None:
+        try:
+            from redis import asyncio as redis_asyncio
+        except ImportError:
+            raise RuntimeError("PAGE_CACHE_URL=redis://... requires the 'redis' package") from None
+        self._redis = redis_asyncio.Redis.from_url(url)
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._redis.get(f"notes:page:{key}")
+
+    async def set(self, key: str, value: bytes, ttl: int) -> None:
+        await self._redis.set(f"notes:page:{key}", value, ex=ttl)
+
+    async def versions(self, scopes: list[str]) -> list[int]:
+        values = await self._redis.mget([f"notes:ver:{scope}" for scope in scopes])
+        return [int(value or 0) for value in values]
+
+    async def bump(self, scopes: list[str]) -> None:
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for scope in scopes:
+                pipe.incr(f"notes:ver:{scope}")
+            await pipe.execute()
+
+    def stats(self) -> dict[str, int]:
+        return {}
+
+
+class PageCache:
+    def __init__(self, backend: CacheBackend | None, ttl: int = PAGE_CACHE_TTL) -> None:
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    async def key(self, user_id: int, is_superuser: bool, *parts: Any) -> str | None:
+        # None when caching is off or the backend is unavailable: render without caching.
+        if self.backend is None:
+            return None
+        scopes = [str(user_id), _ALL_USERS] if is_superuser else [str(user_id)]
+        try:
+            versions = await self.backend.versions(scopes)
+        except Exception:  # noqa: BLE001
+            self._failed("read versions")
+            return None
+        digest = hashlib.sha1(json.dumps(parts, default=str).encode("utf-8")).hexdigest()
+        return f"{user_id}:{'.'.join(map(str, versions))}:{digest}"
+
+    async def get(self, key: str | None) -> bytes | None:
+        if key is None or self.backend is None:
+            return None
+        try:
+            value = await self.backend.get(key)
+        except Exception:  # noqa: BLE001
+            self._failed("get")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    async def set(self, key: str | None, value: bytes) -> None:
+        if key is None or self.backend is None:
+            return
+        try:
+            await self.backend.set(key, value, self.ttl)
+        except Exception:  # noqa: BLE001
+            self._failed("set")
+
+    async def invalidate_user(self, *user_ids: int | None) -> None:
+        # Call after the write has committed.
+        if self.backend is None:
+            return
+        scopes = {str(user_id) for user_id in user_ids if user_id is not None}
+        scopes.add(_ALL_USERS)
+        self.invalidations += 1
+        try:
+            await self.backend.bump(sorted(scopes))
+        except Exception:  # noqa: BLE001
+            self._failed("invalidate")
+
+    def snapshot(self) -> dict[str, Any]:
+        total = self.hits + self.misses
+        data: dict[str, Any] = {
+            "backend": self.backend.name if self.backend is not None else "off",
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else 0.0,
+            "invalidations": self.invalidations,
+            "errors": self.errors,
+            "ttl": self.ttl,
+        }
+        if self.backend is not None:
+            data.update(self.backend.stats())
+        return data
+
+    def _failed(self, operation: str) -> None:
+        self.errors += 1
+        logger.warning("Page cache %s failed", operation, exc_info=True)
+
+
+def _make_backend(url: str) -> CacheBackend | None:
+    if url.lower() == "off" or PAGE_CACHE_MAX_BYTES <= 0:
+        return None
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        return RedisBackend(url)
+    if url:
+        raise RuntimeError(f"Unsupported PAGE_CACHE_URL: {url!r}")
+    return LocalBackend()
+
+
+page_cache = PageCache(_make_backend(PAGE_CACHE_URL))
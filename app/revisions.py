@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import json
+import os
+from typing import Any
+import zlib
+
+from sqlalchemy import bindparam, case, func, insert, null, or_
+from sqlalchemy.sql.expression import Subquery
+from sqlmodel import select
+
+from app.db import DbSession
+from app.models import Note, NotePatch, NoteRevision
+
+# Note history. Every save that changes a note's title or content inserts one
+# note_revision row holding the state it replaced, numbered by note.revision_count.
+# Most rows are reverse deltas: a splice that turns the next revision's content (the
+# note's current content for the newest one) back into this revision's. Every
+# REVISION_SNAPSHOT_EVERY-th row is a full copy instead, so rebuilding any revision
+# starts from the next snapshot (or the note itself) and applies fewer than that many
+# splices. Payloads are zlib-compressed when that makes them smaller.
+REVISION_SNAPSHOT_EVERY = max(1, int(os.getenv("REVISION_SNAPSHOT_EVERY") or 20))
+# Revisions listed on the edit page
+REVISIONS_SHOWN = 50
+
+
+# Built once per kind of save and reused with bind parameters (see previous_params()):
+# constructing these per request costs more than the extra INSERT itself
+_previous: dict[str, Subquery] = {}
+_counted: dict[tuple[str, ...], Any] = {}
+_insert = insert(NoteRevision)
+
+
+def _kind(content: str | NotePatch | None) -> str:
+    if isinstance(content, str):
+        return "text"
+    return "patch" if isinstance(content, NotePatch) else "none"
+
+
+def previous(content: str | NotePatch | None) -> Subquery:
+    # The note before the UPDATE that joins this (columns prefixed "previous_", to be
+    # returned alongside the updated row for record()). FOR UPDATE makes it the latest
+    # committed row even if another save got there first. `content` is what the save
+    # writes: a full text, a patch (only the replaced range is read back), or None when
+    # the content is unchanged; the whole old text is read only when a snapshot is due.
+    kind = _kind(content)
+    subquery = _previous.get(kind)
+    if subquery is None:
+        snapshot_due = (Note.revision_count + 1) % REVISION_SNAPSHOT_EVERY == 0
+        if kind == "text":
+            old, full = Note.content, null()
+        else:
+            if kind == "patch":
+                old = func.substr(Note.content, bindparam("previous_start"), bindparam("previous_length"))
+            else:
+                old = null()
+            full = case((snapshot_due, Note.content))
+        subquery = _previous[kind] = (
+            select(
+                Note.id.label("previous_id"),
+                Note.revision_count.label("previous_revision_count"),
+                Note.version.label("previous_version"),
+                Note.title.label("previous_title"),
+                Note.updated_at.label("previous_updated_at"),
+                old.label("previous_content"),
+                full.label("previous_full"),
+            )
+            .where(Note.id == bindparam("previous_note_id"))
+            .with_for_update()
+            .subquery("previous")
+        )
+    return subquery
+
+
+def counted(values: dict[str, Any], content: str | NotePatch | None) -> Any:
+    # SET expression for note.revision_count: one more when the title or content changes
+    # (for a patch: when the range it replaces differs from its text)
+    fields = tuple(field for field in ("title", "content") if field in values)
+    key = (*fields, _kind(content))
+    expression = _counted.get(key)
+    if expression is None:
+        changes = []
+        for field in fields:
+            old = getattr(Note, field)
+            if field == "content" and isinstance(content, NotePatch):
+                old = func.substr(Note.content, bindparam("previous_start"), bindparam("previous_length"))
+            changes.append(old != bindparam(f"previous_new_{field}"))
+        expression = Note.revision_count + case((or_(*changes), 1), else_=0) if changes else Note.revision_count
+        _counted[key] = expression
+    return expression
+
+
+def previous_params(note_id: int, values: dict[str, Any], content: str | NotePatch | None) -> dict[str, Any]:
+    # Bind values for previous(content) and counted(values, content), passed to execute
+    params: dict[str, Any] = {"previous_note_id": note_id}
+    if "title" in values:
+        params["previous_new_title"] = values["title"]
+    if isinstance(content, NotePatch):
+        params["previous_start"] = content.start + 1
+        params["previous_length"] = content.end - content.start
+        params["previous_new_content"] = content.text
+    elif "content" in values:
+        params["previous_new_content"] = values["content"]
+    return params
+
+
+def _common_prefix(a: str, b: str, limit: int) -> int:
+    # Binary search over slice comparisons: C-speed even for long notes
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[:mid] == b[:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid :] == b[len(b) - mid :]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def splice(new: str, old: str) -> tuple[int, int, str]:
+    # (start, end, text) such that new[:start] + text + new[end:] == old
+    prefix = _common_prefix(new, old, min(len(new), len(old)))
+    suffix = _common_suffix(new, old, min(len(new), len(old)) - prefix)
+    return prefix, len(new) - suffix, old[prefix : len(old) - suffix]
+
+
+def _pack(data: bytes) -> tuple[bool, bytes]:
+    packed = zlib.compress(data, 6)
+    return (True, packed) if len(packed) < len(data) else (False, data)
+
+
+def _unpack(compressed: bool, data: bytes) -> bytes:
+    return zlib.decompress(data) if compressed else data
+
+
+async def record(session: DbSession, seq: int, row: Any, content: str | NotePatch | None) -> None:
+    # One INSERT for a save that has just updated the note: seq is the new revision_count,
+    # row carries the columns of previous() and `content` is the value passed to it.
+    if seq % REVISION_SNAPSHOT_EVERY == 0:
+        text = row.previous_content if isinstance(content, str) else row.previous_full
+        snapshot, payload = True, text.encode("utf-8")
+    else:
+        if isinstance(content, str):
+            delta = splice(content, row.previous_content)
+        elif isinstance(content, NotePatch):
+            delta = (content.start, content.start + len(content.text), row.previous_content)
+        else:
+            delta = (0, 0, "")
+        snapshot, payload = False, json.dumps(delta, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    compressed, data = _pack(payload)
+    await session.exec(
+        _insert,
+        params={
+            "note_id": row.previous_id,
+            "seq": seq,
+            "version": row.previous_version,
+            "title": row.previous_title,
+            "saved_at": row.previous_updated_at,
+            "snapshot": snapshot,
+            "compressed": compressed,
+            "data": data,
+        },
+    )
+
+
+async def recent(session: DbSession, note_id: int, limit: int = REVISIONS_SHOWN) -> list[Any]:
+    # Newest first, without the payloads
+    stmt = (
+        select(NoteRevision.seq, NoteRevision.version, NoteRevision.title, NoteRevision.saved_at)
+        .where(NoteRevision.note_id == note_id)
+        .order_by(NoteRevision.seq.desc())
+        .limit(limit)
+    )
+    return list((await session.exec(stmt)).all())
+
+
+async def load(session: DbSession, note: Note, seq: int) -> tuple[NoteRevision, str] | None:
+    # The revision and its content: the next snapshot at or above seq (or the note's
+    # current content) with the splices down to seq applied, at most one chain's worth
+    top = -(-seq // REVISION_SNAPSHOT_EVERY) * REVISION_SNAPSHOT_EVERY
+    stmt = (
+        select(NoteRevision)
+        .where(NoteRevision.note_id == note.id, NoteRevision.seq >= seq, NoteRevision.seq <= top)
+        .order_by(NoteRevision.seq.desc())
+    )
+    rows = list((await session.exec(stmt)).all())
+    if not rows or rows[-1].seq != seq:
+        return None
+    content = note.content
+    for row in rows:
+        data = _unpack(row.compressed, row.data).decode("utf-8")
+        if row.snapshot:
+            content = data
+        else:
+            start, end, text = json.loads(data)
+            content = content[:start] + text + content[end:]
+    return rows[-1], content
+
@@ -0,0 +1,62 @@
+from __future__ import annotations
+
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import func, literal_column
+from sqlalchemy.sql.elements import ColumnElement
+
+from app.models import Note
+
+# Must match the config used by the generated note.search_vector column.
+SEARCH_CONFIG = literal_column("'simple'::regconfig")
+
+# Cap the number of terms so a pasted paragraph doesn't become a huge tsquery.
+MAX_TERMS = 16
+
+# Private-use code points as highlight markers: content is escaped first and only
+# then are the markers turned into <mark> tags, so note text can't inject HTML.
+_MARK_START = "\ue000"
+_MARK_STOP = "\ue001"
+_MARK_RE = re.compile(f"{_MARK_START}(.*?){_MARK_STOP}", re.DOTALL)
+_TOKEN_RE = re.compile(r"\w+")
+
+_HEADLINE_OPTIONS = (
+    f"StartSel={_MARK_START}, StopSel={_MARK_STOP}, "
+    "MaxWords=30, MinWords=12, MaxFragments=2, FragmentDelimiter=\" … \""
+)
+
+search_vector = Note.__table__.c.search_vector
+
+
+def prefix_query(q: str) -> str | None:
+    # "план нед" -> "план:* & нед:*". Tokens are \w-only, so the result is always
+    # valid to_tsquery input.
+    tokens = _TOKEN_RE.findall(q.lower())[:MAX_TERMS]
+    if not tokens:
+        return None
+    return " & ".join(f"{t}:*" for t in tokens)
+
+
+def tsquery(raw: str) -> ColumnElement:
+    return func.to_tsquery(SEARCH_CONFIG, raw)
+
+
+def matches(query: ColumnElement) -> ColumnElement:
+    return search_vector.op("@@")(query)
+
+
+def rank(query: ColumnElement) -> ColumnElement:
+    return func.ts_rank(search_vector, query)
+
+
+def headline(query: ColumnElement) -> ColumnElement:
+    return func.ts_headline(SEARCH_CONFIG, Note.content, query, _HEADLINE_OPTIONS)
+
+
+def render_snippet(raw: str | None) -> Markup:
+    if not raw:
+        return Markup("")
+    escaped = str(escape(raw))
+    highlighted = _MARK_RE.sub(r"<mark>\1</mark>", escaped)
+    return Markup(highlighted.replace(_MARK_START, "").replace(_MARK_STOP, ""))
@@ -1,14 +1,107 @@
 from __future__ import annotations
 
-from passlib.context import CryptContext
+import asyncio
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+from typing import TYPE_CHECKING, Any, TypeVar
 
-# Use PBKDF2 to avoid bcrypt backend/version issues and the 72-byte bcrypt limit.
-_pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
+if TYPE_CHECKING:
+    from passlib.context import CryptContext
+
+# PBKDF2 iterations for new hashes. Stored hashes with fewer rounds are re-hashed on the
+# next successful login, so raising this upgrades existing users transparently.
+PASSWORD_HASH_ROUNDS = int(os.getenv("PASSWORD_HASH_ROUNDS") or 29000)
+# Hashing runs in a separate process pool so a login burst doesn't hold the GIL of the
+# web worker. 0 falls back to the default thread pool.
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS") or min(os.cpu_count() or 1, 4))
+# Hash/verify calls waiting or running per web process; beyond that callers get
+# PasswordHasherBusy instead of queueing behind a burst.
+PASSWORD_HASH_MAX_PENDING = int(os.getenv("PASSWORD_HASH_MAX_PENDING") or max(PASSWORD_HASH_WORKERS, 1) * 16)
+
+T = TypeVar("T")
+
+_pwd_context: CryptContext | None = None
+_executor: Executor | None = None
+_pending = 0
+
+
+class PasswordHasherBusy(Exception):
+    pass
+
+
+def _get_pwd_context() -> CryptContext:
+    # passlib and its scheme registry load on the first hash/verify, not at startup
+    global _pwd_context
+    if _pwd_context is None:
+        from passlib.context import CryptContext
+
+        # Use PBKDF2 to avoid bcrypt backend/version issues and the 72-byte bcrypt limit.
+        _pwd_context = CryptContext(
+            schemes=["pbkdf2_sha256"],
+            deprecated="auto",
+            pbkdf2_sha256__default_rounds=PASSWORD_HASH_ROUNDS,
+            pbkdf2_sha256__min_rounds=PASSWORD_HASH_ROUNDS,
+        )
+    return _pwd_context
 
 
 def hash_password(password: str) -> str:
-    return _pwd_context.hash(password)
+    return _get_pwd_context().hash(password)
 
 
 def verify_password(password: str, password_hash: str) -> bool:
-    return _pwd_context.verify(password, password_hash)
+    return _get_pwd_context().verify(password, password_hash)
+
+
+def _verify_and_update(password: str, password_hash: str) -> tuple[bool, str | None]:
+    try:
+        return _get_pwd_context().verify_and_update(password, password_hash)
+    except ValueError:
+        # Malformed or unknown hash format
+        return False, None
+
+
+def _get_executor() -> Executor | None:
+    global _executor
+    if _executor is None and PASSWORD_HASH_WORKERS > 0:
+        # spawn: forking a process that already runs threads (uvicorn, the DB pool) is unsafe
+        _executor = ProcessPoolExecutor(
+            max_workers=PASSWORD_HASH_WORKERS, mp_context=multiprocessing.get_context("spawn")
+        )
+    return _executor
+
+
+async def _run(func: Callable[..., T], *args: Any) -> T:
+    global _pending
+    if _pending >= PASSWORD_HASH_MAX_PENDING:
+        raise PasswordHasherBusy
+    _pending += 1
+    try:
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(_get_executor(), func, *args)
+        except BrokenProcessPool:
+            # A worker died (e.g. OOM-killed): start a fresh pool and retry once
+            shutdown_hasher()
+            return await loop.run_in_executor(_get_executor(), func, *args)
+    finally:
+        _pending -= 1
+
+
+async def hash_password_async(password: str) -> str:
+    return await _run(hash_password, password)
+
+
+async def verify_and_update(password: str, password_hash: str) -> tuple[bool, str | None]:
+    # Returns (ok, new_hash); new_hash is set when the stored hash should be replaced.
+    return await _run(_verify_and_update, password, password_hash)
+
+
+def shutdown_hasher() -> None:
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=True, cancel_futures=True)
+        _executor = None
@@ -122,13 +122,18 @@
     if (params.get("created") === "1") toast("Заметка создана", "success");
     if (params.get("updated") === "1") toast("Заметка обновлена", "success");
     if (params.get("deleted") === "1") toast("Заметка удалена", "danger");
+    if (params.get("restored") === "1") toast("Версия восстановлена", "success");
 
     if (params.has("imported")) {
       const n = Number(params.get("imported"));
       if (Number.isFinite(n) && n > 0) toast(`Импортировано: ${n}`, "success");
-      else toast("Импорт: нет новых заметок", "info");
+      else if (params.get("import_error") !== "1") toast("Импорт: нет новых заметок", "info");
     }
+    if (params.has("import_skipped")) toast(`Пропущено некорректных записей: ${params.get("import_skipped")}`, "info");
+    if (params.has("import_failed")) toast(`Не удалось сохранить: ${params.get("import_failed")}`, "danger");
     if (params.get("import_error") === "1") toast("Импорт не удался (проверь JSON)", "danger");
+    if (params.get("jobs_busy") === "1") toast("Слишком много задач в очереди, попробуй позже", "danger");
+    if (params.get("conflict") === "1") toast("Заметку уже изменили — попробуй ещё раз", "danger");
 
     if (params.get("pinned") === "1") toast("Закреплено", "success");
     if (params.get("unpinned") === "1") toast("Откреплено", "info");
@@ -139,24 +144,34 @@
       params.has("created") ||
       params.has("updated") ||
       params.has("deleted") ||
+      params.has("restored") ||
       params.has("pinned") ||
       params.has("unpinned") ||
       params.has("archived_action") ||
       params.has("unarchived_action") ||
       params.has("imported") ||
-      params.has("import_error")
+      params.has("import_skipped") ||
+      params.has("import_failed") ||
+      params.has("import_error") ||
+      params.has("jobs_busy") ||
+      params.has("conflict")
     ) {
       // Clean URL without reloading
       const url = new URL(window.location.href);
       url.searchParams.delete("created");
       url.searchParams.delete("updated");
       url.searchParams.delete("deleted");
+      url.searchParams.delete("restored");
       url.searchParams.delete("pinned");
       url.searchParams.delete("unpinned");
       url.searchParams.delete("archived_action");
       url.searchParams.delete("unarchived_action");
       url.searchParams.delete("imported");
+      url.searchParams.delete("import_skipped");
+      url.searchParams.delete("import_failed");
       url.searchParams.delete("import_error");
+      url.searchParams.delete("jobs_busy");
+      url.searchParams.delete("conflict");
       window.history.replaceState({}, "", url);
     }
   }
@@ -177,8 +192,8 @@
     });
   }
 
-  function initLocalTime() {
-    qsa("time[data-utc]").forEach((t) => {
+  function initLocalTime(root = document) {
+    qsa("time[data-utc]", root).forEach((t) => {
       const raw = t.getAttribute("data-utc");
       if (!raw) return;
       const d = new Date(raw);
@@ -211,13 +226,24 @@
     ta.remove();
   }
 
-  function initCopyButtons() {
-    qsa("button[data-copy-payload]").forEach((btn) => {
+  async function fetchNote(noteId) {
+    // no-cache: revalidate with If-None-Match, a 304 reuses the cached body
+    const resp = await fetch(`/api/notes/${noteId}`, {
+      headers: { Accept: "application/json" },
+      cache: "no-cache",
+    });
+    if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+    return resp.json();
+  }
+
+  function initCopyButtons(root = document) {
+    qsa("button[data-copy-note]", root).forEach((btn) => {
       btn.addEventListener("click", async () => {
         try {
-          const payload = JSON.parse(btn.getAttribute("data-copy-payload") || "{}");
-          const title = (payload.title || "").toString().trim();
-          const content = (payload.content || "").toString();
+          // Cards only carry an excerpt; copy the full note
+          const note = await fetchNote(btn.getAttribute("data-copy-note"));
+          const title = (note.title || "").toString().trim();
+          const content = (note.content || "").toString();
           const text = content ? `${title}\n\n${content}` : title;
           await writeClipboard(text);
           toast("Скопировано в буфер", "success");
@@ -228,6 +254,633 @@
     });
   }
 
+  function initExpandButtons(root = document) {
+    qsa("button[data-expand-note]", root).forEach((btn) => {
+      btn.addEventListener("click", async () => {
+        if (btn.getAttribute("aria-busy") === "true") return;
+        btn.setAttribute("aria-busy", "true");
+        try {
+          const note = await fetchNote(btn.getAttribute("data-expand-note"));
+          const body = btn.closest("article")?.querySelector("[data-note-body]");
+          if (body) body.textContent = note.content || "";
+          btn.remove();
+        } catch (e) {
+          btn.removeAttribute("aria-busy");
+          toast("Не удалось загрузить заметку", "danger");
+        }
+      });
+    });
+  }
+
+  async function pollJob(jobId, onProgress) {
+    for (;;) {
+      const resp = await fetch(`/jobs/${jobId}`, {
+        headers: { Accept: "application/json" },
+        cache: "no-store",
+      });
+      if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+      const job = await resp.json();
+      if (job.status === "done" || job.status === "failed") return job;
+      onProgress?.(job);
+      await new Promise((resolve) => setTimeout(resolve, 1000));
+    }
+  }
+
+  async function initImportJob() {
+    const url = new URL(window.location.href);
+    const jobId = url.searchParams.get("import_job");
+    if (!jobId) return;
+    url.searchParams.delete("import_job");
+    window.history.replaceState({}, "", url);
+
+    toast("Импорт запущен…", "info");
+    try {
+      const job = await pollJob(jobId);
+      const result = job.result || {};
+      const params = new URLSearchParams();
+      params.set("imported", String(result.imported || 0));
+      if (result.skipped) params.set("import_skipped", String(result.skipped));
+      if (result.failed) params.set("import_failed", String(result.failed));
+      if (job.status === "failed") params.set("import_error", "1");
+      window.location.replace(`/?${params.toString()}`);
+    } catch (e) {
+      toast("Не удалось получить статус импорта", "danger");
+    }
+  }
+
+  async function sendNoteAction(card, action) {
+    const noteId = card.getAttribute("data-note-id");
+    const headers = { Accept: "application/json" };
+    const etag = card.getAttribute("data-etag");
+    if (etag) headers["If-Match"] = etag;
+    return fetch(action === "delete" ? `/api/notes/${noteId}` : `/api/notes/${noteId}/${action}`, {
+      method: action === "delete" ? "DELETE" : "POST",
+      headers,
+    });
+  }
+
+  // Changes this tab made itself; their live events are already applied. Keyed like the
+  // card ETag ("id-version"), deletes as "id-deleted".
+  const ownChanges = new Set();
+  const changeKey = (id, version) => (version == null ? `${id}-deleted` : `"${id}-${version}"`);
+
+  function adjustNotesCount(delta) {
+    const el = qs("[data-notes-count]");
+    const n = Number(el?.textContent);
+    if (el && Number.isFinite(n)) el.textContent = String(Math.max(0, n + delta));
+  }
+
+  function placePinnedCard(card, list) {
+    // List order is pinned first, then by updated_at: a just-updated card leads its group
+    if (card.getAttribute("data-pinned") === "1") {
+      list.prepend(card);
+      return;
+    }
+    const firstUnpinned = qsa("article[data-note-id]", list).find(
+      (el) => el !== card && el.getAttribute("data-pinned") !== "1"
+    );
+    const host = qs("[data-load-more-host]", list);
+    if (firstUnpinned) list.insertBefore(card, firstUnpinned);
+    else if (host) list.insertBefore(card, host);
+    else list.append(card);
+  }
+
+  function initNoteActions() {
+    const list = qs("[data-notes-list]");
+    if (!list) return;
+
+    // Pin/archive/delete via the JSON API without reloading the page; the plain form
+    // POST stays as the fallback when the request fails for any other reason.
+    list.addEventListener("submit", async (e) => {
+      const form = e.target.closest("form[data-note-action]");
+      if (!form || e.defaultPrevented) return;
+      const card = form.closest("article[data-note-id]");
+      if (!card) return;
+      e.preventDefault();
+      if (card.getAttribute("aria-busy") === "true") return;
+      card.setAttribute("aria-busy", "true");
+
+      const action = form.getAttribute("data-note-action");
+      let resp;
+      try {
+        resp = await sendNoteAction(card, action);
+      } catch (err) {
+        resp = null;
+      }
+      card.removeAttribute("aria-busy");
+      if (resp?.ok) {
+        const noteId = card.getAttribute("data-note-id");
+        ownChanges.add(action === "delete" ? changeKey(noteId, null) : resp.headers.get("ETag"));
+      }
+
+      if (resp && (resp.status === 412 || resp.status === 409)) {
+        toast("Заметка изменилась — обновляю список", "info");
+        window.location.reload();
+        return;
+      }
+      if (!resp || !resp.ok) {
+        form.submit();
+        return;
+      }
+
+      if (action === "delete") {
+        card.remove();
+        adjustNotesCount(-1);
+        toast("Заметка удалена", "danger");
+        return;
+      }
+
+      const note = await resp.json();
+      if (action === "archive") {
+        card.remove();
+        adjustNotesCount(-1);
+        toast(note.archived ? "Перемещено в архив" : "Возвращено из архива", note.archived ? "info" : "success");
+        return;
+      }
+
+      card.setAttribute("data-etag", resp.headers.get("ETag") || "");
+      card.setAttribute("data-pinned", note.pinned ? "1" : "0");
+      qs("[data-pinned-badge]", card)?.classList.toggle("hidden", !note.pinned);
+      const label = qs("[data-pin-label]", card);
+      if (label) label.textContent = note.pinned ? "Открепить" : "Закрепить";
+      const time = qs("time[data-utc]", card);
+      if (time) {
+        time.setAttribute("data-utc", note.updated_at);
+        initLocalTime(card);
+      }
+      qs("details[open]", card)?.removeAttribute("open");
+      placePinnedCard(card, list);
+      toast(note.pinned ? "Закреплено" : "Откреплено", note.pinned ? "success" : "info");
+    });
+  }
+
+  function initBulkActions() {
+    const list = qs("[data-notes-list]");
+    const bar = qs("[data-bulk-bar]");
+    if (!list || !bar) return;
+    const countEl = qs("[data-bulk-count]", bar);
+    const labels = {
+      pin: "Закреплено",
+      unpin: "Откреплено",
+      archive: "Перемещено в архив",
+      unarchive: "Возвращено из архива",
+      delete: "Удалено",
+    };
+
+    const selected = () => qsa("input[data-select-note]:checked", list);
+    const refresh = () => {
+      const n = selected().length;
+      if (countEl) countEl.textContent = String(n);
+      bar.classList.toggle("hidden", n === 0);
+    };
+
+    list.addEventListener("change", (e) => {
+      if (e.target.matches("input[data-select-note]")) refresh();
+    });
+    qs("[data-bulk-select-all]", bar)?.addEventListener("click", () => {
+      qsa("input[data-select-note]", list).forEach((cb) => (cb.checked = true));
+      refresh();
+    });
+    qs("[data-bulk-clear]", bar)?.addEventListener("click", () => {
+      selected().forEach((cb) => (cb.checked = false));
+      refresh();
+    });
+
+    qsa("button[data-bulk-action]", bar).forEach((btn) => {
+      btn.addEventListener("click", async () => {
+        const action = btn.getAttribute("data-bulk-action");
+        const boxes = selected();
+        if (!boxes.length) return;
+        if (action === "delete" && !confirm(`Удалить заметки: ${boxes.length}?`)) return;
+        if (bar.getAttribute("aria-busy") === "true") return;
+        bar.setAttribute("aria-busy", "true");
+
+        try {
+          const resp = await fetch("/api/notes/bulk", {
+            method: "POST",
+            headers: { "Content-Type": "application/json", Accept: "application/json" },
+            body: JSON.stringify({ ids: boxes.map((cb) => Number(cb.value)), action }),
+          });
+          if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+          const result = await resp.json();
+          result.notes.forEach((note) => ownChanges.add(note.etag || changeKey(note.id, null)));
+
+          const cards = new Map(boxes.map((cb) => [cb.value, cb.closest("article[data-note-id]")]));
+          if (action === "delete" || action === "archive" || action === "unarchive") {
+            cards.forEach((card) => card?.remove());
+            adjustNotesCount(-cards.size);
+          } else {
+            // Bottom-up in list order, so the selected cards keep their relative order
+            const notes = new Map(result.notes.map((note) => [String(note.id), note]));
+            boxes
+              .slice()
+              .reverse()
+              .forEach((cb) => {
+                const note = notes.get(cb.value);
+                const card = cards.get(cb.value);
+                if (!note || !card) return;
+                card.setAttribute("data-etag", note.etag);
+                card.setAttribute("data-pinned", note.pinned ? "1" : "0");
+                qs("[data-pinned-badge]", card)?.classList.toggle("hidden", !note.pinned);
+                const label = qs("[data-pin-label]", card);
+                if (label) label.textContent = note.pinned ? "Открепить" : "Закрепить";
+                const time = qs("time[data-utc]", card);
+                if (time) time.setAttribute("data-utc", note.updated_at);
+                placePinnedCard(card, list);
+              });
+            initLocalTime(list);
+            selected().forEach((cb) => (cb.checked = false));
+          }
+          refresh();
+          toast(`${labels[action]}: ${result.count}`, action === "delete" ? "danger" : "success");
+        } catch (e) {
+          toast("Не удалось выполнить действие", "danger");
+        } finally {
+          bar.removeAttribute("aria-busy");
+        }
+      });
+    });
+  }
+
+  // Autosave: wait for a pause in typing, but save at least every AUTOSAVE_MAX_WAIT while
+  // typing continues. Long contents go as a single splice of the changed range.
+  const AUTOSAVE_DELAY = 1000;
+  const AUTOSAVE_MAX_WAIT = 5000;
+  const AUTOSAVE_RETRY = 5000;
+  const AUTOSAVE_PATCH_MIN = 2000;
+
+  function contentPatch(before, after) {
+    const max = Math.min(before.length, after.length);
+    let start = 0;
+    while (start < max && before.charCodeAt(start) === after.charCodeAt(start)) start++;
+    let end = 0;
+    while (
+      end < max - start &&
+      before.charCodeAt(before.length - 1 - end) === after.charCodeAt(after.length - 1 - end)
+    )
+      end++;
+    // The server counts code points: never cut a surrogate pair in half
+    const isHigh = (code) => code >= 0xd800 && code <= 0xdbff;
+    const isLow = (code) => code >= 0xdc00 && code <= 0xdfff;
+    if (start > 0 && isHigh(before.charCodeAt(start - 1))) start--;
+    if (end > 0 && isLow(before.charCodeAt(before.length - end))) end--;
+    const codePoints = (str) => Array.from(str).length;
+    return {
+      start: codePoints(before.slice(0, start)),
+      end: codePoints(before.slice(0, before.length - end)),
+      text: after.slice(start, after.length - end),
+    };
+  }
+
+  function initAutosave(form, onConflict) {
+    const noteId = form.getAttribute("data-note-id");
+    const version = qs("input[name='version']", form);
+    const title = qs("input[name='title']", form);
+    const content = qs("textarea[name='content']", form);
+    const status = qs("[data-autosave-status]");
+    if (!noteId || !version || !title || !content) return null;
+
+    let saved = { title: title.value, content: content.value };
+    let timer = null;
+    let firstChange = 0;
+    let inFlight = null;
+    let stopped = false;
+
+    const setStatus = (text) => {
+      if (status) status.textContent = text;
+    };
+    const dirty = () => title.value !== saved.title || content.value !== saved.content;
+    const schedule = (delay) => {
+      clearTimeout(timer);
+      timer = setTimeout(save, delay);
+    };
+
+    async function send(body, keepalive) {
+      const payload = JSON.stringify(body);
+      try {
+        return await fetch(`/api/notes/${noteId}/autosave`, {
+          method: "POST",
+          headers: { "Content-Type": "application/json", Accept: "application/json" },
+          body: payload,
+          // Lets the last save outlive a closing tab (browsers cap keepalive bodies at 64 KB)
+          keepalive: keepalive && payload.length < 60000,
+        });
+      } catch (e) {
+        return null;
+      }
+    }
+
+    async function save(keepalive = false) {
+      clearTimeout(timer);
+      if (stopped || inFlight || !dirty()) return;
+      const sent = { title: title.value, content: content.value };
+      const body = { version: Number(version.value) };
+      if (sent.title !== saved.title) {
+        // An empty title can't be saved; keep it pending until there is one
+        if (sent.title.trim()) body.title = sent.title;
+        else sent.title = saved.title;
+      }
+      if (sent.content !== saved.content) {
+        if (sent.content.length < AUTOSAVE_PATCH_MIN) body.content = sent.content;
+        else body.patch = contentPatch(saved.content, sent.content);
+      }
+      if (!("title" in body) && !("content" in body) && !("patch" in body)) return;
+
+      firstChange = 0;
+      setStatus("Сохраняю…");
+      inFlight = send(body, keepalive);
+      const resp = await inFlight;
+      inFlight = null;
+
+      if (resp && resp.status === 204) {
+        saved = sent;
+        const match = (resp.headers.get("ETag") || "").match(/-(\d+)"$/);
+        if (match) version.value = match[1];
+        const updated = resp.headers.get("X-Updated-At");
+        const time = qs("time[data-note-updated]");
+        if (updated && time) {
+          time.setAttribute("data-utc", updated);
+          initLocalTime(time.parentElement);
+        }
+        setStatus(dirty() ? "Есть несохранённые изменения" : "Все изменения сохранены");
+        if (dirty()) schedule(AUTOSAVE_DELAY);
+        return;
+      }
+      if (resp && resp.status === 429) {
+        // Server-side limit per note: the edits keep accumulating and go in one request
+        const data = await resp.json().catch(() => ({}));
+        const seconds = Number(data.retry_after) || Number(resp.headers.get("Retry-After")) || 1;
+        setStatus("Есть несохранённые изменения");
+        schedule(Math.ceil(seconds * 1000));
+        return;
+      }
+      if (resp && resp.status === 409) {
+        stopped = true;
+        setStatus("Автосохранение приостановлено");
+        onConflict((await resp.json()).note);
+        return;
+      }
+      setStatus("Не удалось сохранить, повторю позже");
+      schedule(AUTOSAVE_RETRY);
+    }
+
+    const onInput = () => {
+      if (stopped) return;
+      const now = Date.now();
+      if (!firstChange) firstChange = now;
+      schedule(Math.max(0, Math.min(AUTOSAVE_DELAY, firstChange + AUTOSAVE_MAX_WAIT - now)));
+      setStatus("Есть несохранённые изменения");
+    };
+    title.addEventListener("input", onInput);
+    content.addEventListener("input", onInput);
+    document.addEventListener("visibilitychange", () => {
+      if (document.visibilityState === "hidden") save(true);
+    });
+
+    return {
+      // Wait for a save in progress, so a form submit carries the version it produced
+      idle: () => inFlight || Promise.resolve(),
+      stop: () => {
+        stopped = true;
+        clearTimeout(timer);
+      },
+      // Continue from the given saved state (after a conflict was resolved)
+      rebase: (note) => {
+        saved = { title: note.title, content: note.content };
+        version.value = String(note.version);
+        stopped = false;
+        if (dirty()) onInput();
+        else setStatus("");
+      },
+    };
+  }
+
+  function initNoteEditor() {
+    const form = qs("form[data-note-editor]");
+    const panel = qs("[data-conflict-panel]");
+    if (!form || !panel) return;
+    const version = qs("input[name='version']", form);
+    const title = qs("input[name='title']", form);
+    const content = qs("textarea[name='content']", form);
+
+    const savedNote = () => ({
+      title: qs("[data-conflict-title]", panel).textContent,
+      content: qs("[data-conflict-content]", panel).textContent,
+      version: Number(version?.value),
+    });
+    const showConflict = (note) => {
+      // The draft stays in the form; the hidden version moves to the saved one, so the
+      // next submit is an explicit overwrite
+      qs("[data-conflict-title]", panel).textContent = note.title || "";
+      qs("[data-conflict-content]", panel).textContent = note.content || "";
+      if (version) version.value = String(note.version);
+      panel.classList.remove("hidden");
+      panel.scrollIntoView({ block: "nearest", behavior: "smooth" });
+    };
+
+    const autosave = initAutosave(form, (note) => showConflict(note));
+    // Restoring replaces the version autosave has reached, not the one the page loaded with
+    qsa("form[data-restore-revision]").forEach((restore) => {
+      restore.addEventListener("submit", () => {
+        const field = qs("input[name='version']", restore);
+        if (field && version) field.value = version.value;
+      });
+    });
+    // Server-rendered conflict page: nothing autosaves until the user picks a version
+    if (autosave && !panel.classList.contains("hidden")) autosave.stop();
+
+    qs("[data-conflict-theirs]", panel)?.addEventListener("click", () => {
+      const note = savedNote();
+      if (title) title.value = note.title;
+      if (content) {
+        content.value = note.content;
+        autosize(content);
+      }
+      autosave?.rebase(note);
+      panel.classList.add("hidden");
+      toast("Загружена сохранённая версия", "info");
+    });
+    qs("[data-conflict-mine]", panel)?.addEventListener("click", () => {
+      autosave?.rebase(savedNote());
+      panel.classList.add("hidden");
+      form.requestSubmit ? form.requestSubmit() : form.submit();
+    });
+
+    form.addEventListener("submit", async (e) => {
+      e.preventDefault();
+      if (form.getAttribute("aria-busy") === "true") return;
+      form.setAttribute("aria-busy", "true");
+      let resp;
+      try {
+        if (autosave) {
+          await autosave.idle();
+          autosave.stop();
+        }
+        resp = await fetch(form.action, {
+          method: "POST",
+          headers: { Accept: "application/json" },
+          body: new URLSearchParams(new FormData(form)),
+        });
+      } catch (err) {
+        resp = null;
+      }
+      form.removeAttribute("aria-busy");
+
+      if (resp && resp.status === 409) {
+        showConflict((await resp.json()).note);
+        return;
+      }
+      if (!resp || !resp.ok) {
+        // Plain POST; the server renders its own conflict page if needed
+        form.submit();
+        return;
+      }
+      window.location.assign("/?updated=1");
+    });
+  }
+
+  function initLoadMore() {
+    const list = qs("[data-notes-list]");
+    if (!list) return;
+
+    list.addEventListener("click", async (e) => {
+      const link = e.target.closest("a[data-load-more='1']");
+      if (!link) return;
+      e.preventDefault();
+      if (link.getAttribute("aria-busy") === "true") return;
+      link.setAttribute("aria-busy", "true");
+
+      try {
+        const url = new URL(link.href, window.location.href);
+        url.searchParams.set("partial", "1");
+        const resp = await fetch(url, { headers: { Accept: "text/html" } });
+        if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+
+        const tpl = document.createElement("template");
+        tpl.innerHTML = await resp.text();
+        initLocalTime(tpl.content);
+        initCopyButtons(tpl.content);
+        initExpandButtons(tpl.content);
+        const host = link.closest("[data-load-more-host]") || link;
+        host.replaceWith(tpl.content);
+      } catch (err) {
+        link.removeAttribute("aria-busy");
+        toast("Не удалось загрузить заметки", "danger");
+      }
+    });
+  }
+
+  // Live updates: the server pushes note changes made in other tabs and devices (SSE).
+  // Changed cards are re-fetched one by one; larger batches reload the page.
+  const LIVE_MAX_FETCHES = 20;
+
+  function initLiveUpdates() {
+    const list = qs("[data-notes-list]");
+    if (!list || !window.EventSource) return;
+    const params = new URLSearchParams(window.location.search);
+    const archivedView = params.get("archived") === "1";
+    // Search results are ranked by the query: only removals can be applied in place
+    const searching = Boolean((params.get("q") || "").trim());
+    const queue = [];
+    let running = false;
+
+    const cardOf = (id) => qs(`article[data-note-id="${id}"]`, list);
+
+    async function refreshCard(id) {
+      const resp = await fetch(`/notes/${id}/card`, { headers: { Accept: "text/html" }, cache: "no-store" });
+      const old = cardOf(id);
+      if (resp.status === 404 || resp.status === 403) {
+        if (old) {
+          old.remove();
+          adjustNotesCount(-1);
+        }
+        return;
+      }
+      if (!resp.ok) throw new Error(`HTTP ${resp.status}`);
+      const tpl = document.createElement("template");
+      tpl.innerHTML = (await resp.text()).trim();
+      const card = tpl.content.firstElementChild;
+      if (!card) return;
+      if ((card.getAttribute("data-archived") === "1") !== archivedView) {
+        if (old) {
+          old.remove();
+          adjustNotesCount(-1);
+        }
+        return;
+      }
+      initLocalTime(card);
+      initCopyButtons(card);
+      initExpandButtons(card);
+      if (old) {
+        const box = qs("input[data-select-note]", old);
+        const newBox = qs("input[data-select-note]", card);
+        if (box && newBox) newBox.checked = box.checked;
+        old.replaceWith(card);
+      } else {
+        adjustNotesCount(1);
+      }
+      placePinnedCard(card, list);
+    }
+
+    async function apply(event) {
+      if (event.op === "reload") {
+        window.location.reload();
+        return;
+      }
+      const stale = [];
+      (event.notes || []).forEach(([id, version]) => {
+        const key = changeKey(id, version);
+        if (ownChanges.delete(key)) return;
+        const card = cardOf(id);
+        if (version == null) {
+          if (card) {
+            card.remove();
+            adjustNotesCount(-1);
+          }
+          return;
+        }
+        if (searching || card?.getAttribute("data-etag") === key) return;
+        stale.push(id);
+      });
+      if (stale.length > LIVE_MAX_FETCHES) {
+        window.location.reload();
+        return;
+      }
+      for (const id of stale) await refreshCard(id);
+    }
+
+    async function drain() {
+      if (running) return;
+      running = true;
+      try {
+        while (queue.length) {
+          // Wait for in-flight actions of this tab (their results move and remove cards)
+          if (qs("[aria-busy='true']")) {
+            await new Promise((resolve) => setTimeout(resolve, 200));
+            continue;
+          }
+          await apply(queue.shift());
+        }
+      } catch (e) {
+        window.location.reload();
+      } finally {
+        running = false;
+      }
+    }
+
+    const source = new EventSource("/events");
+    source.addEventListener("notes", (e) => {
+      try {
+        queue.push(JSON.parse(e.data));
+      } catch (err) {
+        return;
+      }
+      drain();
+    });
+    // Events were missed (server restart, long disconnect): start over from the server
+    source.addEventListener("reset", () => window.location.reload());
+  }
+
   function initClearNewNote() {
     const btn = qs("button[data-clear-new-note='1']");
     if (!btn) return;
@@ -283,8 +936,15 @@
     initToastsFromQuery();
     initLocalTime();
     initCopyButtons();
+    initExpandButtons();
+    initNoteActions();
+    initBulkActions();
+    initNoteEditor();
+    initLoadMore();
+    initLiveUpdates();
     initClearNewNote();
     initImportJson();
+    initImportJob();
     initWeatherTashkent();
   });
 })();
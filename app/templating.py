@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import os
+import time
+from typing import Any
+
+from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache, Template
+
+from app.assets import has_asset, static_url
+from app.instrumentation import add_render_time
+
+TEMPLATES_DIR = "app/templates"
+# Compiled templates are kept here as marshalled bytecode, so a fresh process loads them
+# instead of parsing and compiling every template on its first render. Used only if the
+# directory exists: `python -m scripts.compile_templates` creates and fills it at build time.
+# Entries carry a checksum of the source, so an edited template is simply recompiled.
+TEMPLATE_CACHE_DIR = os.getenv("TEMPLATE_CACHE_DIR") or ".template_cache"
+
+
+class TimedTemplate(Template):
+    # Installed as the Jinja environment's template_class; includes render inside the
+    # outer template, so only top-level renders are timed.
+    def render(self, *args: Any, **kwargs: Any) -> str:
+        started = time.perf_counter()
+        try:
+            return super().render(*args, **kwargs)
+        finally:
+            add_render_time(time.perf_counter() - started)
+
+
+def create_templates() -> Jinja2Templates:
+    templates = Jinja2Templates(directory=TEMPLATES_DIR)
+    templates.env.template_class = TimedTemplate
+    templates.env.globals.update(static_url=static_url, has_asset=has_asset)
+    if os.path.isdir(TEMPLATE_CACHE_DIR):
+        templates.env.bytecode_cache = FileSystemBytecodeCache(TEMPLATE_CACHE_DIR)
+    return templates
+
+
+def compile_templates(templates: Jinja2Templates) -> list[str]:
+    names = templates.env.list_templates(extensions=["html"])
+    for name in names:
+        templates.env.get_template(name)
+    return names
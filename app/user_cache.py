@@ -0,0 +1,56 @@
+from __future__ import annotations
+
+from collections import OrderedDict
+import os
+import threading
+import time
+
+from app.models import User
+
+# The session cookie only carries user_id; the User row behind it is cached per process
+# for USER_CACHE_TTL seconds. Changes made here invalidate immediately; changes made by
+# another process (or directly in the database) are picked up once the entry expires.
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL") or 30)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE") or 1024)
+
+
+class UserCache:
+    def __init__(self, ttl: float = USER_CACHE_TTL, maxsize: int = USER_CACHE_SIZE) -> None:
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries: OrderedDict[int, tuple[float, User]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> User | None:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def put(self, user: User) -> User:
+        # Cache a detached copy: the loaded instance belongs to the request's session and
+        # would be expired by a rollback there. Callers treat the result as read-only.
+        principal = User(**user.model_dump())
+        if self.ttl <= 0 or self.maxsize <= 0:
+            return principal
+        with self._lock:
+            self._entries[principal.id] = (time.monotonic() + self.ttl, principal)
+            self._entries.move_to_end(principal.id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return principal
+
+    def invalidate(self, user_id: int | None = None) -> None:
+        with self._lock:
+            if user_id is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(user_id, None)
+
+
+user_cache = UserCache()
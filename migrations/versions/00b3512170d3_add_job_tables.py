@@ -0,0 +1,61 @@
+"""add job tables
+
+Revision ID: 00b3512170d3
+Revises: f0d468a8bf45
+Create Date: 2026-10-17 14:21:47.530912
+
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = "00b3512170d3"
+down_revision: Union[str, None] = "f0d468a8bf45"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "job",
+        sa.Column("id", sa.Integer(), nullable=False),
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("kind", sa.String(length=20), nullable=False),
+        sa.Column("status", sa.String(length=20), nullable=False),
+        sa.Column("params", postgresql.JSONB(), server_default="{}", nullable=False),
+        sa.Column("progress", postgresql.JSONB(), server_default="{}", nullable=False),
+        sa.Column("result", postgresql.JSONB(), nullable=True),
+        sa.Column("error", sa.String(), nullable=True),
+        sa.Column("created_at", sa.DateTime(), nullable=False),
+        sa.Column("started_at", sa.DateTime(), nullable=True),
+        sa.Column("finished_at", sa.DateTime(), nullable=True),
+        sa.Column("heartbeat_at", sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"]),
+        sa.PrimaryKeyConstraint("id"),
+    )
+    op.create_index(op.f("ix_job_user_id"), "job", ["user_id"], unique=False)
+    op.create_index("ix_job_status_created_at", "job", ["status", "created_at"], unique=False)
+
+    op.create_table(
+        "job_file",
+        sa.Column("job_id", sa.Integer(), nullable=False),
+        sa.Column("role", sa.String(length=10), nullable=False),
+        sa.Column("seq", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(["job_id"], ["job.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("job_id", "role", "seq"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("job_file")
+    op.drop_index("ix_job_status_created_at", table_name="job")
+    op.drop_index(op.f("ix_job_user_id"), table_name="job")
+    op.drop_table("job")
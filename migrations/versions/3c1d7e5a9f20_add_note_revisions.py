@@ -0,0 +1,45 @@
+"""add note revisions
+
+Revision ID: 3c1d7e5a9f20
+Revises: de02b079a5ae
+Create Date: 2026-10-17 09:12:40.118302
+
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "3c1d7e5a9f20"
+down_revision: Union[str, None] = "de02b079a5ae"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Constant default: catalog-only on Postgres 11+. Existing notes start without history;
+    # their first save records the content it replaces.
+    op.add_column("note", sa.Column("revision_count", sa.Integer(), nullable=False, server_default="0"))
+    op.create_table(
+        "note_revision",
+        sa.Column("note_id", sa.Integer(), nullable=False),
+        sa.Column("seq", sa.Integer(), autoincrement=False, nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.Column("title", sa.String(length=200), nullable=False),
+        sa.Column("saved_at", sa.DateTime(), nullable=False),
+        sa.Column("snapshot", sa.Boolean(), nullable=False),
+        sa.Column("compressed", sa.Boolean(), nullable=False),
+        sa.Column("data", sa.LargeBinary(), nullable=False),
+        sa.ForeignKeyConstraint(["note_id"], ["note.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("note_id", "seq"),
+    )
+
+
+def downgrade() -> None:
+    op.drop_table("note_revision")
+    op.drop_column("note", "revision_count")
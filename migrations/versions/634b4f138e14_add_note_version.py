@@ -0,0 +1,31 @@
+"""add note version
+
+Revision ID: 634b4f138e14
+Revises: 00b3512170d3
+Create Date: 2026-10-17 06:23:22.270149
+
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "634b4f138e14"
+down_revision: Union[str, None] = "00b3512170d3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # A constant default makes this a catalog-only change on Postgres 11+, no table rewrite.
+    # The default stays: bulk inserts (importer) rely on it.
+    op.add_column("note", sa.Column("version", sa.Integer(), nullable=False, server_default="1"))
+
+
+def downgrade() -> None:
+    op.drop_column("note", "version")
@@ -0,0 +1,48 @@
+"""normalize note newlines
+
+Revision ID: 7b2e4c1d8a36
+Revises: 3c1d7e5a9f20
+Create Date: 2026-10-17 15:40:21.503918
+
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = "7b2e4c1d8a36"
+down_revision: Union[str, None] = "3c1d7e5a9f20"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Notes saved through the HTML forms before content was normalized carry CRLF line
+    # endings, which autosave patch offsets (counted in the browser's LF text) don't match.
+    # The old text is kept as a history snapshot: the newest revision's splice was made
+    # against it. The version stays, so open editors (already LF) keep saving.
+    op.execute(
+        """
+        INSERT INTO note_revision (note_id, seq, version, title, saved_at, snapshot, compressed, data)
+        SELECT id, revision_count + 1, version, title, updated_at, true, false, convert_to(content, 'UTF8')
+        FROM note
+        WHERE strpos(content, chr(13)) > 0
+        """
+    )
+    op.execute(
+        """
+        UPDATE note
+        SET content = replace(replace(content, chr(13) || chr(10), chr(10)), chr(13), chr(10)),
+            revision_count = revision_count + 1
+        WHERE strpos(content, chr(13)) > 0
+        """
+    )
+
+
+def downgrade() -> None:
+    # The previous line endings stay in the history snapshots
+    pass
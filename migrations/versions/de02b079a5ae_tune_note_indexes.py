@@ -0,0 +1,62 @@
+"""tune note indexes
+
+Revision ID: de02b079a5ae
+Revises: 634b4f138e14
+Create Date: 2026-10-17 06:28:34.777363
+
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "de02b079a5ae"
+down_revision: Union[str, None] = "634b4f138e14"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+_LISTING_ORDER = [sa.text("pinned DESC"), sa.text("updated_at DESC"), sa.text("id DESC")]
+
+# Single-column indexes no query uses (the booleans can't narrow anything down), each
+# costing a write on every insert and every non-HOT update.
+_DROPPED = ["user_id", "title", "pinned", "archived", "created_at", "updated_at"]
+
+
+def upgrade() -> None:
+    # Note lists: one partial index per view, so each holds only the rows that view shows.
+    # Queries must filter with literal "archived" / "NOT archived" to match the predicates.
+    op.create_index(
+        "ix_note_user_active", "note", ["user_id", *_LISTING_ORDER], postgresql_where=sa.text("NOT archived")
+    )
+    op.create_index(
+        "ix_note_user_archived", "note", ["user_id", *_LISTING_ORDER], postgresql_where=sa.text("archived")
+    )
+    # Superuser lists across all owners
+    op.create_index("ix_note_active_listing", "note", _LISTING_ORDER, postgresql_where=sa.text("NOT archived"))
+    op.create_index("ix_note_archived_listing", "note", _LISTING_ORDER, postgresql_where=sa.text("archived"))
+    # Export order; also serves the users FK check
+    op.create_index("ix_note_user_updated", "note", ["user_id", sa.text("updated_at DESC"), sa.text("id DESC")])
+
+    op.drop_index("ix_note_user_listing", table_name="note")
+    op.drop_index("ix_note_listing", table_name="note")
+    for column in _DROPPED:
+        op.drop_index(f"ix_note_{column}", table_name="note")
+
+
+def downgrade() -> None:
+    for column in _DROPPED:
+        op.create_index(f"ix_note_{column}", "note", [column])
+    op.create_index("ix_note_listing", "note", ["archived", *_LISTING_ORDER])
+    op.create_index("ix_note_user_listing", "note", ["user_id", "archived", *_LISTING_ORDER])
+
+    op.drop_index("ix_note_user_updated", table_name="note")
+    op.drop_index("ix_note_archived_listing", table_name="note")
+    op.drop_index("ix_note_active_listing", table_name="note")
+    op.drop_index("ix_note_user_archived", table_name="note")
+    op.drop_index("ix_note_user_active", table_name="note")
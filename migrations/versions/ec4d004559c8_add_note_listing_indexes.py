@@ -0,0 +1,42 @@
+"""add note listing indexes
+
+Revision ID: ec4d004559c8
+Revises: 8de17ca5ee42
+Create Date: 2026-10-17 10:12:31.402118
+
+"""
+
+from __future__ import annotations
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "ec4d004559c8"
+down_revision: Union[str, None] = "8de17ca5ee42"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Keyset pagination order: pinned DESC, updated_at DESC, id DESC
+    op.create_index(
+        "ix_note_user_listing",
+        "note",
+        ["user_id", "archived", sa.text("pinned DESC"), sa.text("updated_at DESC"), sa.text("id DESC")],
+        unique=False,
+    )
+    op.create_index(
+        "ix_note_listing",
+        "note",
+        ["archived", sa.text("pinned DESC"), sa.text("updated_at DESC"), sa.text("id DESC")],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_note_listing", table_name="note")
+    op.drop_index("ix_note_user_listing", table_name="note")
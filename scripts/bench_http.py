@@ -0,0 +1,204 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from http.cookies import SimpleCookie
+from urllib.parse import urlencode, urlparse
+from urllib.request import HTTPRedirectHandler, Request, build_opener
+
+# Minimal keep-alive HTTP/1.1 load generator (stdlib only), e.g. to compare
+# DATABASE_ASYNC=0 vs DATABASE_ASYNC=1 at the same concurrency:
+#
+#   python -m scripts.bench_http --url http://127.0.0.1:8000/ --concurrency 50,200,500 --label sync
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):  # noqa: ANN002, ANN003
+        return None
+
+
+def login(base_url: str, username: str, password: str) -> str:
+    # Returns the Cookie header value for an authenticated session.
+    opener = build_opener(_NoRedirect())
+    body = urlencode({"username": username, "password": password}).encode("utf-8")
+    req = Request(f"{base_url}/login", data=body, method="POST")
+    try:
+        resp = opener.open(req, timeout=30)
+        headers = resp.headers
+    except Exception as exc:  # urllib raises on the 303 when redirects are disabled
+        headers = getattr(exc, "headers", None)
+        if headers is None:
+            raise
+
+    cookie = SimpleCookie()
+    for value in headers.get_all("set-cookie") or []:
+        cookie.load(value)
+    if "session" not in cookie:
+        raise RuntimeError("Login failed: no session cookie")
+    return f"session={cookie['session'].value}"
+
+
+class HttpConnection:
+    def __init__(self, host: str, port: int) -> None:
+        self.host = host
+        self.port = port
+        self.reader: asyncio.StreamReader | None = None
+        self.writer: asyncio.StreamWriter | None = None
+
+    async def _connect(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+
+    async def close(self) -> None:
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except Exception:
+                pass
+        self.reader = self.writer = None
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        headers: dict[str, str] | None = None,
+        body: bytes = b"",
+    ) -> tuple[int, bytes]:
+        if self.writer is None:
+            await self._connect()
+        assert self.reader is not None and self.writer is not None
+
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}"]
+        for name, value in (headers or {}).items():
+            lines.append(f"{name}: {value}")
+        if body or method in ("POST", "PUT", "PATCH"):
+            lines.append(f"Content-Length: {len(body)}")
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body)
+        await self.writer.drain()
+
+        head = await self.reader.readuntil(b"\r\n\r\n")
+        status_line, *header_lines = head.decode("latin-1").split("\r\n")
+        status = int(status_line.split(" ", 2)[1])
+        resp_headers = {}
+        for line in header_lines:
+            if ":" in line:
+                name, value = line.split(":", 1)
+                resp_headers[name.strip().lower()] = value.strip()
+
+        if resp_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self.reader.readuntil(b"\r\n")).split(b";", 1)[0], 16)
+                if size == 0:
+                    await self.reader.readuntil(b"\r\n")
+                    break
+                chunks.append(await self.reader.readexactly(size))
+                await self.reader.readexactly(2)
+            data = b"".join(chunks)
+        else:
+            data = await self.reader.readexactly(int(resp_headers.get("content-length", "0")))
+
+        if resp_headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, data
+
+
+def percentile(sorted_values: list[float], pct: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[k]
+
+
+def summarize(latencies: list[float], errors: int, elapsed: float) -> dict[str, float | int]:
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "errors": errors,
+        "rps": round(len(ordered) / elapsed, 1) if elapsed > 0 else 0.0,
+        "mean_ms": round(statistics.fmean(ordered) * 1000, 2) if ordered else 0.0,
+        "p50_ms": round(percentile(ordered, 50) * 1000, 2),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 2),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 2),
+    }
+
+
+async def run_load(
+    base_url: str,
+    path: str | list[str],
+    concurrency: int,
+    duration: float,
+    cookie: str | None = None,
+    method: str = "GET",
+    body: bytes = b"",
+    content_type: str | None = None,
+    timeout: float = 30.0,
+) -> dict[str, float | int]:
+    parsed = urlparse(base_url)
+    host = parsed.hostname or "127.0.0.1"
+    port = parsed.port or 80
+    headers = {}
+    if cookie:
+        headers["Cookie"] = cookie
+    if content_type:
+        headers["Content-Type"] = content_type
+
+    # A list of paths is spread over the clients, e.g. one note per client for writes
+    paths = [path] if isinstance(path, str) else path
+
+    latencies: list[float] = []
+    errors = 0
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_path: str) -> None:
+        nonlocal errors
+        conn = HttpConnection(host, port)
+        try:
+            while time.perf_counter() < deadline:
+                started = time.perf_counter()
+                try:
+                    status, _ = await asyncio.wait_for(conn.request(method, worker_path, headers, body), timeout)
+                except Exception:
+                    errors += 1
+                    await conn.close()
+                    continue
+                if status >= 400:
+                    errors += 1
+                else:
+                    latencies.append(time.perf_counter() - started)
+        finally:
+            await conn.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(paths[i % len(paths)]) for i in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="HTTP throughput benchmark for the notes app")
+    parser.add_argument("--url", default="http://127.0.0.1:8000/", help="Target URL (path and query included)")
+    parser.add_argument("--concurrency", default="50,200,500", help="Comma-separated client counts")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per concurrency level")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request timeout in seconds")
+    parser.add_argument("--label", default="", help="Free-form tag, e.g. sync/async")
+    args = parser.parse_args()
+
+    parsed = urlparse(args.url)
+    base_url = f"{parsed.scheme}://{parsed.netloc}"
+    path = parsed.path or "/"
+    if parsed.query:
+        path = f"{path}?{parsed.query}"
+
+    cookie = login(base_url, args.username, args.password)
+    for level in (int(c) for c in args.concurrency.split(",") if c.strip()):
+        result = asyncio.run(run_load(base_url, path, level, args.duration, cookie, timeout=args.timeout))
+        print(json.dumps({"label": args.label, "path": path, "concurrency": level, **result}), flush=True)
+
+
+if __name__ == "__main__":
+    main()
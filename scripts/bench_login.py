@@ -0,0 +1,71 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import os
+import time
+from urllib.parse import urlencode, urlparse
+
+from passlib.context import CryptContext
+
+from scripts.bench_http import run_load
+
+# Logins per second per core, to pick PASSWORD_HASH_ROUNDS / PASSWORD_HASH_WORKERS:
+#
+#   python -m scripts.bench_login --rounds 29000,100000,300000
+#   python -m scripts.bench_login --url http://127.0.0.1:8000 --concurrency 8,32 --cores 4
+#
+# The first form measures raw PBKDF2 verifications on one core; the second drives POST /login
+# against a running server and divides throughput by --cores (the hasher pool size).
+
+
+def verify_rate(rounds: int, duration: float) -> float:
+    context = CryptContext(schemes=["pbkdf2_sha256"], pbkdf2_sha256__default_rounds=rounds)
+    password_hash = context.hash("benchmark-password")
+    count = 0
+    started = time.perf_counter()
+    while time.perf_counter() - started < duration:
+        context.verify("benchmark-password", password_hash)
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Password hashing / login throughput benchmark")
+    parser.add_argument("--rounds", default="", help="Comma-separated PBKDF2 rounds to measure in-process")
+    parser.add_argument("--url", default="", help="Server base URL; benchmarks POST /login when set")
+    parser.add_argument("--concurrency", default="8,32", help="Comma-separated client counts for --url")
+    parser.add_argument("--duration", type=float, default=5.0, help="Seconds per measurement")
+    parser.add_argument("--cores", type=int, default=os.cpu_count() or 1, help="Cores serving hashes on the server")
+    parser.add_argument("--username", default="admin")
+    parser.add_argument("--password", default="admin")
+    args = parser.parse_args()
+
+    for rounds in (int(r) for r in args.rounds.split(",") if r.strip()):
+        rate = verify_rate(rounds, args.duration)
+        print(json.dumps({"rounds": rounds, "verify_per_sec_per_core": round(rate, 1), "ms_per_verify": round(1000 / rate, 2)}), flush=True)
+
+    if not args.url:
+        return
+    parsed = urlparse(args.url)
+    base_url = f"{parsed.scheme}://{parsed.netloc}"
+    body = urlencode({"username": args.username, "password": args.password}).encode("utf-8")
+    for level in (int(c) for c in args.concurrency.split(",") if c.strip()):
+        result = asyncio.run(
+            run_load(
+                base_url,
+                "/login",
+                level,
+                args.duration,
+                method="POST",
+                body=body,
+                content_type="application/x-www-form-urlencoded",
+            )
+        )
+        per_core = round(result["rps"] / max(args.cores, 1), 1)
+        print(json.dumps({"path": "/login", "concurrency": level, "cores": args.cores, "logins_per_sec_per_core": per_core, **result}), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlparse
+import zlib
+
+from scripts.bench_http import HttpConnection, login, summarize
+from scripts.bench_seed import BENCH_PASSWORD, BENCH_PREFIX
+
+# Save latency and history storage for a run of edits to one note, against a running
+# server; storage is read from the database (DATABASE_URL) and compared with keeping a
+# full copy of the note per save:
+#
+#   python -m scripts.bench_revisions --url http://127.0.0.1:8000 --edits 1000
+#
+# --mode content saves the whole text (edit form, PATCH); --mode patch sends autosave
+# splices and needs the server started with AUTOSAVE_MIN_INTERVAL=0. The note is
+# deleted at the end.
+
+WORDS = (
+    "заметка", "список", "postgres", "индекс", "план", "встреча", "идея", "проверить",
+    "release", "деплой", "купить", "молоко", "отчёт", "вопрос", "ответ", "todo",
+)
+
+
+def _text(rng: random.Random, chars: int) -> str:
+    words: list[str] = []
+    size = 0
+    while size < chars:
+        word = rng.choice(WORDS)
+        words.append(word + ("\n" if rng.random() < 0.08 else " "))
+        size += len(words[-1])
+    return "".join(words)
+
+
+def _edit(rng: random.Random, text: str) -> tuple[int, int, str]:
+    # A typical save: a few words typed, deleted or replaced somewhere in the note
+    # (about as much deleted as typed, so the note keeps its size)
+    start = rng.randrange(len(text) + 1)
+    end = min(len(text), start + rng.choice((0, rng.randrange(1, 60))))
+    insert = "" if end > start and rng.random() < 0.5 else _text(rng, rng.randrange(1, 40))
+    return start, end, insert
+
+
+async def _bench(args: argparse.Namespace) -> dict[str, object]:
+    base_url = args.url.rstrip("/")
+    parsed = urlparse(base_url)
+    cookie = login(base_url, args.username, args.password)
+    headers = {"Cookie": cookie, "Accept": "application/json", "Content-Type": "application/json"}
+    conn = HttpConnection(parsed.hostname or "127.0.0.1", parsed.port or 80)
+    rng = random.Random(args.seed)
+
+    text = _text(rng, args.size)
+    status, data = await conn.request(
+        "POST", "/api/notes", headers, json.dumps({"title": "bench_revisions", "content": text}).encode("utf-8")
+    )
+    if status != 201:
+        raise SystemExit(f"Creating the note failed: HTTP {status}")
+    note = json.loads(data)
+    note_id, version = note["id"], note["version"]
+
+    replaced: list[str] = []
+    latencies: list[float] = []
+    errors = 0
+    started = time.perf_counter()
+    try:
+        for _ in range(args.edits):
+            start, end, insert = _edit(rng, text)
+            new_text = text[:start] + insert + text[end:]
+            if args.mode == "patch":
+                path = f"/api/notes/{note_id}/autosave"
+                body = {"version": version, "patch": {"start": start, "end": end, "text": insert}}
+            else:
+                path = f"/api/notes/{note_id}"
+                body = {"version": version, "content": new_text}
+            method = "POST" if args.mode == "patch" else "PATCH"
+            save_started = time.perf_counter()
+            status, data = await conn.request(method, path, headers, json.dumps(body).encode("utf-8"))
+            elapsed = time.perf_counter() - save_started
+            if status not in (200, 204):
+                errors += 1
+                if status == 429:
+                    raise SystemExit("Autosave is rate limited: start the server with AUTOSAVE_MIN_INTERVAL=0")
+                continue
+            latencies.append(elapsed)
+            replaced.append(text)
+            text = new_text
+            version += 1
+        saves = summarize(latencies, errors, time.perf_counter() - started)
+
+        # Reading old revisions back (reconstruction included)
+        views: list[float] = []
+        view_errors = 0
+        view_started = time.perf_counter()
+        for seq in sorted(rng.sample(range(1, len(replaced) + 1), min(args.views, len(replaced)))):
+            request_started = time.perf_counter()
+            status, _ = await conn.request("GET", f"/notes/{note_id}/revisions/{seq}", {"Cookie": cookie})
+            if status == 200:
+                views.append(time.perf_counter() - request_started)
+            else:
+                view_errors += 1
+        revision_views = summarize(views, view_errors, time.perf_counter() - view_started)
+
+        storage = _storage(note_id, replaced)
+    finally:
+        await conn.request("DELETE", f"/api/notes/{note_id}", {"Cookie": cookie})
+        await conn.close()
+
+    return {
+        "mode": args.mode,
+        "edits": args.edits,
+        "initial_chars": args.size,
+        "final_chars": len(text),
+        "saves": saves,
+        "revision_views": revision_views,
+        "storage": storage,
+    }
+
+
+def _storage(note_id: int, replaced: list[str]) -> dict[str, object]:
+    from sqlalchemy import text
+
+    from app.db import get_engine
+
+    with get_engine().connect() as conn:
+        rows, snapshots, payload, stored = conn.execute(
+            text(
+                "SELECT count(*), count(*) FILTER (WHERE snapshot), coalesce(sum(octet_length(data)), 0),"
+                " coalesce(sum(pg_column_size(r.*)), 0) FROM note_revision r WHERE note_id = :id"
+            ),
+            {"id": note_id},
+        ).one()
+    full = [content.encode("utf-8") for content in replaced]
+    full_bytes = sum(len(data) for data in full)
+    full_zlib = sum(len(zlib.compress(data, 6)) for data in full)
+    per_1000 = 1000 / len(replaced) if replaced else 0.0
+    return {
+        "revisions": rows,
+        "snapshots": snapshots,
+        "payload_bytes": payload,
+        "row_bytes": stored,
+        "row_bytes_per_1000_edits": round(stored * per_1000),
+        "full_copies_bytes_per_1000_edits": round(full_bytes * per_1000),
+        "full_copies_zlib_bytes_per_1000_edits": round(full_zlib * per_1000),
+        "vs_full_copies": round(stored / full_bytes, 4) if full_bytes else None,
+        "vs_full_copies_zlib": round(stored / full_zlib, 4) if full_zlib else None,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark note saves with revision history")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--edits", type=int, default=1000)
+    parser.add_argument("--size", type=int, default=4000, help="Characters in the note before the first edit")
+    parser.add_argument("--mode", choices=("content", "patch"), default="content")
+    parser.add_argument("--views", type=int, default=100, help="Old revisions to open after the edits")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--username", default=f"{BENCH_PREFIX}0000")
+    parser.add_argument("--password", default=BENCH_PASSWORD)
+    args = parser.parse_args()
+
+    result = asyncio.run(_bench(args))
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
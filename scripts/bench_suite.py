@@ -0,0 +1,202 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+from datetime import datetime, timezone
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode, urlparse
+
+from scripts.bench_http import HttpConnection, login, run_load, summarize
+from scripts.bench_seed import BENCH_PASSWORD, BENCH_PREFIX
+
+# Fixed-concurrency scenarios against a running server and a seeded database; prints one
+# JSON document so results can be stored per commit and compared:
+#
+#   python -m scripts.bench_seed --users 10 --notes 2000 --reset
+#   PAGE_CACHE_URL=off uvicorn app.main:app --port 8000 &
+#   python -m scripts.bench_suite --url http://127.0.0.1:8000 --output bench-$(git rev-parse --short HEAD).json
+#   python -m scripts.bench_suite compare bench-old.json bench-new.json
+#
+# Write scenarios (toggle, create, import) change the bench user's notes; reseed with
+# --reset between runs that should be compared.
+
+SCENARIOS = ("list", "search", "api_list", "export", "toggle", "create", "import")
+SEARCH_TERM = "postgres"
+
+
+def _git_meta() -> dict[str, object]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+        dirty = bool(subprocess.run(["git", "status", "--porcelain"], capture_output=True, text=True, check=True).stdout.strip())
+    except (OSError, subprocess.CalledProcessError):
+        return {"commit": None, "dirty": None}
+    return {"commit": commit, "dirty": dirty}
+
+
+async def _get_json(base_url: str, path: str, cookie: str) -> tuple[int, object]:
+    parsed = urlparse(base_url)
+    conn = HttpConnection(parsed.hostname or "127.0.0.1", parsed.port or 80)
+    try:
+        status, data = await conn.request("GET", path, {"Cookie": cookie, "Accept": "application/json"})
+    finally:
+        await conn.close()
+    return status, json.loads(data) if data else None
+
+
+def _import_body(rows: int, rng: random.Random) -> tuple[bytes, str]:
+    boundary = "bench-suite-boundary"
+    lines = [
+        json.dumps({"title": f"Импорт {i}", "content": " ".join(str(rng.random()) for _ in range(20))}, ensure_ascii=False)
+        for i in range(rows)
+    ]
+    payload = ("\n".join(lines) + "\n").encode("utf-8")
+    body = (
+        f"--{boundary}\r\n"
+        'Content-Disposition: form-data; name="file"; filename="bench.ndjson"\r\n'
+        "Content-Type: application/x-ndjson\r\n\r\n"
+    ).encode("utf-8") + payload + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    return body, f"multipart/form-data; boundary={boundary}"
+
+
+async def _run_import(base_url: str, cookie: str, rows: int, runs: int, timeout: float) -> dict[str, object]:
+    # Jobs are queued per user and run by workers, so this measures submit-to-done latency
+    # one job at a time rather than concurrent throughput.
+    parsed = urlparse(base_url)
+    conn = HttpConnection(parsed.hostname or "127.0.0.1", parsed.port or 80)
+    body, content_type = _import_body(rows, random.Random(0))
+    headers = {"Cookie": cookie, "Accept": "application/json", "Content-Type": content_type}
+    latencies: list[float] = []
+    errors = 0
+    started = time.perf_counter()
+    try:
+        for _ in range(runs):
+            job_started = time.perf_counter()
+            status, data = await conn.request("POST", "/import/json", headers, body)
+            if status != 202:
+                errors += 1
+                continue
+            job = json.loads(data)
+            while job["status"] not in ("done", "failed") and time.perf_counter() - job_started < timeout:
+                await asyncio.sleep(0.02)
+                status, data = await conn.request("GET", job["status_url"], {"Cookie": cookie})
+                job = json.loads(data)
+            if job["status"] != "done":
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - job_started)
+    finally:
+        await conn.close()
+    result = summarize(latencies, errors, time.perf_counter() - started)
+    total = sum(latencies)
+    result["rows_per_job"] = rows
+    result["rows_per_sec"] = round(rows * len(latencies) / total, 1) if total else 0.0
+    return result
+
+
+async def run_suite(args: argparse.Namespace) -> dict[str, object]:
+    base_url = args.url.rstrip("/")
+    cookie = login(base_url, args.username, args.password)
+    selected = [name for name in args.scenarios.split(",") if name]
+    unknown = sorted(set(selected) - set(SCENARIOS))
+    if unknown:
+        raise SystemExit(f"Unknown scenarios: {', '.join(unknown)}")
+
+    results: dict[str, object] = {}
+    for name in SCENARIOS:
+        if name not in selected:
+            continue
+        load = {"concurrency": args.concurrency, "duration": args.duration, "cookie": cookie, "timeout": args.timeout}
+        if name == "list":
+            result = await run_load(base_url, "/", **load)
+        elif name == "search":
+            result = await run_load(base_url, "/?" + urlencode({"q": SEARCH_TERM}), **load)
+        elif name == "api_list":
+            result = await run_load(base_url, "/api/notes", **load)
+        elif name == "export":
+            result = await run_load(base_url, "/export/ndjson", **load)
+        elif name == "toggle":
+            # One note per client, so clients don't serialize on the same row lock
+            status, data = await _get_json(base_url, f"/api/notes?limit={args.concurrency}", cookie)
+            if status != 200 or not data["items"]:  # type: ignore[index]
+                raise SystemExit("toggle: the bench user has no notes; run scripts.bench_seed first")
+            paths = [f"/api/notes/{item['id']}/pin" for item in data["items"]]  # type: ignore[index]
+            result = await run_load(base_url, paths, method="POST", **load)
+        elif name == "create":
+            body = urlencode({"title": "Benchmark note", "content": "Создано scripts.bench_suite " * 10}).encode("utf-8")
+            result = await run_load(
+                base_url, "/notes", method="POST", body=body, content_type="application/x-www-form-urlencoded", **load
+            )
+        else:
+            result = await _run_import(base_url, cookie, args.import_rows, args.import_runs, args.timeout)
+        results[name] = result
+        print(json.dumps({"scenario": name, **result}), file=sys.stderr, flush=True)
+
+    return {
+        "meta": {
+            **_git_meta(),
+            "label": args.label,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "url": base_url,
+            "username": args.username,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+        },
+        "scenarios": results,
+    }
+
+
+def compare(old_path: str, new_path: str) -> None:
+    with open(old_path, encoding="utf-8") as f:
+        old = json.load(f)
+    with open(new_path, encoding="utf-8") as f:
+        new = json.load(f)
+    print(f"{'scenario':<10} {'metric':<12} {'old':>10} {'new':>10} {'change':>8}")
+    for name, new_result in new["scenarios"].items():
+        old_result = old["scenarios"].get(name)
+        if old_result is None:
+            continue
+        for metric in ("rps", "p50_ms", "p95_ms", "p99_ms", "errors"):
+            before, after = old_result.get(metric, 0), new_result.get(metric, 0)
+            change = f"{(after - before) / before * 100:+.1f}%" if before else "-"
+            print(f"{name:<10} {metric:<12} {before:>10} {after:>10} {change:>8}")
+
+
+def main() -> None:
+    if len(sys.argv) > 1 and sys.argv[1] == "compare":
+        parser = argparse.ArgumentParser(prog="scripts.bench_suite compare", description="Compare two result files")
+        parser.add_argument("old")
+        parser.add_argument("new")
+        args = parser.parse_args(sys.argv[2:])
+        compare(args.old, args.new)
+        return
+
+    parser = argparse.ArgumentParser(description="Benchmark scenarios for the notes app")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario")
+    parser.add_argument("--timeout", type=float, default=30.0, help="Per-request (and per-import-job) timeout in seconds")
+    parser.add_argument("--import-rows", type=int, default=5000, help="Notes per import job")
+    parser.add_argument("--import-runs", type=int, default=5, help="Import jobs to run one after another")
+    parser.add_argument("--username", default=f"{BENCH_PREFIX}0000")
+    parser.add_argument("--password", default=BENCH_PASSWORD)
+    parser.add_argument("--label", default="", help="Free-form tag stored in the results")
+    parser.add_argument("--output", default="", help="Also write the results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run_suite(args))
+    text = json.dumps(results, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+
+
+if __name__ == "__main__":
+    main()
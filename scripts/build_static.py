@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import argparse
+from collections.abc import Callable
+import gzip
+import hashlib
+import json
+import os
+import shlex
+import shutil
+import subprocess
+import tempfile
+
+from app.assets import MANIFEST_PATH, STATIC_DIR
+
+# Builds app/static/dist: Tailwind CSS compiled and minified from the classes the
+# templates and app.js actually use, then app.css, app.js and the favicon copied under
+# content-hash names with .br/.gz siblings and a manifest that static_url() reads.
+# Run from the project root at build time:
+#
+#   python -m scripts.build_static
+#
+# Needs the Tailwind v3 CLI: the standalone binary on PATH as `tailwindcss`, or npx
+# (TAILWIND_CLI overrides the command). Brotli variants need the `brotli` package.
+# --no-css skips Tailwind; pages then fall back to the Tailwind CDN.
+
+DIST_DIR = os.path.dirname(MANIFEST_PATH)
+TAILWIND_INPUT = "app/tailwind.css"
+TAILWIND_CONFIG = "tailwind.config.js"
+ASSETS = ["app.js", "favicon.svg"]
+
+
+def _tailwind_command() -> list[str]:
+    configured = os.getenv("TAILWIND_CLI")
+    if configured:
+        return shlex.split(configured)
+    if shutil.which("tailwindcss"):
+        return ["tailwindcss"]
+    return ["npx", "--yes", "tailwindcss@3.4.17"]
+
+
+def build_css(output: str) -> None:
+    command = [*_tailwind_command(), "-c", TAILWIND_CONFIG, "-i", TAILWIND_INPUT, "-o", output, "--minify"]
+    try:
+        subprocess.run(command, check=True)
+    except (OSError, subprocess.CalledProcessError) as exc:
+        raise SystemExit(f"Tailwind build failed ({exc}); install the Tailwind CLI or pass --no-css") from None
+
+
+def _compressors() -> list[tuple[str, Callable[[bytes], bytes]]]:
+    compressors: list[tuple[str, Callable[[bytes], bytes]]] = [
+        (".gz", lambda data: gzip.compress(data, compresslevel=9, mtime=0))
+    ]
+    try:
+        import brotli
+    except ImportError:
+        print("brotli is not installed, skipping .br variants")
+    else:
+        compressors.insert(0, (".br", lambda data: brotli.compress(data, quality=11)))
+    return compressors
+
+
+def fingerprint(source: str, name: str, compressors: list[tuple[str, Callable[[bytes], bytes]]]) -> str:
+    with open(source, "rb") as f:
+        data = f.read()
+    stem, ext = os.path.splitext(name)
+    hashed = f"{stem}.{hashlib.sha256(data).hexdigest()[:12]}{ext}"
+    target = os.path.join(DIST_DIR, hashed)
+    with open(target, "wb") as f:
+        f.write(data)
+    sizes = [f"{len(data)} B"]
+    for suffix, compress in compressors:
+        packed = compress(data)
+        # Not worth a variant (and a header) unless it actually saves bytes
+        if len(packed) < len(data):
+            with open(target + suffix, "wb") as f:
+                f.write(packed)
+            sizes.append(f"{suffix[1:]} {len(packed)} B")
+    print(f"{name} -> dist/{hashed} ({', '.join(sizes)})")
+    return f"dist/{hashed}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Build fingerprinted, precompressed static assets")
+    parser.add_argument("--no-css", action="store_true", help="Skip the Tailwind build")
+    args = parser.parse_args()
+
+    compressors = _compressors()
+    manifest: dict[str, str] = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        css = os.path.join(tmp, "app.css")
+        if not args.no_css:
+            build_css(css)
+        # Old fingerprints go too: only the current build's files are referenced
+        shutil.rmtree(DIST_DIR, ignore_errors=True)
+        os.makedirs(DIST_DIR)
+        if not args.no_css:
+            manifest["app.css"] = fingerprint(css, "app.css", compressors)
+        for name in ASSETS:
+            manifest[name] = fingerprint(os.path.join(STATIC_DIR, name), name, compressors)
+
+    with open(MANIFEST_PATH, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Wrote {MANIFEST_PATH}")
+
+
+if __name__ == "__main__":
+    main()
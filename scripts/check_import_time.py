@@ -0,0 +1,77 @@
+from __future__ import annotations
+
+import argparse
+import os
+import subprocess
+import sys
+
+# Measures `python -X importtime -c "import app.main"` in fresh interpreters and fails if
+# the import takes longer than the budget or pulls in a module that is meant to load on
+# first use only:
+#
+#   python -m scripts.check_import_time --budget 1000 --runs 5
+#
+# The budget is compared with the fastest run, which is the least noisy figure. DATABASE_URL
+# only has to be set; nothing connects during the import.
+
+MODULE = "app.main"
+# Loaded lazily: engine creation (psycopg), the first hash/verify (passlib), the first
+# render (jinja2) and the first weather fetch (urllib.request)
+DEFERRED = ("psycopg", "passlib", "jinja2", "urllib.request")
+
+
+def _measure() -> dict[str, tuple[int, int]]:
+    # module -> (self us, cumulative us)
+    env = dict(os.environ)
+    env.setdefault("DATABASE_URL", "postgresql://importtime@localhost:1/importtime")
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {MODULE}"],
+        capture_output=True,
+        text=True,
+        env=env,
+    )
+    if proc.returncode != 0:
+        sys.stderr.write(proc.stderr)
+        raise SystemExit(f"import {MODULE} failed")
+    modules: dict[str, tuple[int, int]] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        if not self_us.strip().isdigit():
+            continue  # header
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=f"Check the import time of {MODULE}")
+    parser.add_argument("--budget", type=float, default=1000.0, help="Milliseconds allowed for the fastest run")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Slowest modules (own time) to list")
+    args = parser.parse_args()
+
+    # The first run also warms the .pyc files and the OS file cache
+    _measure()
+    runs = [_measure() for _ in range(max(args.runs, 1))]
+    fastest = min(runs, key=lambda modules: modules[MODULE][1])
+    total_ms = fastest[MODULE][1] / 1000
+
+    print(f"import {MODULE}: {total_ms:.0f} ms (fastest of {len(runs)}, budget {args.budget:.0f} ms)")
+    for name, (self_us, _) in sorted(fastest.items(), key=lambda item: item[1][0], reverse=True)[: args.top]:
+        print(f"  {self_us / 1000:8.1f} ms  {name}")
+
+    problems = []
+    if total_ms > args.budget:
+        problems.append(f"over budget by {total_ms - args.budget:.0f} ms")
+    eager = [name for name in DEFERRED if name in fastest]
+    if eager:
+        problems.append(f"imported at startup: {', '.join(eager)}")
+    if problems:
+        print("FAIL: " + "; ".join(problems))
+        sys.exit(1)
+    print("ok")
+
+
+if __name__ == "__main__":
+    main()
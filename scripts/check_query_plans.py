@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import argparse
+from datetime import datetime
+import json
+import sys
+from typing import Any
+
+from sqlalchemy import func, select, text
+
+from app import exporter
+from app.db import get_engine
+from app.main import NOTES_PAGE_SIZE, _encode_cursor, _listing_statement
+from app.models import Note, User
+from scripts.bench_suite import SEARCH_TERM
+
+# EXPLAINs the note queries behind GET / and the exports and fails unless each uses the
+# expected index (and, where the index provides the order, has no Sort node):
+#
+#   python -m scripts.check_query_plans                # against a realistically sized DB
+#   python -m scripts.check_query_plans --no-seqscan   # small or empty DB
+#
+# --no-seqscan sets enable_seqscan=off, so on a tiny table the check still shows
+# whether a usable index exists rather than the planner's preference for a seq scan.
+
+
+def _plan_nodes(plan: dict[str, Any]) -> list[dict[str, Any]]:
+    nodes = [plan]
+    for child in plan.get("Plans", []):
+        nodes.extend(_plan_nodes(child))
+    return nodes
+
+
+def _explain(conn: Any, stmt: Any, as_cursor: bool) -> dict[str, Any]:
+    compiled = stmt.compile(dialect=conn.dialect)
+    sql = str(compiled)
+    if as_cursor:
+        # Exports stream through a server-side cursor, which is planned for a fast start
+        sql = f"DECLARE plan_check NO SCROLL CURSOR FOR {sql}"
+    result = conn.exec_driver_sql(f"EXPLAIN (FORMAT JSON) {sql}", compiled.params)
+    raw = result.scalar()
+    return (json.loads(raw) if isinstance(raw, str) else raw)[0]["Plan"]
+
+
+def _cases(owner: User, admin: User) -> list[tuple[str, Any, str, bool, bool]]:
+    # (name, statement, index that must be scanned, Sort node allowed, runs as a cursor)
+    after_pinned = _encode_cursor([1, datetime(2030, 1, 1).isoformat(), 2**31 - 1])
+    after_unpinned = _encode_cursor([0, datetime(2030, 1, 1).isoformat(), 2**31 - 1])
+
+    def listing(user: User, q: str, archived: bool, cursor: str | None = None) -> Any:
+        return _listing_statement(user, q, archived, cursor, NOTES_PAGE_SIZE)[0]
+
+    return [
+        ("list active", listing(owner, "", False), "ix_note_user_active", False, False),
+        ("list active, pinned page", listing(owner, "", False, after_pinned), "ix_note_user_active", False, False),
+        ("list active, unpinned page", listing(owner, "", False, after_unpinned), "ix_note_user_active", False, False),
+        ("list archived", listing(owner, "", True), "ix_note_user_archived", False, False),
+        ("list active (superuser)", listing(admin, "", False), "ix_note_active_listing", False, False),
+        ("list archived (superuser)", listing(admin, "", True), "ix_note_archived_listing", False, False),
+        # Ranked by relevance, so the matches are sorted
+        ("search", listing(owner, SEARCH_TERM, False), "ix_note_search_vector", True, False),
+        ("export", exporter.rows_statement(owner), "ix_note_user_updated", False, True),
+        ("export (superuser)", exporter.rows_statement(admin), "ix_note_user_updated", False, True),
+    ]
+
+
+def check(no_seqscan: bool, verbose: bool) -> bool:
+    ok = True
+    with get_engine().connect() as conn:
+        if no_seqscan:
+            conn.execute(text("SET enable_seqscan = off"))
+        # The owner with the most notes: the plan that matters most
+        owner_id = conn.execute(
+            select(Note.user_id).where(Note.user_id.is_not(None)).group_by(Note.user_id).order_by(func.count().desc()).limit(1)
+        ).scalar()
+        owner = User(id=owner_id or 1, username="plan-check", password_hash="", is_superuser=False)
+        admin = User(id=0, username="plan-check-admin", password_hash="", is_superuser=True)
+
+        for name, stmt, index, sort_allowed, as_cursor in _cases(owner, admin):
+            plan = _explain(conn, stmt, as_cursor)
+            nodes = _plan_nodes(plan)
+            indexes = {node.get("Index Name") for node in nodes if "Index Name" in node}
+            has_sort = any(node["Node Type"] in ("Sort", "Incremental Sort") for node in nodes)
+            problems = []
+            if index not in indexes:
+                problems.append(f"expected {index}, scanned {sorted(i for i in indexes if i) or 'no index'}")
+            if has_sort and not sort_allowed:
+                problems.append("sorts instead of reading in index order")
+            status = "ok" if not problems else "FAIL: " + "; ".join(problems)
+            print(f"{name:<28} {status}")
+            if problems or verbose:
+                print(json.dumps(plan, indent=2))
+            ok = ok and not problems
+    return ok
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Check that note queries use the intended indexes")
+    parser.add_argument("--no-seqscan", action="store_true", help="Disable seq scans (for small or empty databases)")
+    parser.add_argument("--verbose", action="store_true", help="Print every plan")
+    args = parser.parse_args()
+    sys.exit(0 if check(args.no_seqscan, args.verbose) else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+from __future__ import annotations
+
+import argparse
+import os
+import time
+
+from app import templating
+from app.main import get_templates
+
+# Fills the template bytecode cache so web processes skip compiling templates on their
+# first requests. Run at build time, from the project root:
+#
+#   python -m scripts.compile_templates
+#
+# Processes pick the cache up from TEMPLATE_CACHE_DIR (default .template_cache). Imports
+# app.main for the app's filters, so DATABASE_URL must be set (the DB is not contacted).
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Precompile Jinja templates into the bytecode cache")
+    parser.add_argument("--dir", default=templating.TEMPLATE_CACHE_DIR, help="Cache directory (TEMPLATE_CACHE_DIR)")
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    templating.TEMPLATE_CACHE_DIR = args.dir
+    started = time.perf_counter()
+    names = templating.compile_templates(get_templates())
+    print(f"Compiled {len(names)} templates into {args.dir} in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -25,7 +25,25 @@ def _normalize_database_url(url: str) -> str:
     return url
 
 
-def run() -> None:
+def ensure_admin_user() -> None:
+    # Create default superuser if missing. Runs here, once per deploy, rather than as a
+    # startup hook in every web process.
+    from sqlmodel import select
+
+    from app.db import get_session
+    from app.models import User
+    from app.security import hash_password
+
+    with get_session() as session:
+        admin = session.exec(select(User).where(User.username == "admin")).first()
+        if admin:
+            return
+        admin = User(username="admin", password_hash=hash_password("admin"), is_superuser=True)
+        session.add(admin)
+        session.commit()
+
+
+def upgrade() -> None:
     database_url = os.getenv("DATABASE_URL")
     if not database_url:
         raise RuntimeError("DATABASE_URL is not set")
@@ -54,5 +72,10 @@ def run() -> None:
         raise
 
 
+def run() -> None:
+    upgrade()
+    ensure_admin_user()
+
+
 if __name__ == "__main__":
     run()
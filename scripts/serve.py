@@ -0,0 +1,511 @@
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import logging.config
+import math
+import os
+import random
+import selectors
+import signal
+import socket
+import sys
+import time
+from typing import Any
+
+try:
+    from dotenv import load_dotenv
+
+    load_dotenv()
+except Exception:
+    pass
+
+# Production entry point: migrations once, then pre-forked uvicorn workers sharing one
+# listening socket, plus --job-processes processes running import/export jobs (what
+# `python -m scripts.worker` runs):
+#
+#   python -m scripts.serve --host 0.0.0.0 --port $PORT
+#
+# The app is imported here once and inherited by every worker (--no-preload imports it
+# in each worker instead, so a reload picks up new code). Signals to this process:
+#   TERM, INT  stop: /readyz turns 503 for --drain seconds, then workers finish their
+#              requests (up to --graceful-timeout) and exit
+#   HUP        replace every worker (new ones start before the old ones drain)
+# A worker that exits, serves its --max-requests or stops sending heartbeats for
+# --timeout seconds (a blocked event loop) is replaced; job processes likewise. Windows has
+# no fork: there the workers are uvicorn's own (no preload, heartbeats or drain) and run
+# the jobs themselves.
+
+logger = logging.getLogger("uvicorn.error")
+
+# Heartbeat pipe messages from a worker
+_ALIVE = b"."
+_EXITING = b"-"
+# Workers that keep dying this soon after starting (bad config, port taken) stop the server
+_FAST_FAILURE_SECONDS = 5.0
+_FAST_FAILURES_MAX = 5
+_ACCEPT_GRACE_SECONDS = 0.25
+
+
+def _env_int(name: str, default: int) -> int:
+    raw = (os.getenv(name) or "").strip()
+    return int(raw) if raw else default
+
+
+def cpu_limit() -> int:
+    # CPUs this process may use: affinity and a cgroup v2 CPU quota (containers) included
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+
+def connections_per_worker() -> int:
+    from app import live
+    from app.db import DB_MAX_OVERFLOW, DB_POOL_SIZE
+
+    # The pool at its fullest, plus the LISTEN connection for live updates
+    return DB_POOL_SIZE + DB_MAX_OVERFLOW + (1 if live.LIVE_UPDATES else 0)
+
+
+def connection_budget() -> int | None:
+    # DB_CONNECTION_BUDGET, or what the primary has free right now (max_connections minus
+    # the superuser reserve and connections already open); None if it can't be asked
+    raw = (os.getenv("DB_CONNECTION_BUDGET") or "").strip()
+    if raw:
+        return int(raw)
+    from sqlalchemy import text
+
+    from app.db import get_engine
+
+    try:
+        with get_engine().connect() as conn:
+            limit, reserved, used = conn.execute(
+                text(
+                    "SELECT current_setting('max_connections')::int,"
+                    " current_setting('superuser_reserved_connections')::int,"
+                    " (SELECT count(*) FROM pg_stat_activity WHERE backend_type = 'client backend')::int"
+                )
+            ).one()
+    except Exception:  # noqa: BLE001
+        logger.warning("Could not read max_connections; sizing workers by CPU only", exc_info=True)
+        return None
+    # This connection is about to be closed
+    return limit - reserved - used + 1
+
+
+def auto_workers(job_processes: int = 0) -> int:
+    cpus = cpu_limit()
+    budget = connection_budget()
+    per_worker = connections_per_worker()
+    # Job processes take connections from the same budget
+    workers = cpus if budget is None else max(1, min(cpus, budget // per_worker - job_processes))
+    logger.info(
+        "Workers: %d (CPUs %d, database connections free %s, up to %d per worker)",
+        workers,
+        cpus,
+        "unknown" if budget is None else budget,
+        per_worker,
+    )
+    return workers
+
+
+def _bind(host: str, port: int, backlog: int) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _uvicorn_options(args: argparse.Namespace) -> dict[str, Any]:
+    return {
+        "lifespan": "on",
+        "log_level": args.log_level,
+        "access_log": args.access_log,
+        "proxy_headers": True,
+        "forwarded_allow_ips": args.forwarded_allow_ips,
+        "backlog": args.backlog,
+        "timeout_keep_alive": args.keep_alive,
+        "timeout_graceful_shutdown": args.graceful_timeout,
+    }
+
+
+def _send(heartbeat: int, message: bytes) -> None:
+    try:
+        os.write(heartbeat, message)
+    except (BlockingIOError, BrokenPipeError):
+        pass
+
+
+def _run_worker(sock: socket.socket, heartbeat: int, args: argparse.Namespace, max_requests: int | None) -> None:
+    # In the forked child; never returns
+    import uvicorn
+
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    # Reloads are the master's business
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+
+    from app import live
+    from app.main import app
+
+    def drain(signum: int, frame: Any) -> None:
+        app.state.draining = True
+
+    signal.signal(signal.SIGUSR1, drain)
+    os.set_blocking(heartbeat, False)
+
+    async def alive() -> None:
+        _send(heartbeat, _ALIVE)
+
+    class Server(uvicorn.Server):
+        async def shutdown(self, sockets: list[socket.socket] | None = None) -> None:
+            # Whatever the reason (signal, max requests): the master starts a replacement
+            # now, and open event streams end so they don't hold up the exit
+            _send(heartbeat, _EXITING)
+            # Stop accepting first, then give connections accepted a moment ago time to send
+            # their request: uvicorn closes connections with nothing in flight at once
+            for server in self.servers:
+                server.close()
+            await asyncio.sleep(_ACCEPT_GRACE_SECONDS)
+            await live.stop()
+            await super().shutdown(sockets)
+
+    config = uvicorn.Config(
+        app, limit_max_requests=max_requests, callback_notify=alive, timeout_notify=1, **_uvicorn_options(args)
+    )
+    code = 0
+    try:
+        Server(config).run(sockets=[sock])
+    except BaseException:  # noqa: BLE001
+        logger.exception("Worker %d failed", os.getpid())
+        code = 1
+    finally:
+        os._exit(code)
+
+
+def _run_job_process(heartbeat: int) -> None:
+    # In the forked child; never returns
+    for sig in (signal.SIGINT, signal.SIGTERM, signal.SIGCHLD):
+        signal.signal(sig, signal.SIG_DFL)
+    # Reloads are the master's business; no requests to drain
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    signal.signal(signal.SIGUSR1, signal.SIG_IGN)
+
+    from scripts import worker
+
+    os.set_blocking(heartbeat, False)
+
+    async def run() -> None:
+        async def beat() -> None:
+            while True:
+                _send(heartbeat, _ALIVE)
+                await asyncio.sleep(1)
+
+        task = asyncio.create_task(beat())
+        try:
+            await worker.main(on_stop=lambda: _send(heartbeat, _EXITING))
+        finally:
+            task.cancel()
+
+    code = 0
+    try:
+        asyncio.run(run())
+    except BaseException:  # noqa: BLE001
+        logger.exception("Job process %d failed", os.getpid())
+        code = 1
+    finally:
+        os._exit(code)
+
+
+class Worker:
+    def __init__(self, pid: int, heartbeat: int, runs_jobs: bool = False) -> None:
+        self.pid = pid
+        self.heartbeat = heartbeat
+        self.runs_jobs = runs_jobs
+        self.started = time.monotonic()
+        self.seen = self.started
+        # Told to stop, or stopping by itself: no longer counted or watched
+        self.retiring = False
+
+
+class Master:
+    def __init__(self, args: argparse.Namespace, sock: socket.socket, workers: int) -> None:
+        self.args = args
+        self.sock = sock
+        self.size = workers
+        self.job_processes = args.job_processes
+        self.workers: dict[int, Worker] = {}
+        self.selector = selectors.DefaultSelector()
+        self.stop_signal: int | None = None
+        self.reload_requested = False
+        self.fast_failures = 0
+        self.exit_code = 0
+
+    def spawn(self, runs_jobs: bool = False) -> None:
+        max_requests = None
+        if self.args.max_requests > 0:
+            max_requests = self.args.max_requests + random.randint(0, max(0, self.args.max_requests_jitter))
+        read_end, write_end = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            os.close(read_end)
+            self.selector.close()
+            for worker in self.workers.values():
+                os.close(worker.heartbeat)
+            if runs_jobs:
+                self.sock.close()
+                _run_job_process(write_end)
+            _run_worker(self.sock, write_end, self.args, max_requests)
+        os.close(write_end)
+        os.set_blocking(read_end, False)
+        self.selector.register(read_end, selectors.EVENT_READ, pid)
+        self.workers[pid] = Worker(pid, read_end, runs_jobs)
+        logger.info("Started %s %d", "job process" if runs_jobs else "worker", pid)
+
+    def active(self, runs_jobs: bool) -> int:
+        return sum(not worker.retiring and worker.runs_jobs == runs_jobs for worker in self.workers.values())
+
+    def signal_workers(self, sig: int, only_active: bool = False) -> None:
+        for worker in list(self.workers.values()):
+            if only_active and worker.retiring:
+                continue
+            try:
+                os.kill(worker.pid, sig)
+            except ProcessLookupError:
+                pass
+
+    def retire(self, worker: Worker, sig: int = signal.SIGTERM) -> None:
+        worker.retiring = True
+        try:
+            os.kill(worker.pid, sig)
+        except ProcessLookupError:
+            pass
+
+    def read_heartbeats(self, timeout: float) -> None:
+        for key, _ in self.selector.select(timeout):
+            worker = self.workers.get(key.data)
+            try:
+                data = os.read(key.fd, 4096)
+            except BlockingIOError:
+                continue
+            if worker is None:
+                continue
+            if not data:
+                # The worker closed its end: it is exiting
+                self.selector.unregister(key.fd)
+                worker.retiring = True
+                continue
+            worker.seen = time.monotonic()
+            if _EXITING in data and not worker.retiring:
+                worker.retiring = True
+                logger.info("Worker %d is shutting down", worker.pid)
+
+    def reap(self) -> None:
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            worker = self.workers.pop(pid, None)
+            if worker is None:
+                continue
+            try:
+                self.selector.unregister(worker.heartbeat)
+            except (KeyError, ValueError):
+                pass
+            os.close(worker.heartbeat)
+            code = os.waitstatus_to_exitcode(status)
+            if code != 0 and not worker.retiring and time.monotonic() - worker.started < _FAST_FAILURE_SECONDS:
+                self.fast_failures += 1
+            elif code == 0 or worker.retiring:
+                self.fast_failures = 0
+            log = logger.info if code == 0 or worker.retiring else logger.warning
+            log("Worker %d exited with %s", pid, code if code >= 0 else signal.Signals(-code).name)
+
+    def check_heartbeats(self) -> None:
+        now = time.monotonic()
+        for worker in list(self.workers.values()):
+            if not worker.retiring and now - worker.seen > self.args.timeout:
+                logger.error("Worker %d sent no heartbeat for %ss; killing it", worker.pid, self.args.timeout)
+                self.retire(worker, signal.SIGKILL)
+
+    def run(self) -> int:
+        def request_stop(signum: int, frame: Any) -> None:
+            if self.stop_signal is None:
+                self.stop_signal = signum
+
+        def request_reload(signum: int, frame: Any) -> None:
+            self.reload_requested = True
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGHUP, request_reload)
+
+        while self.stop_signal is None:
+            if self.fast_failures >= _FAST_FAILURES_MAX:
+                logger.error("Workers keep failing on start; stopping")
+                self.exit_code = 1
+                break
+            if self.reload_requested:
+                self.reload_requested = False
+                logger.info("Replacing %d workers and %d job processes", self.size, self.job_processes)
+                old = [worker for worker in self.workers.values() if not worker.retiring]
+                for worker in old:
+                    self.spawn(worker.runs_jobs)
+                for worker in old:
+                    self.retire(worker)
+            while self.active(runs_jobs=False) < self.size:
+                self.spawn()
+            while self.active(runs_jobs=True) < self.job_processes:
+                self.spawn(runs_jobs=True)
+            self.read_heartbeats(0.5)
+            self.reap()
+            self.check_heartbeats()
+
+        self.shutdown()
+        return self.exit_code
+
+    def shutdown(self) -> None:
+        if self.args.drain > 0 and self.exit_code == 0:
+            logger.info("Draining for %ss", self.args.drain)
+            self.signal_workers(signal.SIGUSR1)
+            deadline = time.monotonic() + self.args.drain
+            while time.monotonic() < deadline and self.workers:
+                self.read_heartbeats(0.5)
+                self.reap()
+
+        logger.info("Stopping %d workers", len(self.workers))
+        self.signal_workers(signal.SIGTERM)
+        deadline = time.monotonic() + (self.args.graceful_timeout or 30) + 5
+        while self.workers and time.monotonic() < deadline:
+            self.read_heartbeats(0.2)
+            self.reap()
+        if self.workers:
+            logger.warning("Killing %d workers that did not stop in time", len(self.workers))
+            self.signal_workers(signal.SIGKILL)
+            while self.workers:
+                self.read_heartbeats(0.2)
+                self.reap()
+        self.sock.close()
+
+
+def _serve_without_fork(args: argparse.Namespace, workers: int) -> int:
+    import uvicorn
+
+    uvicorn.run(
+        "app.main:app",
+        host=args.host,
+        port=args.port,
+        workers=workers,
+        limit_max_requests=args.max_requests or None,
+        **_uvicorn_options(args),
+    )
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Run the app with several worker processes")
+    parser.add_argument("--host", default=os.getenv("HOST") or "127.0.0.1")
+    parser.add_argument("--port", type=int, default=_env_int("PORT", 8000))
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=_env_int("WEB_CONCURRENCY", 0),
+        help="Worker processes (default: WEB_CONCURRENCY, else sized from CPUs and free DB connections)",
+    )
+    parser.add_argument(
+        "--max-requests",
+        type=int,
+        default=_env_int("MAX_REQUESTS", 10000),
+        help="Replace a worker after this many requests, against slow memory growth (0: never)",
+    )
+    parser.add_argument("--max-requests-jitter", type=int, default=_env_int("MAX_REQUESTS_JITTER", 1000))
+    parser.add_argument(
+        "--graceful-timeout",
+        type=int,
+        default=_env_int("GRACEFUL_TIMEOUT", 30),
+        help="Seconds a stopping worker may spend finishing requests",
+    )
+    parser.add_argument(
+        "--drain",
+        type=float,
+        default=float(os.getenv("DRAIN_SECONDS") or 0),
+        help="Seconds /readyz reports 503 before workers stop (set to the load balancer's check interval)",
+    )
+    parser.add_argument(
+        "--job-processes",
+        type=int,
+        default=_env_int("JOBS_PROCESSES", 1),
+        help="Processes running import/export jobs (0: jobs run elsewhere, e.g. scripts.worker)",
+    )
+    parser.add_argument("--timeout", type=int, default=_env_int("WORKER_TIMEOUT", 30), help="Heartbeat timeout")
+    parser.add_argument("--keep-alive", type=int, default=5)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--forwarded-allow-ips", default=os.getenv("FORWARDED_ALLOW_IPS"))
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--no-access-log", dest="access_log", action="store_false")
+    parser.add_argument("--no-migrate", dest="migrate", action="store_false", help="Skip scripts.migrate")
+    parser.add_argument("--no-preload", dest="preload", action="store_false", help="Import the app in each worker")
+    args = parser.parse_args()
+
+    from uvicorn.config import LOGGING_CONFIG
+
+    logging.config.dictConfig(LOGGING_CONFIG)
+    logger.setLevel(args.log_level.upper())
+
+    if not hasattr(os, "fork") and args.job_processes > 0:
+        # No job processes without fork: the web workers run the jobs
+        os.environ.setdefault("JOBS_WORKERS", "1")
+        args.job_processes = 0
+    workers = args.workers if args.workers > 0 else auto_workers(args.job_processes)
+    # One password-hashing process per worker by default: the workers already fill the
+    # CPUs. Set before anything imports app.security, which reads it once.
+    os.environ.setdefault("PASSWORD_HASH_WORKERS", str(max(1, cpu_limit() // workers)))
+    # The default page cache lives in each process and a write invalidates it only in the
+    # process that made it: the others would serve the old list for up to PAGE_CACHE_TTL.
+    # Several writing processes need a shared backend, so without one the cache is off.
+    processes = workers + args.job_processes
+    if processes > 1 and not (os.getenv("PAGE_CACHE_URL") or "").strip():
+        os.environ["PAGE_CACHE_URL"] = "off"
+        logger.warning("Page cache off: %d processes and no shared PAGE_CACHE_URL (redis://...)", processes)
+
+    if args.migrate:
+        from scripts import migrate
+
+        migrate.run()
+        logger.info("Migrations applied")
+
+    if "app.db" in sys.modules:
+        # Connections opened above (migrations, sizing) stay with this process
+        from app.db import get_engine
+
+        get_engine().dispose()
+
+    if not hasattr(os, "fork"):
+        sys.exit(_serve_without_fork(args, workers))
+
+    if args.preload:
+        from app.main import app  # noqa: F401
+
+    sock = _bind(args.host, args.port, args.backlog)
+    logger.info("Listening on http://%s:%d (pid %d)", args.host, args.port, os.getpid())
+    sys.exit(Master(args, sock, workers).run())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+from __future__ import annotations
+
+import asyncio
+from collections.abc import Callable
+import os
+import signal
+
+from app import jobs
+
+JOBS_WORKER_CONCURRENCY = int(os.getenv("JOBS_WORKER_CONCURRENCY") or 2)
+
+
+async def main(count: int = JOBS_WORKER_CONCURRENCY, on_stop: Callable[[], None] | None = None) -> None:
+    loop = asyncio.get_running_loop()
+    stopped = asyncio.Event()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopped.set)
+        except NotImplementedError:  # Windows
+            pass
+
+    jobs.start_workers(count)
+    try:
+        await stopped.wait()
+    finally:
+        if on_stop is not None:
+            on_stop()
+        await jobs.stop_workers()
+
+
+def run() -> None:
+    # Dedicated job process; `python -m scripts.serve` starts one by itself.
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    run()
@@ -0,0 +1,10 @@
+// Used by scripts.build_static to compile app/tailwind.css. Tailwind only emits the
+// classes it finds in these files, so class names must appear in full in the source.
+module.exports = {
+  content: ["./app/templates/**/*.html", "./app/static/app.js", "./app/**/*.py"],
+  darkMode: "class",
+  theme: {
+    extend: {},
+  },
+  plugins: [],
+};